@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - asyncio Wrapper
+#
+#   Runs HorusLib from asyncio code. The modem itself runs in an executor, so the event
+#   loop is never blocked by demodulation.
+#
+import asyncio
+import os
+import threading
+import unittest
+from .demod import HorusLib, Mode
+
+
+class AsyncHorusLib():
+    """
+    asyncio wrapper around HorusLib.
+
+    Demodulation is run in an executor (the event loop's default thread pool unless one is given).
+    Calls are awaited one at a time, so the modem is never used from two threads at once.
+
+    Example usage:
+
+    async with AsyncHorusLib(mode=Mode.BINARY, stereo_iq=True) as horus:
+        async for frame in horus.frames(reader):
+            print(frame.data.hex())
+    """
+
+    def __init__(self, executor=None, **kwargs):
+        """
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+            Executor to run the modem in. Defaults to the event loop's default executor.
+        **kwargs
+            Passed on to HorusLib (mode, rate, stereo_iq, sample_rate, etc.)
+        """
+        if kwargs.get("callback"):
+            raise ValueError("AsyncHorusLib doesn't support callbacks, iterate over frames() instead")
+
+        self.horus = HorusLib(**kwargs)
+        self.executor = executor
+
+        # Held while the modem is running in the executor, so concurrent awaits are run one at a time,
+        # and the modem is not closed under a call that is still running. Created in the event loop by
+        # _get_lock(), as before Python 3.10 a Lock binds to the loop that is current when it is made.
+        self._lock = None
+
+        # Read about 100 ms of audio at a time by default.
+        self.read_size = (self.horus.audio_sample_rate // 10) * 2 * (2 if self.horus.stereo_iq else 1)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *a):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Closes the modem, once any call running in the executor has finished.
+        """
+        async with self._get_lock():
+            self.horus.close()
+
+    def close(self) -> None:
+        """
+        Closes the modem. Must not be called while a demodulate_many() call is running, use aclose() from asyncio code.
+        """
+        self.horus.close()
+
+    def set_estimator_limits(self, lower: float, upper: float):
+        """ Update the modems internal frequency estimator limits """
+        self.horus.set_estimator_limits(lower, upper)
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def demodulate_many(self, demod_in) -> list:
+        """ Demodulate any amount of audio in the executor, see HorusLib.demodulate_many """
+        _loop = asyncio.get_running_loop()
+        async with self._get_lock():
+            # Shielded so that if this task is cancelled, the lock is still held until the executor
+            # has finished with the modem.
+            _future = _loop.run_in_executor(self.executor, self.horus.demodulate_many, demod_in)
+            try:
+                return await asyncio.shield(_future)
+            except asyncio.CancelledError:
+                await asyncio.wait([_future])
+                raise
+
+    async def frames(self, reader, read_size=None):
+        """
+        Demodulate a stream, yielding each frame as it is found.
+
+        reader can be an asyncio.StreamReader (e.g. from asyncio.open_connection, or connected to stdin),
+        or any object with an async read(n) method returning bytes, and b'' at the end of the stream.
+
+        Nothing more is read from the reader until the frames from the last read have been consumed,
+        so a slow consumer pushes back on the reader rather than samples queueing up in memory.
+        """
+        read_size = read_size or self.read_size
+        while True:
+            data = await reader.read(read_size)
+            if not data:
+                break
+            for frame in await self.demodulate_many(data):
+                yield frame
+
+
+async def demod_stream(reader, read_size=None, executor=None, estimator_limits=None, **kwargs):
+    """
+    Demodulate an asyncio stream, yielding frames. The modem is opened and closed around the stream.
+
+    Example usage:
+
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    async for frame in demod_stream(reader, mode=Mode.BINARY):
+        print(frame.data.hex())
+
+    Parameters
+    ----------
+    reader
+        asyncio.StreamReader, or any object with an async read(n) method
+    read_size : int
+        Bytes to read at a time, defaults to about 100 ms of audio
+    executor : concurrent.futures.Executor
+        Executor to run the modem in
+    estimator_limits : (float, float)
+        Frequency estimator limits (Hz)
+    **kwargs
+        Passed on to HorusLib
+    """
+    async with AsyncHorusLib(executor=executor, **kwargs) as horus:
+        if estimator_limits:
+            horus.set_estimator_limits(*estimator_limits)
+        async for frame in horus.frames(reader, read_size=read_size):
+            yield frame
+
+
+class AsyncHorusLibTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def test_demod_stream(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            data = f.read()
+
+        async def _run():
+            reader = asyncio.StreamReader()
+
+            async def _feed():
+                for i in range(0, len(data), 4000):
+                    reader.feed_data(data[i:i + 4000])
+                    await asyncio.sleep(0)
+                reader.feed_eof()
+
+            _feeder = asyncio.create_task(_feed())
+            _frames = [x async for x in demod_stream(reader, mode=Mode.BINARY, sample_rate=8000)]
+            await _feeder
+            return _frames
+
+        _frames = asyncio.run(_run())
+
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            _expected = horus.demodulate_many(data)
+
+        self.assertEqual(len([x for x in _frames if x.crc_pass]), 9)
+        self.assertEqual([x.data for x in _frames], [x.data for x in _expected])
+
+    def test_concurrent_and_cancel(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            data = f.read()
+
+        # Made outside the event loop, which the lock must not be bound to.
+        horus = AsyncHorusLib(mode=Mode.BINARY, sample_rate=8000)
+
+        async def _run():
+            _demodulate_many = horus.horus.demodulate_many
+            _close = horus.horus.close
+            _state = {"running": 0, "max_running": 0, "closed_while_running": False}
+            _state_lock = threading.Lock()
+
+            def _wrapped(demod_in):
+                with _state_lock:
+                    _state["running"] += 1
+                    _state["max_running"] = max(_state["max_running"], _state["running"])
+                try:
+                    return _demodulate_many(demod_in)
+                finally:
+                    with _state_lock:
+                        _state["running"] -= 1
+
+            def _wrapped_close():
+                _state["closed_while_running"] = _state["running"] > 0
+                _close()
+
+            horus.horus.demodulate_many = _wrapped
+            horus.horus.close = _wrapped_close
+
+            _quarter = len(data) // 8 * 2
+            _results = await asyncio.gather(*[horus.demodulate_many(data[i:i + _quarter]) for i in range(0, 4 * _quarter, _quarter)])
+
+            # Cancel a call while it is running in the executor, then close the modem.
+            _task = asyncio.create_task(horus.demodulate_many(data))
+            while _state["running"] == 0:
+                await asyncio.sleep(0.001)
+            _task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await _task
+            self.assertEqual(_state["running"], 0)
+            await horus.aclose()
+
+            return (_results, _state)
+
+        (_results, _state) = asyncio.run(_run())
+
+        self.assertEqual(_state["max_running"], 1)
+        self.assertFalse(_state["closed_while_running"])
+        self.assertEqual(len([x for r in _results for x in r if x.crc_pass]), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Batch Reprocessing
+#
+#   Runs a directory (or glob) of recordings through the modem and packet decoder on a
+#   process pool, writing one JSON line per decoded packet.
+#
+import argparse
+import glob
+import horusdemodlib
+import horusdemodlib.payloads
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import traceback
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from .decoder import decode_packet, parse_ukhas_string
+from .demod import HorusLib, Mode, demodulate_file, DEFAULT_FILE_WINDOW, add_modem_arguments, parse_mode
+from .inputformat import SampleReader, read_wav_header, wav_header, INPUT_FORMATS
+from .payloads import read_payload_list, read_custom_field_list
+
+# File extensions picked up when a directory is given
+RECORDING_EXTENSIONS = (".raw", ".bin", ".iq", ".wav")
+
+
+def find_recordings(paths) -> list:
+    """ Expand a list of files, directories (searched recursively) and glob patterns into a sorted list of recordings """
+    files = []
+    for _path in paths:
+        if os.path.isdir(_path):
+            for (_dir, _, _names) in os.walk(_path):
+                files.extend(os.path.join(_dir, x) for x in _names if x.lower().endswith(RECORDING_EXTENSIONS))
+        elif os.path.isfile(_path):
+            files.append(_path)
+        else:
+            _matches = [x for x in glob.glob(_path, recursive=True) if os.path.isfile(x)]
+            if not _matches:
+                logging.warning(f"No recordings found for {_path}")
+            files.extend(_matches)
+    return sorted(set(files))
+
+
+def _file_frames(filename: str, input_format: str, horus_args: dict, estimator_limits):
+    """
+    Demodulate one recording, returning (frames, sample_rate, audio seconds).
+
+    WAV files (by extension, or input_format) set their own sample rate and IQ-ness.
+    """
+    _offset = 0
+    _length = None
+    horus_args = dict(horus_args)
+
+    if input_format == "wav" or filename.lower().endswith(".wav"):
+        with open(filename, "rb") as f:
+            _info = read_wav_header(f.read)
+            _offset = f.tell()
+        if _info.channels > 2:
+            raise ValueError(f"WAV file has {_info.channels} channels, only mono or IQ (stereo) is supported")
+        horus_args["sample_rate"] = _info.sample_rate
+        horus_args["stereo_iq"] = (_info.channels == 2)
+        _length = _info.data_size
+        input_format = _info.format
+
+    _size = os.path.getsize(filename) - _offset
+    if _length is not None:
+        _size = min(_size, _length)
+    _sample_bytes = {"s16": 2, "u8": 1, "f32": 4}[input_format] * (2 if horus_args.get("stereo_iq") else 1)
+    _audio = (_size // _sample_bytes) / horus_args["sample_rate"]
+
+    frames = []
+    with HorusLib(**horus_args) as horus:
+        if estimator_limits:
+            horus.set_estimator_limits(*estimator_limits)
+
+        if input_format == "s16":
+            # Straight from the file mapping, with no copies.
+            for _window in demodulate_file(horus, filename, offset=_offset, length=_length):
+                frames.extend(_window)
+        else:
+            with open(filename, "rb") as f:
+                f.seek(_offset)
+                _reader = SampleReader(f.read, input_format)
+                _read_size = int(horus.audio_sample_rate * DEFAULT_FILE_WINDOW) * 2 * (2 if horus.stereo_iq else 1)
+                while True:
+                    data = _reader.read(_read_size)
+                    if not data:
+                        break
+                    frames.extend(horus.demodulate_many(data))
+
+        return (frames, horus.audio_sample_rate, _audio)
+
+
+def packet_record(filename: str, frame, sample_rate: int) -> dict:
+    """ Build the JSON record for a decoded packet """
+    _record = {
+        "file": filename,
+        "sample_offset": frame.sample_offset,
+        "time": round(frame.sample_offset / sample_rate, 3),
+        "snr": round(frame.snr, 2),
+        "f_est": [round(x, 1) for x in frame.f_est],
+        "ppm": round(frame.ppm, 2),
+    }
+
+    try:
+        if type(frame.data) == bytes:
+            _decoded = decode_packet(frame.data)
+            _decoded.pop("packet_format", None)
+        else:
+            _decoded = parse_ukhas_string(frame.data)
+        _record["decoded"] = _decoded
+    except Exception as e:
+        _record["raw"] = frame.data.hex().upper() if type(frame.data) == bytes else frame.data
+        _record["error"] = f"Decode failed: {e}"
+
+    return _record
+
+
+def process_file(filename: str, input_format="s16", horus_args=None, estimator_limits=None) -> dict:
+    """
+    Process pool worker. Demodulates and decodes one recording.
+
+    Returns a dict with the file name, the JSON lines for each CRC-passing packet, and the amount of
+    audio and time taken, or an error message if the file couldn't be processed.
+    """
+    _start = time.monotonic()
+    _result = {"file": filename, "lines": [], "packets": 0, "failed": 0, "audio": 0.0, "elapsed": 0.0, "error": None}
+
+    try:
+        (frames, _rate, _result["audio"]) = _file_frames(filename, input_format, horus_args or {}, estimator_limits)
+        for frame in frames:
+            if not frame.crc_pass:
+                _result["failed"] += 1
+                continue
+            _result["packets"] += 1
+            _result["lines"].append(json.dumps(packet_record(filename, frame, _rate), default=str))
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        _result["error"] = f"{type(e).__name__}: {e}"
+
+    _result["elapsed"] = time.monotonic() - _start
+    return _result
+
+
+def _init_worker(payload_list, custom_fields, log_level):
+    """ Process pool initialiser: load the payload lists once per process, from local files only """
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=log_level)
+    horusdemodlib.payloads.HORUS_PAYLOAD_LIST = read_payload_list(filename=payload_list)
+    horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = read_custom_field_list(filename=custom_fields)
+
+
+def run_batch(files, output, jobs=None, input_format="s16", horus_args=None, estimator_limits=None,
+              payload_list="payload_id_list.txt", custom_fields="custom_field_list.json") -> dict:
+    """
+    Process a list of recordings on a process pool, writing JSON lines to output (a text file object) in file order.
+
+    Logs the throughput of each file, and returns the totals.
+    """
+    _totals = {"files": 0, "errors": 0, "packets": 0, "failed": 0, "audio": 0.0, "elapsed": 0.0}
+    _start = time.monotonic()
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker,
+        initargs=(payload_list, custom_fields, logging.getLogger().getEffectiveLevel())
+    ) as executor:
+        _process = partial(process_file, input_format=input_format, horus_args=horus_args, estimator_limits=estimator_limits)
+        for _result in executor.map(_process, files):
+            _totals["files"] += 1
+            if _result["error"]:
+                _totals["errors"] += 1
+                logging.error(f"{_result['file']}: {_result['error']}")
+                continue
+
+            for _line in _result["lines"]:
+                output.write(_line + "\n")
+            output.flush()
+
+            for _key in ("packets", "failed", "audio"):
+                _totals[_key] += _result[_key]
+            logging.info(
+                f"{_result['file']}: {_result['packets']} packets ({_result['failed']} failed CRC), "
+                f"{_result['audio']:.1f} s of audio in {_result['elapsed']:.2f} s ({_result['audio'] / max(_result['elapsed'], 1e-9):.1f}x realtime)"
+            )
+
+    _totals["elapsed"] = time.monotonic() - _start
+    logging.info(
+        f"Total: {_totals['files']} files ({_totals['errors']} errors), {_totals['packets']} packets ({_totals['failed']} failed CRC), "
+        f"{_totals['audio']:.1f} s of audio in {_totals['elapsed']:.2f} s ({_totals['audio'] / max(_totals['elapsed'], 1e-9):.1f}x realtime)"
+    )
+    return _totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='horus_batch',
+                    description='Demodulate and decode a batch of recordings, writing one JSON line per packet')
+
+    parser.add_argument("inputs", nargs="+", help="Recordings, directories of recordings, or glob patterns")
+    parser.add_argument("-o", "--output", type=str, default="-", help="Write JSON lines to this file. Default: stdout")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of processes. Default: number of CPUs")
+    add_modem_arguments(parser)
+    parser.add_argument("--input-format", choices=INPUT_FORMATS, default="s16", help="Format of the recordings. Files ending .wav are always read as WAV. Default: s16")
+    parser.add_argument("--payload-list", type=str, default="payload_id_list.txt", help="Payload ID list to decode with (not downloaded)")
+    parser.add_argument("--custom-fields", type=str, default="custom_field_list.json", help="Custom field list to decode with (not downloaded)")
+    parser.add_argument('-v', action="store_true",default=False,help="verbose debug info")
+    args = parser.parse_args()
+
+    mode = parse_mode(args.mode)
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=(logging.DEBUG if args.v else logging.INFO))
+    logging.info(f"horusdemodlib v{horusdemodlib.__version__} - horus_batch")
+
+    files = find_recordings(args.inputs)
+    if not files:
+        logging.critical("No recordings found.")
+        sys.exit(1)
+    logging.info(f"Processing {len(files)} recordings on {args.jobs or os.cpu_count()} processes.")
+
+    _limits = None
+    if args.fsk_lower > -99999 and args.fsk_upper > args.fsk_lower:
+        _limits = (args.fsk_lower, args.fsk_upper)
+
+    _horus_args = {"mode": mode, "rate": args.rate, "tone_spacing": args.tonespacing, "stereo_iq": args.q, "sample_rate": args.sample_rate, "native_rate": args.native_rate}
+
+    _output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        _totals = run_batch(
+            files, _output, jobs=args.jobs, input_format=args.input_format, horus_args=_horus_args,
+            estimator_limits=_limits, payload_list=args.payload_list, custom_fields=args.custom_fields
+        )
+    finally:
+        if _output is not sys.stdout:
+            _output.close()
+
+    if _totals["errors"]:
+        sys.exit(1)
+
+
+class BatchTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def test_batch(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            data = f.read()
+
+        with tempfile.TemporaryDirectory() as _dir:
+            os.mkdir(os.path.join(_dir, "flight2"))
+            with open(os.path.join(_dir, "flight1.raw"), "wb") as f:
+                f.write(data)
+            with open(os.path.join(_dir, "flight2", "capture.wav"), "wb") as f:
+                f.write(wav_header("s16", 1, 8000, len(data)) + data)
+            with open(os.path.join(_dir, "notes.txt"), "w") as f:
+                f.write("not a recording")
+            with open(os.path.join(_dir, "broken.wav"), "wb") as f:
+                f.write(b"RIFX")
+
+            files = find_recordings([_dir])
+            self.assertEqual([os.path.relpath(x, _dir) for x in files], ["broken.wav", "flight1.raw", os.path.join("flight2", "capture.wav")])
+
+            with tempfile.TemporaryFile("w+") as _output:
+                _totals = run_batch(files, _output, jobs=2, horus_args={"mode": Mode.BINARY, "sample_rate": 8000})
+                _output.seek(0)
+                _records = [json.loads(x) for x in _output]
+
+        self.assertEqual((_totals["files"], _totals["errors"], _totals["packets"]), (3, 1, 18))
+        self.assertEqual([x["file"] for x in _records], [files[1]] * 9 + [files[2]] * 9)
+        self.assertEqual([x["sample_offset"] for x in _records[:9]], [x["sample_offset"] for x in _records[9:]])
+        self.assertEqual(_records[0]["decoded"]["payload_id"], "4FSKTEST-V2")
+        self.assertEqual(_records[0]["decoded"]["sequence_number"], 0)
+        self.assertTrue(all(x["decoded"]["crc_ok"] for x in _records))
+
+
+if __name__ == "__main__":
+    main()
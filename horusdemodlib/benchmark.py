@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Demodulator Benchmark
+#
+#   Runs every modem mode over the recordings in samples/, at their own and other
+#   sample rates, and reports throughput, per-block latency and peak memory use.
+#   Results can be written as JSON, and compared against an earlier run, to check
+#   the effect of a change. Everything runs in-process, with no external programs.
+#
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from . import __version__
+from .demod import HorusLib, Mode, TIMING_STAGES
+from .inputformat import SampleReader
+from .resampler import Resampler
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, so no peak memory figures there.
+    resource = None
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+# Recordings in samples/, and the mode to demodulate each with. Raw files are signed 16-bit, at the given
+# sample_rate, WAV files carry their own. There's no 7N2 RTTY recording, so the 7N2 modem is run over the
+# 7N1 one, which still measures its throughput, but decodes nothing.
+CASES = [
+    {"name": "binary_v1", "file": "horus_binary_ebno_4.5db.wav", "mode": Mode.BINARY, "horus_args": {}},
+    {"name": "binary_v2", "file": "horus_v2_100bd.raw", "mode": Mode.BINARY, "horus_args": {"sample_rate": 8000}},
+    {"name": "binary_v3", "file": "horus_v3_100bd_8000_s16.raw", "mode": Mode.BINARY, "horus_args": {"sample_rate": 8000}},
+    {"name": "binary_iq", "file": "horusb_iq_s16.raw", "mode": Mode.BINARY, "horus_args": {"sample_rate": 48000, "stereo_iq": True}, "estimator_limits": (1000, 20000)},
+    {"name": "rtty_7n1", "file": "rtty_7n1.wav", "mode": Mode.RTTY_7N1, "horus_args": {}},
+    {"name": "rtty_7n2", "file": "rtty_7n1.wav", "mode": Mode.RTTY_7N2, "horus_args": {}},
+    {"name": "rtty_8n2", "file": "rtty_8n2.wav", "mode": Mode.RTTY_8N2, "horus_args": {"rate": 300}},
+]
+
+# Other sample rates each recording is resampled to (before timing starts) and run at.
+DEFAULT_SAMPLE_RATES = [48000]
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+def load_samples(case: dict, samples_dir=SAMPLES_DIR):
+    """ Load a case's recording, returning (signed 16-bit samples, sample rate, channels) """
+    _filename = os.path.join(samples_dir, case["file"])
+    _channels = 2 if case["horus_args"].get("stereo_iq") else 1
+
+    with open(_filename, "rb") as f:
+        if _filename.endswith(".wav"):
+            _reader = SampleReader(f.read, "wav")
+            _data = bytearray()
+            while True:
+                _block = _reader.read(1 << 20)
+                if not _block:
+                    break
+                _data.extend(_block)
+            return (bytes(_data), _reader.sample_rate, _reader.channels)
+
+        return (f.read(), case["horus_args"]["sample_rate"], _channels)
+
+
+def percentile(values: list, p: float) -> float:
+    """ Nearest-rank percentile of a sorted list """
+    if not values:
+        return 0.0
+    return values[min(max(math.ceil(p / 100 * len(values)) - 1, 0), len(values) - 1)]
+
+
+def _throughput(nsamples: int, sample_rate: int, elapsed: float, packets: int) -> dict:
+    return {
+        "seconds": elapsed,
+        "samples_per_second": nsamples / elapsed if elapsed > 0 else 0.0,
+        "realtime": nsamples / sample_rate / elapsed if elapsed > 0 else 0.0,
+        "packets": packets,
+    }
+
+
+def _open_modem(case: dict, sample_rate: int, callback=None) -> HorusLib:
+    _args = dict(case["horus_args"], sample_rate=sample_rate)
+    horus = HorusLib(mode=case["mode"], callback=callback, **_args)
+    if case.get("estimator_limits"):
+        horus.set_estimator_limits(*case["estimator_limits"])
+    return horus
+
+
+def run_case(case: dict, sample_rate=None, repeat=1, samples_dir=SAMPLES_DIR, timing=False) -> dict:
+    """
+    Benchmark one case, at sample_rate (the recording's own rate if None).
+
+    The recording (repeated repeat times) is demodulated twice, by fresh modems:
+
+    * block - streamed through add_samples() one modem block at a time, as horus_demod does, timing each call
+    * batch - all in one go with demodulate_many(), as the mmap, parallel and batch modes do
+
+    With timing, the modem's per-stage timing counters are turned on for the batch run.
+
+    Returns a dict of results, which is JSON serialisable.
+    """
+    (data, _rate, _channels) = load_samples(case, samples_dir)
+    if sample_rate and sample_rate != _rate:
+        data = bytes(Resampler(_rate, sample_rate, channels=_channels).process(data))
+        _rate = sample_rate
+    data = data * repeat
+    _frame_bytes = 2 * _channels
+    _nsamples = len(data) // _frame_bytes
+
+    result = {
+        "name": case["name"],
+        "file": case["file"],
+        "mode": case["mode"].name,
+        "sample_rate": _rate,
+        "channels": _channels,
+        "audio_seconds": _nsamples / _rate,
+    }
+
+    # Streaming, one block at a time
+    _packets = []
+    with _open_modem(case, _rate, callback=lambda x: _packets.append(x) if x.crc_pass else None) as horus:
+        result["modem_sample_rate"] = horus.modem_sample_rate
+        _view = memoryview(data)
+        _latencies = []
+        _position = 0
+        _start = time.perf_counter()
+        while _position < len(data):
+            # Enough input for the modem's next block, at the input sample rate.
+            _size = horus.audio_nin * _frame_bytes
+            _block = _view[_position:_position + _size]
+            _t = time.perf_counter()
+            horus.add_samples(_block)
+            _latencies.append(time.perf_counter() - _t)
+            _position += _size
+        _elapsed = time.perf_counter() - _start
+
+    _latencies.sort()
+    result["block"] = _throughput(_nsamples, _rate, _elapsed, len(_packets))
+    result["block"]["blocks"] = len(_latencies)
+    result["block"]["latency_us"] = dict(
+        [(f"p{p}", percentile(_latencies, p) * 1e6) for p in LATENCY_PERCENTILES] +
+        [("max", _latencies[-1] * 1e6 if _latencies else 0.0), ("mean", sum(_latencies) / max(len(_latencies), 1) * 1e6)]
+    )
+
+    # Everything at once
+    with _open_modem(case, _rate) as horus:
+        horus.enable_timing(timing)
+        _start = time.perf_counter()
+        _frames = horus.demodulate_many(data)
+        _elapsed = time.perf_counter() - _start
+        if timing:
+            result["timing"] = dict((_stage, {"seconds": x[0], "calls": x[1]}) for (_stage, x) in horus.get_timing().items())
+    result["batch"] = _throughput(_nsamples, _rate, _elapsed, len([x for x in _frames if x.crc_pass]))
+
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+
+def peak_rss_kb():
+    """ Peak resident set size of this process (kB), or None where it isn't available """
+    if resource is None:
+        return None
+    _maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS reports bytes.
+    return _maxrss // 1024 if sys.platform == "darwin" else _maxrss
+
+
+def run_benchmark(cases=CASES, sample_rates=DEFAULT_SAMPLE_RATES, repeat=1, isolate=True, samples_dir=SAMPLES_DIR, timing=False) -> list:
+    """
+    Run each case at its own sample rate, and each of sample_rates.
+
+    With isolate, each run is done in a fresh process, so peak memory is per run, and one run's caches
+    and heap don't affect the next.
+    """
+    results = []
+    for case in cases:
+        for _rate in [None] + list(sample_rates):
+            try:
+                if isolate:
+                    # Spawned, rather than forked, so the process starts without our memory.
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                        _result = executor.submit(run_case, case, _rate, repeat, samples_dir, timing).result()
+                else:
+                    _result = run_case(case, _rate, repeat, samples_dir, timing)
+            except Exception as e:
+                logging.error(f"{case['name']} at {_rate or 'native'} Hz failed: {e}")
+                continue
+
+            # Skip extra rates which are the recording's own rate.
+            if _rate is not None and any(x["name"] == _result["name"] and x["sample_rate"] == _result["sample_rate"] for x in results):
+                continue
+            logging.info(f"{_result['name']} {_result['sample_rate']} Hz: {_result['block']['realtime']:.1f}x realtime")
+            results.append(_result)
+    return results
+
+
+def format_results(results: list, baseline=None) -> str:
+    """ Format results as a table. If baseline results are given, include the speed relative to them. """
+    _baseline = {}
+    for x in (baseline or []):
+        _baseline[(x["name"], x["sample_rate"])] = x
+
+    _header = f"{'case':<10} {'rate':>6} {'modem':>6} {'audio s':>8} {'Msamp/s':>8} {'x rt':>7} {'batch x rt':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'pkts':>5} {'RSS MB':>7}"
+    if baseline is not None:
+        _header += f" {'vs base':>8}"
+    _lines = [_header]
+
+    for x in results:
+        _rss = f"{x['peak_rss_kb'] / 1024:.1f}" if x.get("peak_rss_kb") else "-"
+        _line = (
+            f"{x['name']:<10} {x['sample_rate']:>6} {x['modem_sample_rate']:>6} {x['audio_seconds']:>8.1f} "
+            f"{x['block']['samples_per_second'] / 1e6:>8.3f} {x['block']['realtime']:>7.1f} {x['batch']['realtime']:>10.1f} "
+            f"{x['block']['latency_us']['p50']:>8.0f} {x['block']['latency_us']['p99']:>8.0f} {x['block']['latency_us']['max']:>8.0f} "
+            f"{x['block']['packets']:>5} {_rss:>7}"
+        )
+        if baseline is not None:
+            _base = _baseline.get((x["name"], x["sample_rate"]))
+            _line += f" {x['block']['realtime'] / _base['block']['realtime']:>7.2f}x" if _base else f" {'-':>8}"
+        _lines.append(_line)
+
+    return "\n".join(_lines)
+
+
+def format_timing(results: list) -> str:
+    """ Format the per-stage modem timing of results run with timing, as a percentage of horus_rx() time per stage """
+    _stages = TIMING_STAGES[:-1]
+    _lines = [f"{'case':<10} {'rate':>6} " + " ".join(f"{x:>9}" for x in _stages) + f" {'other':>9} {'rx us':>8}"]
+    for x in results:
+        if "timing" not in x:
+            continue
+        _timing = x["timing"]
+        _rx = _timing["rx"]["seconds"] or 1.0
+        _percent = [100 * _timing[_stage]["seconds"] / _rx for _stage in _stages]
+        _lines.append(
+            f"{x['name']:<10} {x['sample_rate']:>6} " + " ".join(f"{p:>8.1f}%" for p in _percent) +
+            f" {100 - sum(_percent):>8.1f}% {_timing['rx']['seconds'] / max(_timing['rx']['calls'], 1) * 1e6:>8.0f}"
+        )
+    return "\n".join(_lines)
+
+
+def _git_commit(path: str):
+    """ Commit the source tree is at, read straight from .git so git doesn't need to be installed """
+    _git = os.path.join(path, ".git")
+    try:
+        with open(os.path.join(_git, "HEAD")) as f:
+            _head = f.read().strip()
+        if not _head.startswith("ref: "):
+            return _head
+        _ref = _head[5:]
+        _ref_file = os.path.join(_git, _ref)
+        if os.path.exists(_ref_file):
+            with open(_ref_file) as f:
+                return f.read().strip()
+        with open(os.path.join(_git, "packed-refs")) as f:
+            for _line in f:
+                if _line.strip().endswith(" " + _ref):
+                    return _line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the demodulator over the bundled sample recordings", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--samples", type=str, default=SAMPLES_DIR, help="Directory of sample recordings")
+    parser.add_argument("--cases", type=str, default=None, help="Comma separated list of cases to run, out of " + ",".join(x["name"] for x in CASES))
+    parser.add_argument("--sample-rates", type=str, default=",".join(str(x) for x in DEFAULT_SAMPLE_RATES), help="Comma separated list of other sample rates to run each recording at, as well as its own. Empty for none.")
+    parser.add_argument("--repeat", type=int, default=1, help="Demodulate each recording this many times over, for steadier figures")
+    parser.add_argument("--no-isolate", action="store_true", default=False, help="Run everything in this process, rather than a new one for each run. Peak memory is then the peak so far.")
+    parser.add_argument("--timing", action="store_true", default=False, help="Also report where the modem spends its time, from its per-stage timing counters")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, default=None, help="JSON results of an earlier run, to compare realtime factors against")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Verbose output")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=(logging.DEBUG if args.verbose else logging.INFO))
+
+    cases = CASES
+    if args.cases:
+        _names = args.cases.split(",")
+        _unknown = set(_names) - set(x["name"] for x in CASES)
+        if _unknown:
+            parser.error(f"Unknown cases: {', '.join(sorted(_unknown))}")
+        cases = [x for x in CASES if x["name"] in _names]
+
+    _rates = [int(x) for x in args.sample_rates.split(",") if x.strip()]
+
+    results = run_benchmark(cases, _rates, repeat=args.repeat, isolate=not args.no_isolate, samples_dir=args.samples, timing=args.timing)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    print(format_results(results, baseline))
+    if args.timing:
+        print()
+        print(format_timing(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "version": __version__,
+                "commit": _git_commit(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "machine": platform.machine(),
+                "cpu_count": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+        logging.info(f"Results written to {args.json}")
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_percentile(self):
+        _values = list(range(1, 101))
+        self.assertEqual([percentile(_values, p) for p in (0, 50, 99, 100)], [1, 50, 99, 100])
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_run_case(self):
+        _case = [x for x in CASES if x["name"] == "binary_v2"][0]
+        _result = run_case(_case)
+        self.assertEqual((_result["sample_rate"], _result["modem_sample_rate"]), (8000, 48000))
+        self.assertAlmostEqual(_result["audio_seconds"], 26.0)
+        self.assertEqual(_result["block"]["packets"], 4)
+        self.assertEqual(_result["batch"]["packets"], 4)
+        self.assertGreater(_result["block"]["realtime"], 1.0)
+        self.assertLessEqual(_result["block"]["latency_us"]["p50"], _result["block"]["latency_us"]["max"])
+        # Results should be able to go straight into the JSON output.
+        json.dumps(_result)
+
+        self.assertNotIn("timing", _result)
+
+        _resampled = run_case(_case, sample_rate=48000, timing=True)
+        self.assertEqual(set(_resampled["timing"]), set(TIMING_STAGES))
+        self.assertGreater(_resampled["timing"]["rx"]["calls"], 0)
+        self.assertEqual(_resampled["modem_sample_rate"], 48000)
+        self.assertGreaterEqual(_resampled["block"]["packets"], 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Channelizer
+#
+#   Splits a wideband IQ stream into narrow, decimated IQ channels, so each
+#   modem can run at a much lower sample rate than the SDR.
+#   The mixing and filtering is done in C (src/ddc.c).
+#
+import _horus_api_cffi
+import cmath
+import math
+import unittest
+from array import array
+from .resampler import design_filter, DEFAULT_ZERO_CROSSINGS
+
+horus_api = _horus_api_cffi.lib
+ffi = _horus_api_cffi.ffi
+
+
+class Channelizer():
+    """
+    Bank of digital down converters over one wideband IQ stream.
+
+    Each channel is shifted so its centre frequency sits at 0 Hz, low pass filtered, and
+    decimated to output_rate. Input and output are interleaved signed 16-bit IQ samples.
+    Channels are independent, so process_channel() can be called for different channels
+    from different threads.
+
+    Example usage:
+
+    channelizer = Channelizer(192000, 12000, centres=[-17500, -12500, 2500])
+    while True:
+        data = f.read(76800)
+        if not data:
+            break
+        for (channel, samples) in enumerate(channelizer.process(data)):
+            modems[channel].demodulate_many(samples)
+    """
+
+    def __init__(self, sample_rate: int, output_rate: int, centres, zero_crossings=DEFAULT_ZERO_CROSSINGS):
+        """
+        Parameters
+        ----------
+        sample_rate : int
+            Input sample rate (Hz)
+        output_rate : int
+            Channel sample rate (Hz). Must divide sample_rate exactly.
+        centres : list of float
+            Centre frequency of each channel (Hz), relative to the centre of the input.
+        zero_crossings : int
+            Channel filter half-length. Larger values give a sharper filter at the cost of CPU.
+        """
+        if output_rate <= 0 or sample_rate <= 0 or (sample_rate % output_rate) != 0:
+            raise ValueError(f"Channel sample rate {output_rate} Hz must divide the input sample rate {sample_rate} Hz")
+
+        for _centre in centres:
+            if abs(_centre) >= sample_rate / 2:
+                raise ValueError(f"Channel centre {_centre} Hz is outside the input bandwidth")
+
+        self.sample_rate = sample_rate
+        self.output_rate = output_rate
+        self.decimation = sample_rate // output_rate
+        self.centres = list(centres)
+
+        _taps = design_filter(1, self.decimation, zero_crossings)
+        _taps_c = ffi.new("float[]", _taps)
+        self._ddcs = [
+            ffi.gc(horus_api.ddc_create(sample_rate, self.decimation, _centre, _taps_c, len(_taps)), horus_api.ddc_destroy)
+            for _centre in self.centres
+        ]
+        self._out = [ffi.new("short[]", 0) for _ in self.centres]
+
+    def __len__(self):
+        return len(self._ddcs)
+
+    def reset(self) -> None:
+        """ Clear the filter history and mixer phase of every channel """
+        for _ddc in self._ddcs:
+            horus_api.ddc_reset(_ddc)
+
+    def process_channel(self, channel: int, data) -> memoryview:
+        """
+        Down convert a buffer of interleaved signed 16-bit IQ samples (any bytes-like object) for one channel.
+
+        Returns a view of the channel's IQ samples, which is only valid until the next call for that channel.
+        """
+        _ddc = self._ddcs[channel]
+        data_in = ffi.from_buffer("short[]", data)
+        _nin = len(data_in) // 2
+        _max_out = horus_api.ddc_max_out(_ddc, _nin) * 2
+        if len(self._out[channel]) < _max_out:
+            self._out[channel] = ffi.new("short[]", _max_out)
+
+        _nout = horus_api.ddc_process_s16(_ddc, self._out[channel], data_in, _nin)
+        return memoryview(ffi.buffer(self._out[channel], _nout * 4))
+
+    def process(self, data) -> list:
+        """ Down convert a buffer of IQ samples for every channel, returning a list of views as for process_channel() """
+        return [self.process_channel(i, data) for i in range(len(self._ddcs))]
+
+
+class ChannelizerTests(unittest.TestCase):
+    def test_tones(self):
+        # Two tones at 48 kHz, each should come out of its own channel at 8 kHz as a 500 Hz tone,
+        # with the other tone filtered out.
+        _input = array("h")
+        for n in range(48000):
+            _sample = 8000 * cmath.exp(2j * math.pi * 5500 * n / 48000) + 8000 * cmath.exp(-2j * math.pi * 6500 * n / 48000)
+            _input.extend((int(_sample.real), int(_sample.imag)))
+
+        _channelizer = Channelizer(48000, 8000, centres=[5000, -7000])
+        _outputs = [array("h"), array("h")]
+        for i in range(0, len(_input), 4802):
+            for (_channel, _samples) in enumerate(_channelizer.process(_input[i:i + 4802])):
+                _outputs[_channel].extend(array("h", bytes(_samples)))
+
+        for _output in _outputs:
+            self.assertLessEqual(abs(len(_output) // 2 - 8000), 1)
+            _iq = [complex(_output[2 * n], _output[2 * n + 1]) for n in range(1000, 7000)]
+            self.assertTrue(all(abs(abs(x) - 8000) < 100 for x in _iq))
+
+            # Phase advances by 500 Hz per sample
+            _step = cmath.exp(2j * math.pi * 500 / 8000)
+            self.assertTrue(all(abs(_iq[n + 1] - _iq[n] * _step) < 100 for n in range(len(_iq) - 1)))
+
+    def test_invalid_rates(self):
+        with self.assertRaises(ValueError):
+            Channelizer(48000, 7000, centres=[0])
+        with self.assertRaises(ValueError):
+            Channelizer(48000, 8000, centres=[30000])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,19 +4,53 @@
 #
 
 import _horus_api_cffi
-import audioop
+import contextlib
 import logging
+import math
+import mmap
 import sys
+import time
 from enum import Enum
 import os
 import logging
+import struct
 from .decoder import decode_packet, hex_to_bytes
+from .ringbuffer import SampleRingBuffer
+from .resampler import Resampler, DEFAULT_ROLLOFF
+from .channelizer import Channelizer
+from .udpinput import UDPSampleSource
+from .rtltcp import RTLTCPSource, RTLSDR_SAMPLE_RATE_RANGES, rtlsdr_sample_rate_supported
+from .inputformat import SampleReader, INPUT_FORMATS, read_wav_header
 import horusdemodlib
 import argparse
 import sys
 import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from array import array
 
 horus_api = _horus_api_cffi.lib
+ffi = _horus_api_cffi.ffi
+
+# Seconds of audio demodulate_file() passes to the modem at a time
+DEFAULT_FILE_WINDOW = 10.0
+
+# horus_demod --stats output formats: the full JSON stats line, JSON without the eye diagram
+# and spectrum, or fixed size binary records (see STATS_RECORD).
+STATS_FORMATS = ["json", "compact", "binary"]
+
+# Binary stats record (little-endian): magic, layout version, mfsk, channel (-1 if not channelised),
+# modem block count, then SNR (dB), clock offset (ppm), frequency offset (Hz), timing offset (samples),
+# and four tone frequency estimates (Hz), unused tones being zero.
+STATS_RECORD = struct.Struct("<2sBBb3xIffff4f")
+STATS_RECORD_MAGIC = b"HS"
+STATS_RECORD_VERSION = 1
+
+# Names of the modem stages timed by HorusLib.get_timing(), in HORUS_TIMING_* order.
+# "rx" is the whole of each horus_rx() call.
+TIMING_STAGES = ["freq_est", "demod", "find_uw", "extract", "rx"]
 
 
 
@@ -37,27 +71,96 @@ class Frame():
     """
     Frame class used for demodulation attempts. 
 
+    Frames are small immutable records holding only plain Python values, so they are cheap to keep
+    around in large numbers.
+
     Attributes
     ----------
 
     data : bytes
-        Demodulated data output. Empty if demodulation didn't succeed
+        Demodulated data output (str for RTTY modes). Empty if demodulation didn't succeed
     sync : bool
-        Modem sync status
+        True if the modem found a packet in this block
     snr : float
         Estimated SNR
     crc_pass : bool
         CRC check status
-    extended_stats
-        Extended modem stats. These are provided as c_types so will need to be cast prior to use. See MODEM_STATS for structure details
+    extended_stats : StatsSnapshot
+        Detailed modem statistics (including the eye diagram) for frames with data, only set if
+        HorusLib was opened with frame_detail=True. None otherwise.
+    sample_offset : int
+        Input sample index of the start of the packet (its unique word), counted from the first sample
+        passed to the modem. Only as accurate as the modem's symbol timing.
+    f_est : tuple of float
+        Estimated tone frequencies (Hz)
+    ppm : float
+        Estimated tx/rx sample clock offset (ppm)
+    """
+
+    __slots__ = ("data", "sync", "snr", "crc_pass", "extended_stats", "sample_offset", "f_est", "ppm")
+
+    def __init__(self, data: bytes, sync: bool, crc_pass: bool, snr: float, extended_stats=None, sample_offset=None, f_est=(), ppm=0.0):
+        _set = object.__setattr__
+        _set(self, "data", data)
+        _set(self, "sync", sync)
+        _set(self, "snr", snr)
+        _set(self, "crc_pass", crc_pass)
+        _set(self, "extended_stats", extended_stats)
+        _set(self, "sample_offset", sample_offset)
+        _set(self, "f_est", f_est)
+        _set(self, "ppm", ppm)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Frame is immutable, can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Frame is immutable, can't delete {name}")
+
+    def __reduce__(self):
+        # Pickle through the constructor, as __setattr__ is blocked.
+        return (Frame, (self.data, self.sync, self.crc_pass, self.snr, self.extended_stats, self.sample_offset, self.f_est, self.ppm))
+
+    def __repr__(self):
+        return f"Frame(data={self.data!r}, sync={self.sync}, crc_pass={self.crc_pass}, snr={self.snr:.1f}, sample_offset={self.sample_offset})"
+
+
+class StatsSnapshot():
+    """
+    Modem statistics captured after a block of samples was demodulated.
+
+    Everything is a plain Python value, so a snapshot stays valid after the modem moves on.
+    The eye diagram and spectrum are only copied out of the modem if they were asked for
+    (see HorusLib.get_stats), otherwise they are None.
+
+    Attributes
+    ----------
+
+    snr : float
+        Estimated SNR (dB, in 3 kHz bandwidth)
+    ppm : float
+        Estimated tx/rx sample clock offset (ppm)
+    foff : float
+        Estimated frequency offset (Hz)
+    rx_timing : float
+        Estimated timing offset (samples)
+    f_est : tuple of float
+        Estimated tone frequencies (Hz), one per tone
+    eye_diagram : list of lists of float
+        Eye diagram traces, or None
+    fft : list of float
+        Averaged magnitude spectrum of the modem input, from -Fs/2 to Fs/2, or None
     """
 
-    def __init__(self, data: bytes, sync: bool, crc_pass: bool, snr: float, extended_stats):
-        self.data = data
-        self.sync = sync
+    __slots__ = ("snr", "ppm", "foff", "rx_timing", "f_est", "eye_diagram", "fft")
+
+    def __init__(self, snr: float, ppm: float, foff: float, rx_timing: float, f_est: tuple, eye_diagram=None, fft=None):
         self.snr = snr
-        self.crc_pass = crc_pass
-        self.extended_stats = extended_stats
+        self.ppm = ppm
+        self.foff = foff
+        self.rx_timing = rx_timing
+        self.f_est = f_est
+        self.eye_diagram = eye_diagram
+        self.fft = fft
 
 
 class HorusLib():
@@ -77,10 +180,19 @@ class HorusLib():
                 if output.crc_pass and output.data:
                     print(f'{output.data.hex()} SNR: {output.snr}')
                     for x in range(horus.mfsk):
-                        print(f'F{str(x)}: {float(output.extended_stats.f_est[x])}')
+                        print(f'F{str(x)}: {output.f_est[x]}')
 
     """
 
+    # Number of packets returned from each call to horus_rx_batch
+    MAX_BATCH_PACKETS = 16
+
+    # Modem sample rate used unless native_rate is set and the input sample rate can be used directly
+    DEFAULT_MODEM_SAMPLE_RATE = 48000
+
+    # Oversampling rate for the modem timing estimator (FSK_DEFAULT_P in fsk.h)
+    MODEM_P = 8
+
     def __init__(
         self,
         libpath=f"",
@@ -90,7 +202,10 @@ class HorusLib():
         stereo_iq=False,
         verbose=False,
         callback=None,
-        sample_rate=48000
+        sample_rate=48000,
+        modem_sample_rate=None,
+        frame_detail=False,
+        native_rate=False
     ):
         """
         Parameters
@@ -111,6 +226,15 @@ class HorusLib():
             When set you can use add_samples to add any number of audio frames and callback will be called when a demodulated frame is avaliable.
         sample_rate : int
             The input sample rate of the audio input
+        modem_sample_rate : int
+            Sample rate to run the modem at. Defaults to 48 kHz, with the input resampled to it if needed.
+        native_rate : bool
+            Run the modem at the input sample_rate if it can (sample_rate must be a multiple of 8x the baud rate),
+            avoiding any resampling. Off by default: on weak signals the modem doesn't always decode the same
+            packets at a low native rate (e.g. 8 kHz) as at 48 kHz, and can lose packets the 48 kHz modem decodes.
+        frame_detail : bool
+            Attach a StatsSnapshot with the eye diagram to frames which have data, as Frame.extended_stats.
+            Only supported by demodulate() and add_samples().
         """
 
         if type(mode) != type(Mode(0)):
@@ -122,13 +246,39 @@ class HorusLib():
 
         self.callback = callback
 
-        self.input_buffer = bytearray(b"")
+        self.frame_detail = frame_detail
+
+        self._ascii_output = self.mode in (Mode.RTTY_7N1, Mode.RTTY_7N2, Mode.RTTY_8N2)
+
+        # Work out what sample rate the modem can run at.
+        if rate > 0:
+            _baud = rate
+        elif self._ascii_output:
+            _baud = horus_api.HORUS_RTTY_DEFAULT_BAUD
+        else:
+            _baud = horus_api.HORUS_BINARY_V1_DEFAULT_BAUD
+
+        if modem_sample_rate is None:
+            if native_rate and self.native_rate_supported(sample_rate, _baud):
+                modem_sample_rate = sample_rate
+            else:
+                modem_sample_rate = self.DEFAULT_MODEM_SAMPLE_RATE
+
+        # The modem asserts on invalid rates, so check them here instead.
+        if not self.native_rate_supported(modem_sample_rate, _baud):
+            raise ValueError(f"Modem sample rate {modem_sample_rate} Hz must be a multiple of {self.MODEM_P}x the baud rate ({_baud} baud)")
 
-        
+        self.audio_sample_rate = sample_rate
+        self.modem_sample_rate = modem_sample_rate
+
+        if self.audio_sample_rate != self.modem_sample_rate:
+            self.resampler = Resampler(self.audio_sample_rate, self.modem_sample_rate, channels=(2 if self.stereo_iq else 1))
+        else:
+            self.resampler = None
 
         # try to open the modem and set the verbosity
-        self.hstates = horus_api.horus_open_advanced(
-            self.mode.value, rate, tone_spacing
+        self.hstates = horus_api.horus_open_advanced_sample_rate(
+            self.mode.value, rate, tone_spacing, self.modem_sample_rate, self.MODEM_P
         )
         horus_api.horus_set_verbose(self.hstates, int(verbose))
 
@@ -141,15 +291,44 @@ class HorusLib():
 
         # build some class types to fit the data for demodulation using ctypes
         self.max_demod_in = horus_api.horus_get_max_demod_in(self.hstates)
-        self.max_ascii_out = horus_api.horus_get_max_ascii_out_len(self.hstates)
+        self.max_payload = horus_api.horus_get_max_payload_len(self.hstates)
+
+        # Buffers owned by this object and re-used on every call to demodulate()
+        # max_demod_in is in bytes, and we need twice as many shorts for IQ input.
+        self._demod_in = ffi.new("short[]", (self.max_demod_in // 2) * (2 if self.stereo_iq else 1))
+        self._stats = ffi.new("struct horus_stats *")
+
+        # Stats snapshot cache for get_stats(). _blocks counts calls to horus_rx, so the modem
+        # stats are only copied out at most once per block, and only if someone asks for them.
+        self._blocks = 0
+        self._snapshot = None
+        self._snapshot_block = -1
+        self._eye = ffi.new("float[]", horus_api.MODEM_STATS_ET_MAX * horus_api.MODEM_STATS_EYE_IND_MAX)
+        self._fft = None
+        self._timing = ffi.new("struct horus_timing *")
 
+        # Packets from horus_rx_packets and horus_rx_batch, and state for demodulate_many()
+        self._packets = ffi.new("struct horus_packet[]", self.MAX_BATCH_PACKETS)
+        self._nconsumed = ffi.new("uint32_t *")
+        self._nblocks = ffi.new("uint32_t *")
+        self._batch_leftover = bytearray()
 
         self.mfsk = horus_api.horus_get_mFSK(self.hstates)
 
-        self.resampler_state = None
-        self.audio_sample_rate = sample_rate
-        self.modem_sample_rate = 48000
+        # Longest time a packet can take to arrive. The modem can't report a packet until this long after it started.
+        self.bit_rate = _baud * math.log2(self.mfsk)
+        self.max_packet_seconds = horus_api.horus_get_max_packet_len(self.hstates) / self.bit_rate
+
+        # Input sample queue for add_samples(), at the modem sample rate. This needs to hold at least
+        # the largest block of samples that the modem can ask for.
+        _max_block = self.max_demod_in * (2 if self.stereo_iq else 1)
+        self.input_buffer = SampleRingBuffer(capacity=_max_block * 8, max_read=_max_block)
+
 
+    @classmethod
+    def native_rate_supported(cls, sample_rate: int, baud_rate: int) -> bool:
+        """ Check if the modem can run directly at sample_rate for a given baud rate """
+        return sample_rate > 0 and (sample_rate % baud_rate) == 0 and ((sample_rate // baud_rate) % cls.MODEM_P) == 0
 
     # in case someone wanted to use `with` style. I'm not sure if closing the modem does a lot.
     def __enter__(self):
@@ -162,6 +341,16 @@ class HorusLib():
     def nin(self):
         return horus_api.horus_nin(self.hstates)
 
+    @property
+    def audio_nin(self) -> int:
+        """ Number of input samples (at the input sample rate) needed for the modem's next block """
+        return math.ceil(self.nin * self.audio_sample_rate / self.modem_sample_rate)
+
+    @property
+    def blocks(self) -> int:
+        """ Number of modem blocks demodulated so far, by any of the demodulate functions and add_samples() """
+        return self._blocks
+
     def close(self) -> None:
         """
         Closes Horus modem.
@@ -169,63 +358,154 @@ class HorusLib():
         horus_api.horus_close(self.hstates)
         logging.debug("Shutdown horus modem")
 
-    def demodulate(self, demod_in: bytes) -> Frame:
+    def demodulate(self, demod_in) -> Frame:
         """
         Demodulates audio in, into bytes output.
 
+        Only the first packet completed in the block is returned, use demodulate_packets() to get them all.
+
         Parameters
         ----------
-        demod_in : bytes
+        demod_in : bytes-like
             16bit, signed for audio in. You'll need .nin frames in to work correctly.
+            Any object supporting the buffer protocol (bytes, bytearray, memoryview, array, numpy int16 array)
+            can be used, and is handed to the modem without being copied if no resampling is required.
         """
-        # resample to 48khz
-        (demod_in, self.resampler_state) = audioop.ratecv(demod_in, 2, 1+int(self.stereo_iq), self.audio_sample_rate, self.modem_sample_rate, self.resampler_state)
+        frames = self.demodulate_packets(demod_in)
+        return frames[0] if frames else self._empty_frame()
+
+    def demodulate_packets(self, demod_in) -> list:
+        """
+        Demodulates a block of audio in, as for demodulate(), returning every packet completed in it.
+
+        Returns
+        -------
+        list of Frame
+            Each packet which passed its CRC, or if none did, the last failed attempt at decoding one (if any).
+        """
+        if self.resampler:
+            # resample to the modem sample rate
+            demod_in = self.resampler.process(demod_in)
+
+        return self._demodulate(demod_in)
+
+    def _demodulate(self, demod_in) -> list:
+        """ Demodulate a block of samples which are already at the modem sample rate """
+        data_in = ffi.from_buffer("short[]", demod_in)
+
+        _nin = self.nin * (2 if self.stereo_iq else 1)
+        if len(data_in) < _nin:
+            # Short block (e.g. the end of a file, or resampler rounding), zero-pad it into our own
+            # input buffer so the modem doesn't read past the end of the caller's data.
+            ffi.memmove(self._demod_in, data_in, len(data_in) * 2)
+            self._demod_in[len(data_in):_nin] = [0] * (_nin - len(data_in))
+            data_in = self._demod_in
+
+        _npackets = horus_api.horus_rx_packets(self.hstates, self._packets, self.MAX_BATCH_PACKETS, data_in, int(self.stereo_iq))
+        self._blocks += 1
 
+        return [self._packet_frame(self._packets[i], detail=self.frame_detail) for i in range(_npackets)]
 
-        audio_id_data = _horus_api_cffi.ffi.new("char[]",demod_in)
-        data_in = _horus_api_cffi.ffi.cast( # cast bytes to short
-            "short *",
-            audio_id_data
+    def _packet_frame(self, packet, detail=False) -> Frame:
+        """ Frame for a struct horus_packet from horus_rx_packets or horus_rx_batch, with extended_stats if detail is set """
+        return Frame(
+            data=self._decode_output(packet.payload, packet.payload_len),
+            snr=float(packet.snr_est),
+            sync=True,
+            crc_pass=bool(packet.crc_ok),
+            extended_stats=(self.get_stats(eye_diagram=True) if detail else None),
+            sample_offset=int(packet.uw_sample * self.audio_sample_rate / self.modem_sample_rate),
+            f_est=tuple(packet.f_est[0:self.mfsk]),
+            ppm=float(packet.clock_offset)
         )
-        data_out = _horus_api_cffi.ffi.new("char[]", self.max_ascii_out)
 
-        horus_api.horus_rx(self.hstates, data_out, data_in, int(self.stereo_iq))
-        data_out = bytes(_horus_api_cffi.ffi.buffer(data_out))
+    def _empty_frame(self) -> Frame:
+        """ Frame for a block with no packet in it """
+        stats = self.get_stats()
+        return Frame(data=("" if self._ascii_output else b""), snr=stats.snr, sync=False, crc_pass=bool(horus_api.horus_crc_ok(self.hstates)), f_est=stats.f_est, ppm=stats.ppm)
 
-        stats = _horus_api_cffi.ffi.new("struct MODEM_STATS *")
-        horus_api.horus_get_modem_extended_stats(self.hstates, stats)
+    def demodulate_many(self, demod_in) -> list:
+        """
+        Demodulates any amount of audio in one go, using the horus_rx_batch C API.
+
+        Samples left over after the last complete modem block are kept, and used at the start of the next call.
+
+        Parameters
+        ----------
+        demod_in : bytes-like
+            16bit, signed audio in. Any length, and any object supporting the buffer protocol.
 
+        Returns
+        -------
+        list of Frame
+            Every frame the modem produced, in order, as for demodulate_packets().
+        """
+        if self.resampler:
+            demod_in = self.resampler.process(demod_in)
 
-        crc = horus_api.horus_crc_ok(self.hstates)
+        return self._demodulate_many(demod_in)
 
+    def _demodulate_many(self, demod_in) -> list:
+        """ demodulate_many() for samples which are already at the modem sample rate """
+        data = memoryview(demod_in).cast("B")
+        _frame_bytes = 2 * (2 if self.stereo_iq else 1)
+        frames = []
 
-        if (self.mode != Mode.RTTY_7N2) and (self.mode != Mode.RTTY_8N2) and (self.mode != Mode.RTTY_7N1):
-            try:
-                # We are currently getting the whole buffer from the demod. We only want the first null-terminated section.
-                data_out = bytes.fromhex(data_out.decode("ascii").split('\0')[0])
-            except ValueError:
-                logging.debug(data_out)
-                logging.error("Couldn't decode the hex from the modem")
-                data_out = (b'')
-        else:
+        if self._batch_leftover:
+            # Top the leftover samples from the last call up to a whole modem block, and process that first.
+            _need = self.nin * _frame_bytes - len(self._batch_leftover)
+            self._batch_leftover.extend(data[:_need])
+            data = data[_need:]
+            if len(self._batch_leftover) < self.nin * _frame_bytes:
+                return frames
+            self._rx_batch(self._batch_leftover, frames)
+            self._batch_leftover = bytearray()
+
+        _consumed = self._rx_batch(data, frames)
+        self._batch_leftover.extend(data[_consumed * _frame_bytes:])
+
+        return frames
+
+    def _rx_batch(self, data, frames: list) -> int:
+        """ Run horus_rx_batch over a buffer until all complete blocks are consumed, appending frames. Returns samples consumed. """
+        _frame_bytes = 2 * (2 if self.stereo_iq else 1)
+        data_in = ffi.from_buffer("short[]", data)
+        _nsamples = len(data) // _frame_bytes
+        _offset = 0
+
+        while True:
+            _npackets = horus_api.horus_rx_batch(
+                self.hstates, self._packets, self.MAX_BATCH_PACKETS,
+                data_in + _offset * (_frame_bytes // 2), _nsamples - _offset,
+                int(self.stereo_iq), self._nconsumed, self._nblocks
+            )
+
+            for i in range(_npackets):
+                frames.append(self._packet_frame(self._packets[i]))
+
+            _offset += self._nconsumed[0]
+            self._blocks += self._nblocks[0]
+            if _npackets < self.MAX_BATCH_PACKETS:
+                break
+
+        return _offset
+
+    def _decode_output(self, data_out, length: int):
+        """ Convert a modem output buffer into bytes (binary modes) or a string (RTTY modes) """
+        if length == 0:
+            return "" if self._ascii_output else b""
+
+        data_out = ffi.unpack(ffi.cast("char *", data_out), length)
+
+        if self._ascii_output:
             # Ascii
             try:
-                # Same thing here - we might have multiple bits of data
-                data_out = data_out.decode("ascii").split('\0')[0]
+                data_out = data_out.decode("ascii")
             except Exception as e:
                 logging.error(f"Couldn't decode ASCII - {str(e)} - {str(data_out)}")
                 data_out = ""
-            # Strip of all null characters.
-            data_out = data_out.rstrip('\x00')
-
-        frame = Frame(
-            data=data_out,
-            snr=float(stats.snr_est),
-            sync=bool(stats.sync),
-            crc_pass=crc,
-            extended_stats=stats,
-        )
-        return frame
+
+        return data_out
     
     def set_estimator_limits(self, lower: float, upper: float):
         """ Update the modems internal frequency estimator limits """
@@ -235,88 +515,619 @@ class HorusLib():
     def add_samples(self, samples: bytes):
         """ Add samples to a input buffer, to pass on to demodulate when we have nin samples """
 
-        # Add samples to input buffer
-        self.input_buffer.extend(samples)
+        # Resample the whole lot in one go, so the input buffer is at the modem sample rate.
+        if self.resampler:
+            samples = self.resampler.process(samples)
+
+        samples = memoryview(samples).cast("B")
+
+        _frames = None
+        while len(samples) > 0:
+            # Add as many samples to the input buffer as will fit.
+            _len = min(len(samples), self.input_buffer.free)
+            self.input_buffer.write(samples[:_len])
+            samples = samples[_len:]
 
-        _processing = True
-        _frame = None
-        while _processing:
-            # Process data until we have less than _nin samples.
-            _nin = int(self.nin*(self.audio_sample_rate/self.modem_sample_rate)) * (2 if self.stereo_iq else 1)
-            if len(self.input_buffer) > (_nin * 2):
-                # Demodulate
-                _frame = self.demodulate(self.input_buffer[:(_nin*2)])
+            while True:
+                # Process data until we have less than _nin samples.
+                _nin = self.nin * (2 if self.stereo_iq else 1)
+                if len(self.input_buffer) < (_nin * 2):
+                    break
+
+                # Demodulate, directly from the input buffer
+                _frames = self._demodulate(self.input_buffer.peek(_nin*2))
 
                 # Advance sample buffer.
-                self.input_buffer = self.input_buffer[(_nin*2):]
+                self.input_buffer.consume(_nin*2)
+
+                # If we have decoded any packets, send them on to the callback
+                if self.callback:
+                    for _frame in _frames:
+                        if len(_frame.data) > 0:
+                            self.callback(_frame)
+
+        # The first packet from the last block, as demodulate() would return it.
+        if _frames is None:
+            return None
+        return _frames[0] if _frames else self._empty_frame()
+
+    def get_stats(self, eye_diagram=False, fft=False) -> StatsSnapshot:
+        """
+        Get a snapshot of the modem statistics after the most recently demodulated block.
+
+        The scalar stats are always included. The eye diagram and spectrum are comparatively large,
+        so are only copied out of the modem if asked for. Snapshots are cached, so calling this
+        repeatedly between blocks doesn't touch the modem again.
+
+        Parameters
+        ----------
+        eye_diagram : bool
+            Include the eye diagram traces
+        fft : bool
+            Include the averaged input spectrum
+        """
+        _snapshot = self._snapshot
+        if (
+            self._snapshot_block == self._blocks
+            and (_snapshot.eye_diagram is not None or not eye_diagram)
+            and (_snapshot.fft is not None or not fft)
+        ):
+            return _snapshot
+
+        stats = self._stats
+        horus_api.horus_get_stats(self.hstates, stats)
+
+        if self._snapshot_block == self._blocks:
+            # Already have the scalars for this block, just add on the extra parts.
+            _snapshot = StatsSnapshot(_snapshot.snr, _snapshot.ppm, _snapshot.foff, _snapshot.rx_timing, _snapshot.f_est, _snapshot.eye_diagram, _snapshot.fft)
+        else:
+            _snapshot = StatsSnapshot(
+                snr=stats.snr_est,
+                ppm=stats.clock_offset,
+                foff=stats.foff,
+                rx_timing=stats.rx_timing,
+                f_est=tuple(stats.f_est[0:stats.mfsk]),
+            )
+
+        if eye_diagram and _snapshot.eye_diagram is None:
+            horus_api.horus_get_eye(self.hstates, self._eye)
+            _snapshot.eye_diagram = [
+                ffi.unpack(self._eye + i * stats.neyesamp, stats.neyesamp) for i in range(stats.neyetr)
+            ]
+
+        if fft and _snapshot.fft is None:
+            if self._fft is None:
+                self._fft = ffi.new("float[]", stats.nfft)
+            horus_api.horus_get_fft(self.hstates, self._fft)
+            _snapshot.fft = ffi.unpack(self._fft, stats.nfft)
+
+        self._snapshot = _snapshot
+        self._snapshot_block = self._blocks
+        return _snapshot
+
+    def enable_timing(self, enable=True) -> None:
+        """ Turn the modem's per-stage timing counters on or off, clearing them. They are off by default. """
+        horus_api.horus_set_timing(self.hstates, int(enable))
+
+    def get_timing(self, reset=False) -> dict:
+        """
+        Time spent in each stage of the modem, since timing was enabled or the counters were last reset.
+
+        Parameters
+        ----------
+        reset : bool
+            Clear the counters after reading them
+
+        Returns
+        -------
+        dict
+            Stage name (from TIMING_STAGES) to (seconds, calls). The extract stage only counts blocks
+            where there was a unique word to try decoding a packet from.
+        """
+        horus_api.horus_get_timing(self.hstates, self._timing, int(reset))
+        return {
+            name: (self._timing.ns[i] / 1e9, self._timing.calls[i]) for (i, name) in enumerate(TIMING_STAGES)
+        }
 
-                # If we have decoded a packet, send it on to the callback
-                if len(_frame.data) > 0:
-                    if self.callback:
-                        self.callback(_frame)
-            else:
-                _processing = False
-        
-        return _frame
     @property
     def stats(self):
+        """ Full MODEM_STATS struct, freshly allocated and filled on every access. get_stats() is much cheaper. """
         stats = _horus_api_cffi.ffi.new("struct MODEM_STATS *")
         horus_api.horus_get_modem_extended_stats(self.hstates,stats)
         return stats
 
 
+class MultiHorusLib():
+    """
+    Runs several HorusLib modems over one input stream, each with its own frequency estimator window.
+
+    The input is read (and if needed, resampled) once, then handed to every modem. The modems run
+    on a thread pool, using the horus_rx_batch C API, which runs without holding the GIL.
+
+    With channel_rate set, wideband IQ input is first split up by a Channelizer, so each modem only
+    sees its own channel at the (much lower) channel_rate.
+
+    Example usage:
+
+    def frame_callback(frame, channel):
+        print(f"Channel {channel}: {frame.data.hex()}")
+
+    with MultiHorusLib(channels=[(-17500, -12500), (-12500, -7500)], stereo_iq=True, callback=frame_callback) as horus:
+        while True:
+            data = f.read(19200)
+            if not data:
+                break
+            horus.add_samples(data)
+    """
+
+    def __init__(
+        self,
+        channels,
+        mode=Mode.BINARY,
+        rate=-1,
+        tone_spacing=-1,
+        stereo_iq=False,
+        verbose=False,
+        callback=None,
+        sample_rate=48000,
+        max_workers=None,
+        channel_rate=None,
+        native_rate=False
+    ):
+        """
+        Parameters
+        ----------
+        channels : list of (float, float)
+            Frequency estimator (lower, upper) limits in Hz, one modem is run per entry.
+        mode, rate, tone_spacing, stereo_iq, verbose, sample_rate, native_rate
+            As for HorusLib, shared by all modems.
+        callback : function
+            Called as callback(frame, channel) from add_samples for every frame with data, where
+            channel is the index into channels.
+        max_workers : int
+            Number of threads to run the modems on. Defaults to one per channel.
+        channel_rate : int
+            If set, channelize the (IQ) input down to this sample rate, centred on each channel's
+            estimator window. Must divide sample_rate, and the modem must be able to run at it natively.
+            Each channel must be no wider than the channelizer's passband, 90% of channel_rate.
+        """
+        if len(channels) == 0:
+            raise ValueError("At least one channel is required")
+
+        self.channels = [tuple(x) for x in channels]
+        self.callback = callback
+        self.stereo_iq = stereo_iq
+        self.audio_sample_rate = sample_rate
+
+        if channel_rate:
+            if not stereo_iq:
+                raise ValueError("Channelizing requires IQ input")
+            _centres = [(_lower + _upper) / 2 for (_lower, _upper) in self.channels]
+            # The channelizer's filter passes +/- DEFAULT_ROLLOFF/2 of the channel rate around each centre.
+            for (_lower, _upper) in self.channels:
+                if _upper - _lower > DEFAULT_ROLLOFF * channel_rate:
+                    raise ValueError(f"Channel {_lower}-{_upper} Hz is wider than the {DEFAULT_ROLLOFF * channel_rate:.0f} Hz passband of the {channel_rate} Hz channel sample rate")
+            self.channelizer = Channelizer(sample_rate, channel_rate, _centres)
+            _limits = [(_lower - _centre, _upper - _centre) for ((_lower, _upper), _centre) in zip(self.channels, _centres)]
+            _modem_rate = channel_rate
+        else:
+            self.channelizer = None
+            _limits = self.channels
+            _modem_rate = None
+
+        self.modems = []
+        for (_lower, _upper) in _limits:
+            horus = HorusLib(
+                mode=mode, rate=rate, tone_spacing=tone_spacing, stereo_iq=stereo_iq, verbose=verbose,
+                sample_rate=(channel_rate or sample_rate), modem_sample_rate=_modem_rate, native_rate=native_rate
+            )
+            horus.set_estimator_limits(_lower, _upper)
+            self.modems.append(horus)
+
+        self.modem_sample_rate = self.modems[0].modem_sample_rate
+        self.mfsk = self.modems[0].mfsk
+
+        # Resample once here, rather than in every modem.
+        if self.channelizer is None and self.audio_sample_rate != self.modem_sample_rate:
+            self.resampler = Resampler(self.audio_sample_rate, self.modem_sample_rate, channels=(2 if self.stereo_iq else 1))
+        else:
+            self.resampler = None
+
+        if len(self.modems) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=(max_workers or len(self.modems)), thread_name_prefix="horus_demod")
+        else:
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes all the modems.
+        """
+        if self._executor:
+            self._executor.shutdown()
+        for horus in self.modems:
+            horus.close()
+
+    def demodulate_many(self, demod_in) -> list:
+        """
+        Demodulate any amount of audio on every channel.
+
+        Returns a list with one entry per channel, each a list of Frames as for HorusLib.demodulate_many.
+        """
+        if self.resampler:
+            demod_in = self.resampler.process(demod_in)
+
+        _channels = range(len(self.modems))
+        if self._executor:
+            return list(self._executor.map(lambda channel: self._demodulate_channel(channel, demod_in), _channels))
+        else:
+            return [self._demodulate_channel(channel, demod_in) for channel in _channels]
+
+    def _demodulate_channel(self, channel: int, demod_in) -> list:
+        """ Run one channel's modem (and down converter) over a buffer of samples """
+        if self.channelizer is None:
+            return self.modems[channel]._demodulate_many(demod_in)
+
+        frames = self.modems[channel]._demodulate_many(self.channelizer.process_channel(channel, demod_in))
+
+        # Report sample offsets at the input sample rate, not the channel rate.
+        return [
+            Frame(x.data, x.sync, x.crc_pass, x.snr, x.extended_stats, x.sample_offset * self.channelizer.decimation, x.f_est, x.ppm)
+            for x in frames
+        ]
+
+    def add_samples(self, samples: bytes) -> list:
+        """ Demodulate samples on every channel, calling the callback for any frames with data """
+        results = self.demodulate_many(samples)
+
+        if self.callback:
+            for (channel, frames) in enumerate(results):
+                for frame in frames:
+                    if len(frame.data) > 0:
+                        self.callback(frame, channel)
+
+        return results
+
+    @property
+    def blocks(self) -> int:
+        """ Number of blocks each modem has demodulated, see HorusLib.blocks """
+        return self.modems[0].blocks
+
+    def get_stats(self, eye_diagram=False, fft=False) -> list:
+        """ StatsSnapshot for each channel, see HorusLib.get_stats """
+        return [horus.get_stats(eye_diagram=eye_diagram, fft=fft) for horus in self.modems]
+
+
+def demodulate_file(horus, filename: str, offset=0, length=None, window_seconds=DEFAULT_FILE_WINDOW):
+    """
+    Demodulate a recording by memory mapping it, and passing it to horus.demodulate_many() in large windows.
+
+    The windows are views of the mapping, so the file is never copied, and the whole window is processed
+    by the horus_rx_batch C API in one call. This is much faster than reading a block at a time for long
+    recordings.
+
+    Parameters
+    ----------
+    horus : HorusLib or MultiHorusLib
+        Modem(s) to run over the file
+    filename : str
+        Signed 16-bit recording, at horus.audio_sample_rate
+    offset : int
+        Byte offset of the first sample (e.g. after a WAV header)
+    length : int
+        Bytes of samples to process, to the end of the file if None
+    window_seconds : float
+        Seconds of audio to pass to demodulate_many() at a time
+
+    Yields
+    ------
+    The result of demodulate_many() for each window, in order.
+    """
+    _frame_bytes = 2 * (2 if horus.stereo_iq else 1)
+    _window = _frame_bytes * max(int(horus.audio_sample_rate * window_seconds), 1)
+
+    with open(filename, "rb") as f:
+        _end = os.fstat(f.fileno()).st_size
+        if length is not None:
+            _end = min(_end, offset + length)
+        if _end <= offset:
+            return
+
+        _map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Unmap the file even if the caller stops early, or demodulation fails.
+    try:
+        if hasattr(_map, "madvise"):
+            # We only pass over the file once, so let the OS read ahead and drop pages behind us.
+            _map.madvise(mmap.MADV_SEQUENTIAL)
+
+        for _start in range(offset, _end, _window):
+            _view = memoryview(_map)[_start:min(_start + _window, _end)]
+            results = horus.demodulate_many(_view)
+            # The mapping can't be closed while any view of it is still around.
+            _view.release()
+            yield results
+    finally:
+        try:
+            _map.close()
+        except BufferError:
+            # A view is still held by the traceback of a failed demodulate_many(), leave the mapping to the GC.
+            pass
+
+
+def format_frame(frame: Frame, show_crc=False) -> str:
+    """ Format a frame as horus_demod outputs it: hex for binary packets, the text for RTTY """
+    if type(frame.data) == bytes:
+        _line = frame.data.hex().upper()
+    else:
+        _line = frame.data
+
+    if show_crc:
+        if frame.crc_pass:
+            _line += "  CRC OK"
+        else:
+            _line += "  CRC BAD"
+    return _line
+
+
+def stats_dict(stats: StatsSnapshot, mfsk: int) -> dict:
+    """ The scalar fields of a horus_demod JSON stats line, which FSKDemodStats.update() also takes directly """
+    stats_out = {
+        "EbNodB": stats.snr,
+        "ppm": stats.ppm,
+        "f1_est": stats.f_est[0],
+        "f2_est": stats.f_est[1]
+    }
+
+    if mfsk == 4:
+        stats_out["f3_est"] = stats.f_est[2]
+        stats_out["f4_est"] = stats.f_est[3]
+    return stats_out
+
+
+def format_stats(stats: StatsSnapshot, mfsk: int, channel=None, compact=False) -> str:
+    """
+    Format modem stats as a horus_demod JSON stats line, as read by horus_uploader and horus-gui.
+
+    compact leaves out the eye diagram (which stats needn't include) and the dummy spectrum, rounds
+    the values to 0.01, and drops the spaces, taking the line from several kB to under 100 bytes.
+    """
+    stats_out = stats_dict(stats, mfsk)
+
+    if compact:
+        for _key in stats_out:
+            stats_out[_key] = round(stats_out[_key], 2)
+        if channel is not None:
+            stats_out['channel'] = channel
+        return json.dumps(stats_out, separators=(",", ":"))
+
+    stats_out['eye_diagram'] = stats.eye_diagram
+    stats_out['samp_fft']=[0]*128 # broken in horus_demod.c - replicating the same output
+    if channel is not None:
+        stats_out['channel'] = channel
+    return json.dumps(stats_out)
+
+
+def pack_stats(stats: StatsSnapshot, mfsk: int, channel=None, block=0) -> bytes:
+    """ Pack modem stats into a STATS_RECORD, as written by horus_demod --stats-format binary """
+    _f_est = (list(stats.f_est) + [0.0] * 4)[:4]
+    return STATS_RECORD.pack(
+        STATS_RECORD_MAGIC, STATS_RECORD_VERSION, mfsk, -1 if channel is None else channel,
+        block & 0xFFFFFFFF, stats.snr, stats.ppm, stats.foff, stats.rx_timing, *_f_est
+    )
+
+
+def unpack_stats(record: bytes) -> dict:
+    """
+    Unpack a STATS_RECORD into a dict with the same fields as the JSON stats lines (plus foff, rx_timing
+    and block), which can be passed straight to FSKDemodStats.update(). Raises ValueError if it isn't one.
+    """
+    (_magic, _version, _mfsk, _channel, _block, _snr, _ppm, _foff, _rx_timing, *_f_est) = STATS_RECORD.unpack(record)
+    if _magic != STATS_RECORD_MAGIC or _version != STATS_RECORD_VERSION:
+        raise ValueError("Not a horus_demod stats record")
+
+    stats_out = {"EbNodB": _snr, "ppm": _ppm, "foff": _foff, "rx_timing": _rx_timing, "block": _block}
+    for i in range(_mfsk):
+        stats_out[f"f{i + 1}_est"] = _f_est[i]
+    if _channel >= 0:
+        stats_out["channel"] = _channel
+    return stats_out
+
+
+MODE_NAMES = ["RTTY","RTTY7N1","RTTY8N2","RTTY7N2","BINARY"]
+
+
+def add_modem_arguments(parser) -> None:
+    """ Add the modem options shared by horus_demod, horus_rx, horus_demod_rtp and horus_batch to an ArgumentParser, see parse_mode() """
+    parser.add_argument('-m','--mode',choices=MODE_NAMES+[x.lower() for x in MODE_NAMES], default="binary", help="RTTY or binary Horus protocol")
+    parser.add_argument('--sample-rate',default=48000, type=int,help="Audio sample rate")
+    parser.add_argument('--rate',default=100, type=int,help="Customise modem baud rate. Default: (depends on mode)")
+    parser.add_argument('--native-rate', action="store_true", default=False, help="Run the modem at the input sample rate if it can, instead of resampling to 48 kHz. Faster, but may lose some weak packets.")
+    parser.add_argument('--tonespacing',default=-1, type=int,help="Transmitter Tone Spacing (Hz) Default: Not used.")
+    parser.add_argument('-q', action="store_true",default=False,help="use stereo (IQ) input")
+    parser.add_argument('-u',"--fsk_upper", type=int, action="store",default=False,help="Estimator FSK upper limit")
+    parser.add_argument('-b',"--fsk_lower", type=int, action="store",default=False,help="Estimator FSK lower limit")
+
+
+def add_input_arguments(parser) -> None:
+    """ Add the input source options shared by horus_demod and horus_rx to an ArgumentParser, see open_input() """
+    parser.add_argument("--udp-in", type=str, default=None, metavar="HOST:PORT", help="Receive input samples as UDP datagrams (e.g. GQRX or SDR++ UDP audio output) on this address, instead of from the input file.")
+    parser.add_argument("--rtl-tcp", type=str, default=None, metavar="HOST:PORT", help="Take IQ input from an rtl_tcp server, at --sample-rate (which must be a rate the RTLSDR supports, e.g. 1024000), instead of from the input file. Implies -q.")
+    parser.add_argument("--rtl-freq", type=float, default=None, help="With --rtl-tcp, tune the RTLSDR to this centre frequency (MHz)")
+    parser.add_argument("--rtl-gain", type=float, default=None, help="With --rtl-tcp, set the RTLSDR tuner gain (dB), 0 for automatic")
+    parser.add_argument("--rtl-ppm", type=int, default=None, help="With --rtl-tcp, set the RTLSDR frequency correction (ppm)")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS, default="s16", help="Input sample format: signed 16-bit, unsigned 8-bit, or 32-bit float raw samples, or a WAV file (which sets the sample rate, and IQ if it has two channels). Default: s16")
+
+
+def parse_mode(name: str) -> Mode:
+    """ Mode for a --mode option """
+    if name.lower() == 'rtty7n2' or name.lower() == 'rtty':
+        return Mode.RTTY_7N2
+    elif name.lower() == 'rtty7n1':
+        return Mode.RTTY_7N1
+    elif name.lower() == 'rtty8n2':
+        return Mode.RTTY_8N2
+    else:
+        return Mode.BINARY
+
+
+def open_input(args, parser):
+    """
+    Open the input selected by the add_input_arguments() options and args.input: an rtl_tcp server, UDP,
+    stdin or a file. Input in other formats is converted to signed 16-bit samples, and a WAV header sets
+    args.sample_rate and args.q. Exits if the input can't be read.
+
+    Returns (read, close), where read(size) returns up to size bytes of samples (b'' at the end of the
+    input), and close() closes the input, logging a summary of network input.
+    """
+    if args.rtl_tcp:
+        args.q = True
+
+    if args.input_format != "s16" and (args.rtl_tcp or args.udp_in):
+        parser.error("--input-format only applies to file or stdin input")
+
+    close_input = lambda: None
+    if args.rtl_tcp:
+        if not rtlsdr_sample_rate_supported(args.sample_rate):
+            parser.error(f"--rtl-tcp needs a --sample-rate the RTLSDR supports ({' or '.join(f'{x[0]}-{x[1]}' for x in RTLSDR_SAMPLE_RATE_RANGES)} Hz, e.g. 1024000), not {args.sample_rate} Hz")
+        _host, _, _port = args.rtl_tcp.rpartition(":")
+        try:
+            rtl_source = RTLTCPSource(
+                _host.strip("[]") or "127.0.0.1", int(_port), sample_rate=args.sample_rate,
+                frequency=(int(args.rtl_freq * 1e6) if args.rtl_freq else None), gain=args.rtl_gain, ppm=args.rtl_ppm
+            )
+        except ValueError as e:
+            parser.error(f"Invalid --rtl-tcp {args.rtl_tcp}: {e}")
+        logging.info(f"Connected to rtl_tcp server at {args.rtl_tcp} (tuner type {rtl_source.tuner_type}).")
+        read_input = rtl_source.read
+
+        def close_input():
+            logging.info(f"rtl_tcp input: {rtl_source.bytes} bytes received.")
+            rtl_source.close()
+    elif args.udp_in:
+        _host, _, _port = args.udp_in.rpartition(":")
+        try:
+            udp_source = UDPSampleSource(_host.strip("[]") or "0.0.0.0", int(_port), sample_rate=args.sample_rate, channels=(2 if args.q else 1))
+        except ValueError:
+            parser.error(f"Invalid --udp-in {args.udp_in}, expected HOST:PORT")
+        logging.info(f"Listening for UDP input on {args.udp_in} (receive buffer {udp_source.rcvbuf} bytes).")
+
+        # Datagrams are handed on as they arrive, whatever size was asked for.
+        read_input = lambda size: udp_source.read()
+
+        def close_input():
+            logging.info(f"UDP input: {udp_source.summary()}")
+            udp_source.close()
+    elif type(args.input) == type(sys.stdin.buffer) or args.input == "-":
+        read_input = sys.stdin.buffer.read
+    else:
+        input_file = open(args.input, "rb")
+        read_input = input_file.read
+        close_input = input_file.close
+
+    if args.input_format != "s16":
+        try:
+            sample_reader = SampleReader(read_input, args.input_format)
+        except ValueError as e:
+            logging.critical(f"Could not read input: {e}")
+            sys.exit(1)
+        if sample_reader.sample_rate:
+            if sample_reader.channels > 2:
+                logging.critical(f"WAV input has {sample_reader.channels} channels, only mono or IQ (stereo) is supported.")
+                sys.exit(1)
+            args.sample_rate = sample_reader.sample_rate
+            args.q = (sample_reader.channels == 2)
+            logging.info(f"WAV input: {sample_reader.format}, {sample_reader.channels} channel(s), {sample_reader.sample_rate} Hz.")
+        read_input = sample_reader.read
+
+    return (read_input, close_input)
+
+
 def main():
     parser = argparse.ArgumentParser(
                     prog='horus_demod',
                     description='')    
 
-    modes = ["RTTY","RTTY7N1","RTTY8N2","RTTY7N2","BINARY"]
-    parser.add_argument('-m','--mode',choices=modes+[x.lower() for x in modes], default="binary", help="RTTY or binary Horus protocol")
-    parser.add_argument('--sample-rate',default=48000, type=int,help="Audio sample rate")
-    parser.add_argument('--rate',default=100, type=int,help="Customise modem baud rate. Default: (depends on mode)")
-    parser.add_argument('--tonespacing',default=-1, type=int,help="Transmitter Tone Spacing (Hz) Default: Not used.")
-    parser.add_argument('-t','--stats', default=None,  nargs='?', const=8, type=int, help="Print out modem statistics to stderr in JSON") # TODO 
+    add_modem_arguments(parser)
+    parser.add_argument('-t','--stats', default=None,  nargs='?', const=8, type=int, metavar="N", help="Print out modem statistics to stderr in JSON, every N modem blocks (default 8). With --mmap, once per window of the file.")
     parser.add_argument('-g', action="store_true", default=False,help="Emit Stats on stdout instead of stderr")
-    parser.add_argument('-q', action="store_true",default=False,help="use stereo (IQ) input")
+    parser.add_argument("--stats-format", choices=STATS_FORMATS, default="json", help="Stats format: full JSON lines (with the eye diagram), compact JSON lines (without it), or fixed size binary records, see STATS_RECORD. Binary needs --stats-output. Default: json")
+    parser.add_argument("--stats-output", type=str, default=None, metavar="FILE", help="Write stats (for all channels) to this file or FIFO, instead of stderr or stdout")
     parser.add_argument('-v', action="store_true",default=False,help="verbose debug info")
     parser.add_argument('-c', action="store_true",default=False,help="display CRC results for each packet")
-    parser.add_argument('-u',"--fsk_upper", type=int, action="store",default=False,help="Estimator FSK upper limit")
-    parser.add_argument('-b',"--fsk_lower", type=int, action="store",default=False,help="Estimator FSK lower limit")
+    parser.add_argument("--channel-rate", type=int, default=None, help="With --channel and IQ input, split the input into channels at this sample rate (which must divide --sample-rate) and run each modem at that rate.")
+    parser.add_argument("--channel", action="append", default=None, metavar="LOWER:UPPER[:OUTPUT]", help="Run a modem with these estimator limits (Hz) over the same input. Can be given multiple times. Packets (and stats, with -g) go to OUTPUT if given, otherwise the main output. Use --channel=LOWER:UPPER for negative frequencies.")
+    add_input_arguments(parser)
+    parser.add_argument("--mmap", action="store_true", default=False, help="Memory map the input file and demodulate it in large windows, reporting the processing speed at the end. Much faster for long recordings. Needs a signed 16-bit raw or WAV input file.")
+    parser.add_argument("--jobs", type=int, default=None, help="Demodulate the input file on this many processes, by splitting it into overlapping segments. Implies --mmap. Can't be used with --channel or --stats.")
     parser.add_argument('input',nargs='?',action='store', default=sys.stdin.buffer, help="Input filename")
     parser.add_argument('output',nargs='?',action='store', default=sys.stdout, help="Output filename")
 
     args = parser.parse_args()
 
-    if args.mode.lower() == 'rtty7n2' or args.mode.lower() == 'rtty':
-        mode = Mode.RTTY_7N2
-    elif args.mode.lower() == 'rtty7n1':
-        mode = Mode.RTTY_7N1
-    elif args.mode.lower() == 'rtty8n2':
-        mode = Mode.RTTY_8N2
-    else:
-        mode = Mode.BINARY
+    if args.stats is not None and args.stats < 1:
+        parser.error("--stats rate must be at least 1")
+
+    if args.stats_format == "binary" and not args.stats_output:
+        parser.error("--stats-format binary needs --stats-output")
 
-    if args.g:
+    if args.jobs:
+        if args.channel or args.stats != None:
+            parser.error("--jobs can't be used with --channel or --stats")
+        args.mmap = True
+
+    if args.mmap and (args.rtl_tcp or args.udp_in or type(args.input) == type(sys.stdin.buffer) or args.input == "-"):
+        parser.error("--mmap needs an input file")
+
+    mode = parse_mode(args.mode)
+
+    channels = []
+    for _spec in (args.channel or []):
+        _fields = _spec.split(":", 2)
+        try:
+            channels.append((int(_fields[0]), int(_fields[1]), _fields[2] if len(_fields) > 2 else None))
+        except (ValueError, IndexError):
+            parser.error(f"Invalid --channel {_spec}, expected LOWER:UPPER[:OUTPUT]")
+
+    if args.stats_output:
+        stats_outfile = open(args.stats_output, "wb" if args.stats_format == "binary" else "w")
+    elif args.g:
         stats_outfile = sys.stdout
     else:
         stats_outfile = sys.stderr
 
-    def frame_callback(frame):
+    def frame_callback(frame, channel=None):
         # Print out only CRC-passing frames, unless we are in verbose mode
         if frame.crc_pass or args.v:
+            _fout = fout if channel is None else channel_outputs[channel]
+            _fout.write(format_frame(frame, args.c) + "\n")
+            _fout.flush()
 
-            if type(frame.data) == bytes:
-                fout.write(frame.data.hex().upper())
-            else:
-                fout.write(frame.data)
-        
-            if args.c:
-                if frame.crc_pass:
-                    fout.write(f"  CRC OK")
-                else:
-                    fout.write(f"  CRC BAD")
-            fout.write("\n")
-            fout.flush()
+    # Only the full JSON format includes the eye diagram, so only fetch it from the modem for that.
+    stats_eye = (args.stats_format == "json")
+    next_stats_block = 0
+
+    def stats_due(blocks):
+        """ Check if stats should be written after the modem has demodulated this many blocks """
+        nonlocal next_stats_block
+        if args.stats is None or blocks < next_stats_block:
+            return False
+        next_stats_block = blocks + args.stats
+        return True
+
+    def write_stats(stats, mfsk, outfile, channel=None, block=0):
+        if args.stats_output:
+            outfile = stats_outfile
+        if args.stats_format == "binary":
+            outfile.write(pack_stats(stats, mfsk, channel, block))
+        else:
+            outfile.write(format_stats(stats, mfsk, channel, compact=(args.stats_format == "compact")) + "\n")
+        outfile.flush()
 
 
     # Setup Logging
@@ -329,56 +1140,487 @@ def main():
     )
 
     logging.info(f"horusdemodlib v{horusdemodlib.__version__} - horus_demod")
+
+    mmap_offset = 0
+    mmap_length = None
+    close_input = lambda: None
+    if args.mmap:
+        if args.input_format not in ("s16", "wav"):
+            parser.error("--mmap needs s16 or WAV input")
+        if args.input_format == "wav":
+            with open(args.input, "rb") as f:
+                try:
+                    _info = read_wav_header(f.read)
+                except ValueError as e:
+                    logging.critical(f"Could not read input: {e}")
+                    sys.exit(1)
+                if _info.format != "s16" or _info.channels > 2:
+                    logging.critical(f"--mmap needs 16-bit mono or IQ (stereo) WAV input, not {_info.format} with {_info.channels} channel(s).")
+                    sys.exit(1)
+                (mmap_offset, mmap_length) = (f.tell(), _info.data_size)
+            args.sample_rate = _info.sample_rate
+            args.q = (_info.channels == 2)
+            logging.info(f"WAV input: {_info.format}, {_info.channels} channel(s), {_info.sample_rate} Hz.")
+    else:
+        (read_input, close_input) = open_input(args, parser)
+
+    # Output files are closed on exit, so FIFO readers see EOF.
+    output_files = contextlib.ExitStack()
+    if type(args.output) == type(sys.stdout) or args.output == "-":
+        fout = sys.stdout
+    else:
+        fout = output_files.enter_context(open(args.output, "w"))
+
     _decoder_info = f"Starting {args.mode} decoder, {args.rate} baud, {f'{args.tonespacing} Hz Tone Spacing, ' if args.tonespacing>0 else ''} {args.sample_rate} Hz sample rate {'IQ' if args.q else ''}"
     logging.info(_decoder_info)
 
-    with HorusLib(mode=mode,tone_spacing=args.tonespacing, stereo_iq=args.q, verbose=int(args.v), callback=frame_callback, sample_rate=args.sample_rate, rate=int(args.rate)) as horus:
+    def run_mmap(horus):
+        """ Demodulate the whole input file through demodulate_file(), and report how fast it went """
+        _start = time.monotonic()
+        _samples = 0
+        for results in demodulate_file(horus, args.input, offset=mmap_offset, length=mmap_length):
+            for (_channel, frames) in enumerate(results if channels else [results]):
+                for frame in frames:
+                    if len(frame.data) > 0:
+                        frame_callback(frame, _channel if channels else None)
+            if args.stats != None:
+                if channels:
+                    for (_channel, stats) in enumerate(horus.get_stats(eye_diagram=stats_eye)):
+                        write_stats(stats, horus.mfsk, channel_outputs[_channel] if args.g else sys.stderr, _channel, horus.blocks)
+                else:
+                    write_stats(horus.get_stats(eye_diagram=stats_eye), horus.mfsk, stats_outfile, block=horus.blocks)
+        log_realtime(time.monotonic() - _start)
+
+    def run_parallel():
+        """ Demodulate the whole input file on a process pool, and report how fast it went """
+        from .parallel import demodulate_file_parallel
+
+        _limits = None
         if args.fsk_lower > -99999 and args.fsk_upper > args.fsk_lower:
-            horus.set_estimator_limits(args.fsk_lower, args.fsk_upper)
+            _limits = (args.fsk_lower, args.fsk_upper)
             logging.info(f"Frequency Estimator Limits set to {args.fsk_lower}-{args.fsk_upper} Hz.")
-        if type(args.input) == type(sys.stdin.buffer) or args.input == "-":
-            f = sys.stdin.buffer
-        else:
-            f = open(args.input, "rb")
 
-        if type(args.output) == type(sys.stdout) or args.output == "-":
-            fout = sys.stdout
-        else:
-            fout = open(args.output, "w")
-        
-        stats_counter = args.stats
-        while True:
-            data = f.read(horus.nin * 2 * (2 if horus.stereo_iq else 1))
-            if not data: # EOF
-                break
-            output = horus.add_samples(data)
-            if args.v:
-                if output:
-                    sys.stderr.write(f"Sync: {output.sync}  SNR: {output.snr}\n")
-            if args.stats != None:
-                stats_out = {
-                    "EbNodB": horus.stats.snr_est,
-                    "ppm": horus.stats.clock_offset,
-                    "f1_est": horus.stats.f_est[0],
-                    "f2_est": horus.stats.f_est[1]
-                }
-            
-                if horus.mfsk == 4:
-                    stats_out["f3_est"] = horus.stats.f_est[2]
-                    stats_out["f4_est"] = horus.stats.f_est[3]
-                
-                eye_diagram = []
-                for i in range(horus.stats.neyetr):
-                    eye_diagram.append([])
-                    for j in range(horus.stats.neyesamp):
-                        eye_diagram[i].append(horus.stats.rx_eye[i][j])
-                stats_out['eye_diagram'] = eye_diagram
-                stats_out['samp_fft']=[0]*128 # broken in horus_demod.c - replicating the same output
-                if args.g:
-                    print(json.dumps(stats_out))
+        _start = time.monotonic()
+        frames = demodulate_file_parallel(
+            args.input, workers=args.jobs, offset=mmap_offset, length=mmap_length, estimator_limits=_limits,
+            mode=mode, tone_spacing=args.tonespacing, stereo_iq=args.q, verbose=int(args.v), sample_rate=args.sample_rate, rate=int(args.rate), native_rate=args.native_rate
+        )
+        for frame in frames:
+            frame_callback(frame)
+        log_realtime(time.monotonic() - _start)
+
+    def log_realtime(elapsed):
+        _bytes = os.path.getsize(args.input) - mmap_offset
+        if mmap_length is not None:
+            _bytes = min(_bytes, mmap_length)
+        _audio = _bytes / (2 * (2 if args.q else 1) * args.sample_rate)
+        logging.info(f"Processed {_audio:.1f} s of audio in {elapsed:.2f} s ({_audio / max(elapsed, 1e-9):.1f}x realtime).")
+
+    try:
+        if args.jobs:
+            run_parallel()
+            return
+
+        if channels:
+            channel_outputs = [(output_files.enter_context(open(x[2], "w")) if x[2] else fout) for x in channels]
+
+            with MultiHorusLib(channels=[x[:2] for x in channels], mode=mode, tone_spacing=args.tonespacing, stereo_iq=args.q, verbose=int(args.v), callback=frame_callback, sample_rate=args.sample_rate, rate=int(args.rate), channel_rate=args.channel_rate, native_rate=args.native_rate) as horus:
+                if horus.channelizer:
+                    logging.info(f"Channelizing input to {horus.modem_sample_rate} Hz channels.")
+                elif horus.modem_sample_rate != horus.audio_sample_rate:
+                    logging.info(f"Resampling input to {horus.modem_sample_rate} Hz modem sample rate.")
+                for (_lower, _upper, _output) in channels:
+                    logging.info(f"Channel {_lower}-{_upper} Hz{f' -> {_output}' if _output else ''}")
+
+                if args.mmap:
+                    run_mmap(horus)
+                    return
+
+                # Read 100 ms of input at a time, so each pass over the modems does a decent amount of work.
+                _read_size = (args.sample_rate // 10) * 2 * (2 if args.q else 1)
+                while True:
+                    data = read_input(_read_size)
+                    if not data: # EOF
+                        break
+                    horus.add_samples(data)
+                    if stats_due(horus.blocks):
+                        for (_channel, stats) in enumerate(horus.get_stats(eye_diagram=stats_eye)):
+                            write_stats(stats, horus.mfsk, channel_outputs[_channel] if args.g else sys.stderr, _channel, horus.blocks)
+            return
+
+        with HorusLib(mode=mode,tone_spacing=args.tonespacing, stereo_iq=args.q, verbose=int(args.v), callback=frame_callback, sample_rate=args.sample_rate, rate=int(args.rate), native_rate=args.native_rate) as horus:
+            if horus.modem_sample_rate != horus.audio_sample_rate:
+                logging.info(f"Resampling input to {horus.modem_sample_rate} Hz modem sample rate.")
+            if args.fsk_lower > -99999 and args.fsk_upper > args.fsk_lower:
+                horus.set_estimator_limits(args.fsk_lower, args.fsk_upper)
+                logging.info(f"Frequency Estimator Limits set to {args.fsk_lower}-{args.fsk_upper} Hz.")
+
+            if args.mmap:
+                run_mmap(horus)
+                return
+
+            while True:
+                data = read_input(horus.audio_nin * 2 * (2 if horus.stereo_iq else 1))
+                if not data: # EOF
+                    break
+                output = horus.add_samples(data)
+                if args.v:
+                    if output:
+                        sys.stderr.write(f"Sync: {output.sync}  SNR: {output.snr}\n")
+                if stats_due(horus.blocks):
+                    write_stats(horus.get_stats(eye_diagram=stats_eye), horus.mfsk, stats_outfile, block=horus.blocks)
+    finally:
+        close_input()
+        output_files.close()
+        if args.stats_output:
+            stats_outfile.close()
+
+
+class HorusLibTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def demodulate_file(self, filename, wrap=bytes, estimator_limits=None, **kwargs):
+        _packets = []
+        with HorusLib(**kwargs) as horus:
+            if estimator_limits:
+                horus.set_estimator_limits(*estimator_limits)
+            with open(os.path.join(self.SAMPLES_DIR, filename), "rb") as f:
+                while True:
+                    data = f.read(horus.audio_nin * 2 * (2 if horus.stereo_iq else 1))
+                    if not data:
+                        break
+                    output = horus.demodulate(wrap(data))
+                    if output.crc_pass and output.data:
+                        _packets.append(output.data.hex().upper())
+        return _packets
+
+    def test_buffer_inputs(self):
+        for _wrap in [bytes, bytearray, memoryview, lambda x: array('h', x)]:
+            with self.subTest(wrap=_wrap):
+                _packets = self.demodulate_file("horusb_iq_s16.raw", wrap=_wrap, estimator_limits=(1000, 20000), mode=Mode.BINARY, stereo_iq=True)
+                self.assertIn("000900071E2A000000000000000000000000259A6B14", _packets)
+
+    def test_native_sample_rate(self):
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            self.assertEqual(horus.modem_sample_rate, 48000)
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000, native_rate=True) as horus:
+            self.assertEqual(horus.modem_sample_rate, 8000)
+        with HorusLib(mode=Mode.RTTY_7N1, sample_rate=44100, native_rate=True) as horus:
+            self.assertEqual(horus.modem_sample_rate, 48000)
+        with self.assertRaises(ValueError):
+            HorusLib(mode=Mode.BINARY, rate=300, sample_rate=8000, modem_sample_rate=8000)
+
+        # By default the 8 kHz recording is resampled, and decodes the same as at 48 kHz.
+        _packets = self.demodulate_file("horus_v2_100bd.raw", mode=Mode.BINARY, sample_rate=8000)
+        self.assertEqual(_packets, self.demodulate_file("horus_v2_100bd.raw", mode=Mode.BINARY, sample_rate=8000, modem_sample_rate=48000))
+        self.assertEqual([x[4:6] for x in _packets], ["03", "04", "07", "08"])
+
+        # This is a weak recording, and the native 8 kHz modem loses the first packet.
+        _native = self.demodulate_file("horus_v2_100bd.raw", mode=Mode.BINARY, sample_rate=8000, native_rate=True)
+        self.assertEqual(_native, _packets[1:])
+
+    def test_rx_hex_output(self):
+        # horus_rx() returns the same packets as horus_rx_bytes(), as hex.
+        for _filename in ["horus_v3_100bd_8000_s16.raw", "horus_v2_100bd.raw"]:
+            with open(os.path.join(self.SAMPLES_DIR, _filename), "rb") as f:
+                data = f.read()
+            _bytes = []
+            _hex = []
+            with HorusLib(mode=Mode.BINARY, sample_rate=8000, native_rate=True) as horus_bytes, HorusLib(mode=Mode.BINARY, sample_rate=8000, native_rate=True) as horus_hex:
+                _ascii_out = ffi.new("char[]", horus_api.horus_get_max_ascii_out_len(horus_hex.hstates))
+                _offset = 0
+                while _offset + 2 * horus_bytes.nin <= len(data):
+                    _block = data[_offset:_offset + 2 * horus_bytes.nin]
+                    _offset += len(_block)
+                    _frame = horus_bytes.demodulate(_block)
+                    _bytes.append((_frame.data.hex().upper(), _frame.crc_pass))
+                    horus_api.horus_rx(horus_hex.hstates, _ascii_out, ffi.from_buffer("short[]", _block), 0)
+                    _hex.append((ffi.string(_ascii_out).decode("ascii"), bool(horus_api.horus_crc_ok(horus_hex.hstates))))
+            self.assertEqual(_hex, _bytes)
+            self.assertTrue(any(x[1] for x in _bytes))
+
+    def test_demodulate_many(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            data = f.read()
+
+        _expected = self.demodulate_file("horus_v3_100bd_8000_s16.raw", mode=Mode.BINARY, sample_rate=8000)
+        self.assertEqual(len(_expected), 9)
+
+        # Feed the file in odd sized chunks, to exercise the leftover handling
+        _frames = []
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            for i in range(0, len(data), 12346):
+                _frames.extend(horus.demodulate_many(data[i:i+12346]))
+
+        _packets = [x.data.hex().upper() for x in _frames if x.crc_pass]
+        self.assertEqual(_packets, _expected)
+        _offsets = [x.sample_offset for x in _frames]
+        self.assertEqual(_offsets, sorted(_offsets))
+        self.assertLess(_offsets[-1], len(data) // 2)
+
+        # Packets are reported from where they start, which is every 9.96 seconds in this recording.
+        _starts = [x.sample_offset for x in _frames if x.crc_pass]
+        self.assertLess(_starts[0], 800)
+        for (_a, _b) in zip(_starts, _starts[1:]):
+            self.assertAlmostEqual(_b - _a, 79680, delta=80)
+
+        # Block at a time gives the same packets, at the same places.
+        _block_frames = []
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            _offset = 0
+            while _offset + 2 * horus.audio_nin <= len(data):
+                _block = data[_offset:_offset + 2 * horus.audio_nin]
+                _offset += len(_block)
+                _block_frames.extend(horus.demodulate_packets(_block))
+        self.assertEqual([(x.data, x.sample_offset) for x in _block_frames if x.crc_pass], [(x.data, x.sample_offset) for x in _frames if x.crc_pass])
+
+    def test_demodulate_file(self):
+        _filename = os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw")
+        with open(_filename, "rb") as f:
+            data = f.read()
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            _expected = horus.demodulate_many(data)
+
+        # Small windows, so the leftover samples between windows are exercised.
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            _frames = [x for _window in demodulate_file(horus, _filename, window_seconds=1.37) for x in _window]
+
+        self.assertEqual(len([x for x in _frames if x.crc_pass]), 9)
+        self.assertEqual([(x.data, x.sample_offset) for x in _frames], [(x.data, x.sample_offset) for x in _expected])
+
+        # The file is unmapped when the generator finishes, or is closed early.
+        _maps = []
+
+        class _TrackedMap(mmap.mmap):
+            def __new__(cls, *args, **kwargs):
+                _maps.append(super().__new__(cls, *args, **kwargs))
+                return _maps[-1]
+
+        with patch("mmap.mmap", _TrackedMap), HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            for _window in demodulate_file(horus, _filename):
+                pass
+            self.assertTrue(_maps[-1].closed)
+
+            _windows = demodulate_file(horus, _filename, window_seconds=1.37)
+            next(_windows)
+            self.assertFalse(_maps[-1].closed)
+            _windows.close()
+            self.assertTrue(_maps[-1].closed)
+
+    def test_add_samples_large_chunk(self):
+        # Push a whole file in one go, which must not drop any samples.
+        _packets = []
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            data = f.read()
+        with HorusLib(mode=Mode.BINARY, stereo_iq=True, callback=lambda x: _packets.append(x.data.hex().upper())) as horus:
+            horus.set_estimator_limits(1000, 20000)
+            horus.add_samples(data)
+            self.assertEqual(horus.input_buffer.overruns, 0)
+        self.assertIn("000900071E2A000000000000000000000000259A6B14", _packets)
+
+    def test_stats_snapshot(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v2_100bd.raw"), "rb") as f:
+            data = f.read()
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            horus.demodulate_many(data[:len(data) // 2])
+            _stats = horus.get_stats()
+            _full = horus.stats
+            self.assertIsNone(_stats.eye_diagram)
+            self.assertIsNone(_stats.fft)
+            self.assertAlmostEqual(_stats.snr, _full.snr_est, places=3)
+            self.assertAlmostEqual(_stats.ppm, _full.clock_offset, places=3)
+            self.assertEqual(_stats.f_est, tuple(_full.f_est[0:horus.mfsk]))
+
+            # Cached until the next block, and extra parts are only fetched when asked for
+            self.assertIs(horus.get_stats(), _stats)
+            _detail = horus.get_stats(eye_diagram=True, fft=True)
+            self.assertIs(horus.get_stats(eye_diagram=True), _detail)
+            self.assertEqual(_detail.snr, _stats.snr)
+            self.assertEqual(len(_detail.eye_diagram), _full.neyetr)
+            self.assertEqual(_detail.eye_diagram[-1], list(_full.rx_eye[_full.neyetr - 1][0:_full.neyesamp]))
+            self.assertGreater(max(_detail.fft), 0)
+
+            _frame = horus.demodulate(data[len(data) // 2:len(data) // 2 + horus.nin * 2])
+            self.assertIsNot(horus.get_stats(), _stats)
+            self.assertEqual(_frame.snr, horus.get_stats().snr)
+
+    def test_timing(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v2_100bd.raw"), "rb") as f:
+            data = f.read()
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            horus.demodulate_many(data[:len(data) // 2])
+            self.assertEqual(horus.get_timing()["rx"], (0.0, 0))
+
+            horus.enable_timing()
+            _blocks = horus.blocks
+            horus.demodulate_many(data)
+            _timing = horus.get_timing(reset=True)
+            # blocks counts every modem block, not each demodulate_many() call.
+            self.assertEqual(horus.blocks - _blocks, _timing["rx"][1])
+            # Every block goes through the demod and UW search, packet extraction only once a UW is found.
+            for _stage in ("freq_est", "demod", "find_uw"):
+                self.assertEqual(_timing[_stage][1], _timing["rx"][1])
+            self.assertGreater(_timing["rx"][1], len(data) // 2 // (horus.nin + 1))
+            self.assertTrue(0 < _timing["extract"][1] <= _timing["rx"][1])
+            self.assertLessEqual(sum(_timing[x][0] for x in TIMING_STAGES[:-1]), _timing["rx"][0])
+            self.assertGreater(_timing["freq_est"][0], 0)
+            self.assertEqual(horus.get_timing()["rx"], (0.0, 0))
+
+    def test_stats_formats(self):
+        from .demodstats import FSKDemodStats
+        _stats = StatsSnapshot(snr=12.3456, ppm=-3.21, foff=5.5, rx_timing=0.25, f_est=(1000.04, 1270.0, 1540.0, 1810.0))
+
+        _compact = format_stats(_stats, 4, compact=True)
+        self.assertEqual(json.loads(_compact), {"EbNodB": 12.35, "ppm": -3.21, "f1_est": 1000.04, "f2_est": 1270.0, "f3_est": 1540.0, "f4_est": 1810.0})
+        self.assertNotIn(" ", _compact)
+
+        _record = pack_stats(_stats, 4, channel=2, block=1234)
+        self.assertEqual(len(_record), STATS_RECORD.size)
+        _unpacked = unpack_stats(_record)
+        self.assertEqual((_unpacked["channel"], _unpacked["block"]), (2, 1234))
+        self.assertAlmostEqual(_unpacked["f4_est"], 1810.0)
+        self.assertNotIn("f3_est", unpack_stats(pack_stats(_stats, 2)))
+        with self.assertRaises(ValueError):
+            unpack_stats(bytes(STATS_RECORD.size))
+
+        # Both can go straight into the uploader's stats parser
+        for _input in (_compact, _unpacked):
+            _parser = FSKDemodStats()
+            _parser.update(_input)
+            self.assertAlmostEqual(_parser.snr, 12.35, places=2)
+            self.assertAlmostEqual(_parser.fest_spacing, 270.0, places=1)
+
+    def test_stats_rate(self):
+        def _run(*options):
+            with tempfile.TemporaryDirectory() as _dir:
+                _stats = os.path.join(_dir, "stats")
+                _argv = sys.argv
+                sys.argv = ["horus_demod", "--sample-rate", "8000", *options, "--stats-output", _stats, os.path.join(self.SAMPLES_DIR, "horus_v2_100bd.raw"), os.path.join(_dir, "out")]
+                try:
+                    main()
+                finally:
+                    sys.argv = _argv
+                with open(_stats, "rb") as f:
+                    return f.read()
+
+        _every = _run("--stats", "1", "--stats-format", "compact").splitlines()
+        _decimated = _run("--stats", "8", "--stats-format", "compact").splitlines()
+        self.assertEqual(len(_decimated), math.ceil(len(_every) / 8))
+        self.assertEqual(_decimated[1], _every[8])
+
+        _binary = _run("--stats", "8", "--stats-format", "binary")
+        self.assertEqual(len(_binary), len(_decimated) * STATS_RECORD.size)
+        _records = [unpack_stats(_binary[i:i + STATS_RECORD.size]) for i in range(0, len(_binary), STATS_RECORD.size)]
+        self.assertEqual([x["block"] for x in _records[:3]], [1, 9, 17])
+        self.assertAlmostEqual(_records[1]["EbNodB"], json.loads(_decimated[1])["EbNodB"], places=2)
+
+    def test_frames(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v2_100bd.raw"), "rb") as f:
+            data = f.read()
+
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+            _batch = [x for x in horus.demodulate_many(data) if x.crc_pass]
+        _frames = []
+        with HorusLib(mode=Mode.BINARY, sample_rate=8000, frame_detail=True) as horus:
+            i = 0
+            while i < len(data):
+                _nin = horus.audio_nin
+                _frame = horus.demodulate(data[i:i + _nin * 2])
+                i += _nin * 2
+                if _frame.data:
+                    _frames.append(_frame)
+                    self.assertIsNotNone(_frame.extended_stats.eye_diagram)
                 else:
-                    sys.stderr.write(json.dumps(stats_out)+"\n")
+                    self.assertIsNone(_frame.extended_stats)
+
+        self.assertEqual([x.data for x in _frames if x.crc_pass], [x.data for x in _batch])
+        for (_a, _b) in zip(_batch, [x for x in _frames if x.crc_pass]):
+            self.assertEqual(len(_a.f_est), 4)
+            self.assertEqual(_a.f_est, _b.f_est)
+            self.assertAlmostEqual(_a.ppm, _b.ppm, places=3)
+            self.assertTrue(_a.sync)
+
+        with self.assertRaises(AttributeError):
+            _batch[0].snr = 0
+        with self.assertRaises(AttributeError):
+            _batch[0].extra = 0
+
+class MultiHorusLibTests(unittest.TestCase):
+    SAMPLES_DIR = HorusLibTests.SAMPLES_DIR
+
+    def test_channels(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            data = f.read()
+
+        with HorusLib(mode=Mode.BINARY, stereo_iq=True) as horus:
+            horus.set_estimator_limits(1000, 20000)
+            _expected = [x.data for x in horus.demodulate_many(data)]
+        self.assertIn(bytes.fromhex("000900071E2A000000000000000000000000259A6B14"), _expected)
+
+        # The signal is only in the upper window, and resampling is done once for all channels
+        _callbacks = []
+        with MultiHorusLib(channels=[(-20000, -1000), (1000, 20000)], stereo_iq=True, sample_rate=44100, callback=lambda frame, channel: _callbacks.append(channel)) as horus:
+            _results = [[], []]
+            _resampled = bytes(Resampler(48000, 44100, channels=2).process(data))
+            for i in range(0, len(_resampled), 17640):
+                for (_channel, _frames) in enumerate(horus.add_samples(_resampled[i:i + 17640])):
+                    _results[_channel].extend(_frames)
+            self.assertEqual(len(horus.get_stats()), 2)
+
+        self.assertEqual([x for x in _results[0] if x.crc_pass], [])
+        self.assertIn(bytes.fromhex("000900071E2A000000000000000000000000259A6B14"), [x.data for x in _results[1] if x.crc_pass])
+        self.assertEqual(set(_callbacks), {1})
+
+        # horus_demod writes each channel to its own output, and closes them on exit.
+        _opened = []
+        _open = open
+
+        def _tracking_open(*args, **kwargs):
+            _opened.append(_open(*args, **kwargs))
+            return _opened[-1]
+
+        with tempfile.TemporaryDirectory() as _dir:
+            _outputs = [os.path.join(_dir, x) for x in ("lower", "upper", "main")]
+            _argv = ["horus_demod", "-q", f"--channel=-20000:-1000:{_outputs[0]}", f"--channel=1000:20000:{_outputs[1]}", os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), _outputs[2]]
+            with patch.object(sys, "argv", _argv), patch("builtins.open", _tracking_open):
+                main()
+            self.assertTrue(all(x.closed for x in _opened))
+            with open(_outputs[1]) as f:
+                self.assertIn("000900071E2A000000000000000000000000259A6B14", f.read().split())
+            self.assertEqual(os.path.getsize(_outputs[0]), 0)
+
+    def test_channelizer(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            data = f.read()
+
+        # The signal is around 5.7-6.5 kHz, so only the second channel should find it.
+        with MultiHorusLib(channels=[(-8000, -4000), (4000, 8000)], stereo_iq=True, channel_rate=8000) as horus:
+            self.assertEqual(horus.modem_sample_rate, 8000)
+            _results = [[], []]
+            for i in range(0, len(data), 19200):
+                for (_channel, _frames) in enumerate(horus.demodulate_many(data[i:i + 19200])):
+                    _results[_channel].extend(_frames)
+
+        self.assertEqual([x for x in _results[0] if x.crc_pass], [])
+        _good = [x for x in _results[1] if x.crc_pass]
+        self.assertEqual([x.data for x in _good], [bytes.fromhex("000900071E2A000000000000000000000000259A6B14")])
+        self.assertLess(_good[0].sample_offset, len(data) // 4)
+        self.assertTrue(all(-2000 < x < 2000 for x in _good[0].f_est))
+
+        with self.assertRaises(ValueError):
+            MultiHorusLib(channels=[(0, 10000)], stereo_iq=True, channel_rate=8000)
+
+        # Channels must fit in the channelizer filter's passband, 90% of the channel rate.
+        with MultiHorusLib(channels=[(0, 7200)], stereo_iq=True, channel_rate=8000):
+            pass
+        with self.assertRaises(ValueError):
+            MultiHorusLib(channels=[(0, 7201)], stereo_iq=True, channel_rate=8000)
+        with self.assertRaises(ValueError):
+            MultiHorusLib(channels=[(0, 7600)], stereo_iq=True, channel_rate=8000)
 
 # workaround for poetry install script
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Run main() from the package module rather than __main__, so Mode etc. are the same classes the
+    # --jobs worker processes import.
+    from horusdemodlib.demod import main as _main
+    _main()
\ No newline at end of file
@@ -28,7 +28,8 @@ class FSKDemodStats(object):
     The test script below will emulate relatime input based on a file.
     """
 
-    FSK_STATS_FIELDS = ['EbNodB', 'ppm', 'f1_est', 'f2_est', 'samp_fft']
+    # samp_fft isn't in horus_demod's compact stats lines, and is just passed through, so it's optional.
+    FSK_STATS_FIELDS = ['EbNodB', 'ppm', 'f1_est', 'f2_est']
 
 
     def __init__(self,
@@ -100,7 +101,7 @@ class FSKDemodStats(object):
 
         # Now we can process the data.
         _time = time.time()
-        self.fft = _data['samp_fft']
+        self.fft = _data.get('samp_fft', [])
         self.fest = [0.0,0.0,0.0,0.0]
         self.fest[0] = _data['f1_est']
         self.fest[1] = _data['f2_est']
@@ -120,6 +120,18 @@ def preprocess_h():
 #define HORUS_RTTY_8N2_NUM_BITS                  1320 
 #define HORUS_RTTY_DEFAULT_BAUD                 100
 
+#define HORUS_TIMING_FREQ_EST           0
+#define HORUS_TIMING_DEMOD              1
+#define HORUS_TIMING_FIND_UW            2
+#define HORUS_TIMING_EXTRACT            3
+#define HORUS_TIMING_RX                 4
+#define HORUS_TIMING_STAGES             5
+
+struct horus_timing {
+    uint64_t    ns[5];                                /* total time spent in each stage (ns) */
+    uint64_t    calls[5];                             /* number of times each stage ran      */
+};
+
 struct horus;
 struct MODEM_STATS;
 
@@ -176,6 +188,62 @@ uint32_t      horus_nin   (struct horus *hstates);
       
 int           horus_rx    (struct horus *hstates, char ascii_out[], short demod_in[], int quadrature);
 
+/* As horus_rx(), but returns binary packets as raw bytes rather than hex, and RTTY text without a terminator */
+
+int           horus_rx_bytes (struct horus *hstates, uint8_t payload_out[], int *payload_len, short demod_in[], int quadrature);
+
+/* largest ascii_out[] needed by any mode, see horus_get_max_ascii_out_len() */
+
+#define HORUS_MAX_ASCII_OUT_LEN        257
+
+/* largest payload_out[] needed by any mode, see horus_get_max_payload_len() */
+
+#define HORUS_MAX_PAYLOAD_LEN          128
+
+/* A packet found by horus_rx_packets() or horus_rx_batch() */
+
+struct horus_packet {
+    uint32_t    sample_offset;                        /* start of the nin block (in samples from start of demod_in[]) the packet was completed in */
+    uint64_t    uw_sample;                            /* start of the packet's unique word (in samples since horus_open()) */
+    int         crc_ok;                               /* packet checksum results             */
+    float       snr_est;                              /* SNR estimate when packet was found  */
+    float       clock_offset;                         /* tx/rx sample clock offset (ppm)     */
+    float       f_est[4];                             /* tone frequency estimates (Hz)       */
+    int         payload_len;                          /* bytes in payload[]                  */
+    uint8_t     payload[128];                         /* packet / text, as for horus_rx_bytes() */
+};
+
+/* Scalar modem statistics, see horus_get_stats() */
+
+struct horus_stats {
+    float       snr_est;                              /* SNR estimate in 3000 Hz (dB)        */
+    float       clock_offset;                         /* tx/rx sample clock offset (ppm)     */
+    float       foff;                                 /* estimated freq offset (Hz)          */
+    float       rx_timing;                            /* estimated timing offset (samples)   */
+    int         mfsk;                                 /* number of valid f_est entries       */
+    float       f_est[4];                             /* tone frequency estimates (Hz)       */
+    int         neyetr;                               /* eye diagram traces                  */
+    int         neyesamp;                             /* samples per eye diagram trace       */
+    int         nfft;                                 /* bins in the horus_get_fft() spectrum */
+};
+
+/* As horus_rx_bytes(), but returns every packet completed in this block, see horus_api.h */
+
+int           horus_rx_packets (struct horus *hstates, struct horus_packet packets[], int max_packets, short demod_in[], int quadrature);
+
+/*
+ * Demodulate an arbitrary number of samples, calling horus_rx_packets() on as many
+ * horus_nin() sized blocks as are available.
+ *
+ * Returns the number of packets written to packets[]. Processing stops early if
+ * max_packets are found, so check *nconsumed and call again with the remaining
+ * samples.
+ */
+
+int           horus_rx_batch (struct horus *hstates, struct horus_packet packets[], int max_packets,
+                              short demod_in[], uint32_t nsamples, int quadrature, uint32_t *nconsumed,
+                              uint32_t *nblocks);
+
 /* set verbose level */
       
 void horus_set_verbose(struct horus *hstates, int verbose);
@@ -186,17 +254,27 @@ int           horus_get_version              (void);
 int           horus_get_mode                 (struct horus *hstates);
 int           horus_get_Fs                   (struct horus *hstates);      
 int           horus_get_mFSK                 (struct horus *hstates);      
+int           horus_get_max_packet_len       (struct horus *hstates);      /* longest packet, in bits */
 void          horus_get_modem_stats          (struct horus *hstates, int *sync, float *snr_est);
 void          horus_get_modem_extended_stats (struct horus *hstates, struct MODEM_STATS *stats);
+void          horus_get_stats                (struct horus *hstates, struct horus_stats *stats);
+void          horus_get_eye                  (struct horus *hstates, float eye[]);
+void          horus_get_fft                  (struct horus *hstates, float fft[]);
 int           horus_crc_ok                   (struct horus *hstates);
 int           horus_get_total_payload_bits   (struct horus *hstates);
 void          horus_set_total_payload_bits   (struct horus *hstates, int val);
 void          horus_set_freq_est_limits      (struct horus *hstates, float fsk_lower, float fsk_upper);
 
-/* how much storage you need for demod_in[] and  ascii_out[] */
+/* how much storage you need for demod_in[], ascii_out[] and payload_out[] */
       
 int           horus_get_max_demod_in         (struct horus *hstates);
 int           horus_get_max_ascii_out_len    (struct horus *hstates);
+int           horus_get_max_payload_len      (struct horus *hstates);
+
+/* per-stage timing of horus_rx() */
+
+void          horus_set_timing               (struct horus *hstates, int enable);
+void          horus_get_timing               (struct horus *hstates, struct horus_timing *timing, int reset);
 
 
 
@@ -283,6 +361,25 @@ struct MODEM_STATS {
    
 };
 
+struct RESAMPLER;
+
+struct RESAMPLER *resampler_create(int L, int M, float taps[], int ntaps, int channels);
+void resampler_destroy(struct RESAMPLER *r);
+void resampler_reset(struct RESAMPLER *r);
+int  resampler_max_out(struct RESAMPLER *r, int nin);
+int  resampler_process_s16(struct RESAMPLER *r, short out[], short in[], int nin);
+int  resampler_process_float(struct RESAMPLER *r, float out[], float in[], int nin);
+
+struct DDC;
+
+struct DDC *ddc_create(int Fs, int D, float fc, float taps[], int ntaps);
+void ddc_destroy(struct DDC *d);
+void ddc_reset(struct DDC *d);
+int  ddc_max_out(struct DDC *d, int nin);
+int  ddc_process_s16(struct DDC *d, short out[], short in[], int nin);
+
+void convert_f32_to_s16(short out[], float in[], int n);
+
 int horus_l2_get_num_tx_data_bytes(int num_payload_data_bytes);
 
 /* call this first */
@@ -317,6 +414,9 @@ ffibuilder.set_source("_horus_api_cffi",
 """
      #include "horus_api.h"   // the C header of the library
      #include "horus_l2.h"
+     #include "resampler.h"
+     #include "ddc.h"
+     #include "convert.h"
 """,
       sources=[
         "./src/fsk.c",
@@ -329,6 +429,9 @@ ffibuilder.set_source("_horus_api_cffi",
         "./src/phi0.c",
         "./src/horus_api.c",
         "./src/horus_l2.c",
+        "./src/resampler.c",
+        "./src/ddc.c",
+        "./src/convert.c",
       ],
        include_dirs = [ "./src"],
        extra_compile_args = ["-DHORUS_L2_RX","-DINTERLEAVER","-DSCRAMBLER","-DRUN_TIME_TABLES"],
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Input Formats
+#
+#   Reads WAV files, and raw float32 / unsigned 8-bit / signed 16-bit samples,
+#   converting them to the signed 16-bit samples the modem takes, so recordings
+#   don't need to go through sox or csdr first.
+#
+import _horus_api_cffi
+import io
+import os
+import struct
+import unittest
+from array import array
+from .rtltcp import u8_to_s16
+
+horus_api = _horus_api_cffi.lib
+ffi = _horus_api_cffi.ffi
+
+INPUT_FORMATS = ["s16", "u8", "f32", "wav"]
+
+# Bytes per sample of each raw format
+SAMPLE_BYTES = {"s16": 2, "u8": 1, "f32": 4}
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Data chunk sizes written by programs which don't know how long the recording will be
+_WAV_STREAMING_SIZES = (0, 0xFFFFFFFF)
+
+
+class WavInfo():
+    """
+    Format of a WAV file, from its header.
+
+    Attributes
+    ----------
+
+    format : str
+        Raw sample format of the data ("s16", "u8" or "f32")
+    channels : int
+        Number of interleaved channels
+    sample_rate : int
+        Sample rate (Hz)
+    data_size : int
+        Length of the sample data (bytes), or None if the header doesn't say
+    """
+
+    __slots__ = ("format", "channels", "sample_rate", "data_size")
+
+    def __init__(self, format: str, channels: int, sample_rate: int, data_size=None):
+        self.format = format
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.data_size = data_size
+
+
+def _read_exactly(read, size: int) -> bytes:
+    _data = b""
+    while len(_data) < size:
+        _chunk = read(size - len(_data))
+        if not _chunk:
+            raise ValueError("WAV header is truncated")
+        _data += _chunk
+    return _data
+
+
+def read_wav_header(read) -> WavInfo:
+    """
+    Read a WAV header using read(n), leaving the stream at the start of the sample data.
+
+    Only reads forwards, so works on pipes. Raises ValueError for anything that isn't
+    8-bit or 16-bit PCM, or 32-bit float.
+    """
+    (_riff, _, _wave) = struct.unpack("<4sI4s", _read_exactly(read, 12))
+    if _riff != b"RIFF" or _wave != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    _fmt = None
+    while True:
+        (_id, _size) = struct.unpack("<4sI", _read_exactly(read, 8))
+        if _id == b"data":
+            break
+
+        if _size in _WAV_STREAMING_SIZES:
+            raise ValueError(f"WAV {_id!r} chunk has no length")
+
+        # Chunks are padded to an even length
+        _body = _read_exactly(read, _size + (_size & 1))
+        if _id == b"fmt ":
+            _fmt = _body[:_size]
+
+    if _fmt is None or len(_fmt) < 16:
+        raise ValueError("WAV file has no format chunk before its data")
+
+    (_tag, _channels, _sample_rate, _, _, _bits) = struct.unpack_from("<HHIIHH", _fmt)
+    if _tag == WAVE_FORMAT_EXTENSIBLE and len(_fmt) >= 26:
+        # The real format is the first two bytes of the sub-format GUID
+        _tag = struct.unpack_from("<H", _fmt, 24)[0]
+
+    _format = {
+        (WAVE_FORMAT_PCM, 8): "u8",
+        (WAVE_FORMAT_PCM, 16): "s16",
+        (WAVE_FORMAT_IEEE_FLOAT, 32): "f32",
+    }.get((_tag, _bits))
+    if _format is None:
+        raise ValueError(f"Unsupported WAV format {_tag:#06x} with {_bits} bit samples, only 8/16-bit PCM and 32-bit float are supported")
+
+    return WavInfo(_format, _channels, _sample_rate, None if _size in _WAV_STREAMING_SIZES else _size)
+
+
+class SampleReader():
+    """
+    Wraps a read(n) function returning samples in some other format, so it returns signed 16-bit samples instead.
+
+    Example usage:
+
+    with open("recording.wav", "rb") as f:
+        reader = SampleReader(f.read, "wav")
+        with HorusLib(mode=Mode.BINARY, sample_rate=reader.sample_rate, stereo_iq=(reader.channels == 2)) as horus:
+            while True:
+                data = reader.read(horus.nin * 2)
+                if not data:
+                    break
+                horus.add_samples(data)
+    """
+
+    def __init__(self, read, input_format="s16"):
+        """
+        Parameters
+        ----------
+        read : function
+            read(n) function of the input, returning b'' at the end of the stream
+        input_format : str
+            One of INPUT_FORMATS. For "wav" the header is read straight away.
+        """
+        if input_format not in INPUT_FORMATS:
+            raise ValueError(f"Unknown input format {input_format}")
+
+        self._read = read
+        self.channels = None
+        self.sample_rate = None
+        self._remaining = None
+
+        if input_format == "wav":
+            _info = read_wav_header(read)
+            input_format = _info.format
+            self.channels = _info.channels
+            self.sample_rate = _info.sample_rate
+            self._remaining = _info.data_size
+
+        self.format = input_format
+        self.sample_bytes = SAMPLE_BYTES[input_format]
+        self._pending = b""
+        self._out = None
+
+    def _read_raw(self, size: int) -> bytes:
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+            if size == 0:
+                return b""
+        _data = self._read(size)
+        if self._remaining is not None:
+            self._remaining -= len(_data)
+        return _data
+
+    def read(self, size: int):
+        """
+        Read up to size bytes of signed 16-bit samples (fewer if the underlying read returns less).
+
+        Returns b'' at the end of the stream. Converted data is only valid until the next call.
+        """
+        if self.format == "s16":
+            return self._read_raw(size)
+
+        _data = self._read_raw((size // 2) * self.sample_bytes)
+        if not _data:
+            return b""
+
+        if self.format == "u8":
+            if self._out is None or len(self._out) < 2 * len(_data):
+                self._out = bytearray(2 * len(_data))
+            return memoryview(u8_to_s16(_data, self._out))[:2 * len(_data)]
+
+        # Only convert whole samples, keeping any partial one for next time.
+        if self._pending:
+            _data = self._pending + _data
+        _whole = len(_data) - (len(_data) % self.sample_bytes)
+        self._pending = _data[_whole:]
+
+        _n = _whole // self.sample_bytes
+        if _n == 0:
+            return self.read(size)
+        if self._out is None or len(self._out) < _n:
+            self._out = ffi.new("short[]", _n)
+        horus_api.convert_f32_to_s16(self._out, ffi.from_buffer("float[]", memoryview(_data)[:_whole]), _n)
+        return memoryview(ffi.buffer(self._out, _n * 2))
+
+
+def wav_header(format: str, channels: int, sample_rate: int, data_size: int, extra_chunks=b"", extensible=False) -> bytes:
+    """ Build a WAV header, for tests """
+    _tag = WAVE_FORMAT_IEEE_FLOAT if format == "f32" else WAVE_FORMAT_PCM
+    _bits = SAMPLE_BYTES[format] * 8
+    _align = channels * SAMPLE_BYTES[format]
+    _fmt = struct.pack("<HHIIHH", WAVE_FORMAT_EXTENSIBLE if extensible else _tag, channels, sample_rate, sample_rate * _align, _align, _bits)
+    if extensible:
+        _fmt += struct.pack("<HHIH14s", 22, _bits, 0, _tag, b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xAA\x00\x38\x9B\x71")
+    _chunks = b"fmt " + struct.pack("<I", len(_fmt)) + _fmt + extra_chunks
+    return b"RIFF" + struct.pack("<I", 4 + len(_chunks) + 8 + data_size) + b"WAVE" + _chunks + b"data" + struct.pack("<I", data_size)
+
+
+class SampleReaderTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def setUp(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            self.s16 = f.read()
+
+    def demodulate(self, reader, read_size=1000, **kwargs):
+        from .demod import HorusLib, Mode
+        _packets = []
+        with HorusLib(mode=Mode.BINARY, callback=lambda x: _packets.append(x.data) if x.crc_pass else None, **kwargs) as horus:
+            while True:
+                data = reader.read(read_size)
+                if not data:
+                    break
+                horus.add_samples(data)
+        return _packets
+
+    def test_formats(self):
+        _samples = array("h", self.s16)
+        # Run the modem at 8 kHz, so the samples go to it exactly as converted.
+        _expected = self.demodulate(SampleReader(io.BytesIO(self.s16).read), sample_rate=8000, native_rate=True)
+        self.assertEqual(len(_expected), 9)
+
+        _f32 = array("f", (x / 32768 for x in _samples)).tobytes()
+        _u8 = bytes((x >> 8) + 128 for x in _samples)
+
+        for (_name, _input, _format) in [
+            ("f32", _f32, "f32"),
+            ("u8", _u8, "u8"),
+            ("wav s16", wav_header("s16", 1, 8000, len(self.s16), extra_chunks=b"LIST\x03\x00\x00\x00abc\x00") + self.s16 + b"LIST", "wav"),
+            ("wav f32", wav_header("f32", 1, 8000, len(_f32), extensible=True) + _f32, "wav"),
+            ("wav u8", wav_header("u8", 1, 8000, len(_u8)) + _u8, "wav"),
+        ]:
+            with self.subTest(format=_name):
+                _reader = SampleReader(io.BytesIO(_input).read, _format)
+                if _format == "wav":
+                    self.assertEqual((_reader.sample_rate, _reader.channels), (8000, 1))
+                # Odd read size, to split up the float samples
+                self.assertEqual(self.demodulate(_reader, read_size=1001, sample_rate=8000, native_rate=True), _expected)
+
+    def test_f32_conversion(self):
+        _reader = SampleReader(io.BytesIO(array("f", [0.0, 0.5, -0.5, 1.0, -1.0, 2.0, -2.0]).tobytes()).read, "f32")
+        self.assertEqual(list(array("h", bytes(_reader.read(100)))), [0, 16384, -16384, 32767, -32767, 32767, -32768])
+
+    def test_invalid_wav(self):
+        with self.assertRaises(ValueError):
+            SampleReader(io.BytesIO(b"RIFX" + bytes(40)).read, "wav")
+        _header = bytearray(wav_header("s16", 1, 8000, 0))
+        _header[34] = 24  # 24-bit PCM
+        with self.assertRaises(ValueError):
+            SampleReader(io.BytesIO(bytes(_header)).read, "wav")
+
+
+if __name__ == "__main__":
+    unittest.main()
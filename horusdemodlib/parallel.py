@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Parallel File Demodulation
+#
+#   Splits one long recording into overlapping segments and demodulates them on a
+#   process pool, so reprocessing a single long capture can use every core.
+#
+import logging
+import math
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from .demod import HorusLib, Mode, Frame, demodulate_file
+
+# Time (seconds) the modem needs at the start of a segment to settle (frequency estimates,
+# symbol timing) before it can decode a packet.
+ACQUISITION_SECONDS = 5.0
+
+# Frames reported this close (seconds) to either side of a segment boundary are taken from
+# both segments, and then de-duplicated, so packets reported right on a boundary aren't lost.
+# This is also the most two segments' reports of the same packet can differ by.
+MERGE_MARGIN_SECONDS = 2.0
+
+
+def _demodulate_segment(filename, offset, first_sample, nsamples, keep_from, keep_to, estimator_limits, kwargs) -> list:
+    """
+    Process pool worker. Demodulates nsamples samples of a file starting at first_sample, and returns the frames
+    reported between samples keep_from and keep_to, with sample offsets counted from the start of the file.
+    """
+    with HorusLib(**kwargs) as horus:
+        if estimator_limits:
+            horus.set_estimator_limits(*estimator_limits)
+        _frame_bytes = 2 * (2 if horus.stereo_iq else 1)
+
+        frames = []
+        for _window in demodulate_file(horus, filename, offset=(offset + first_sample * _frame_bytes), length=(nsamples * _frame_bytes)):
+            for x in _window:
+                _offset = x.sample_offset + first_sample
+                if keep_from <= _offset < keep_to:
+                    frames.append(Frame(x.data, x.sync, x.crc_pass, x.snr, x.extended_stats, _offset, x.f_est, x.ppm))
+        return frames
+
+
+def merge_frames(segments, tolerance: int) -> list:
+    """
+    Merge the frames from overlapping segments into one list, in sample offset order, dropping duplicates.
+
+    Duplicates can only come from different segments: a frame is dropped if a frame with the same payload,
+    from another segment, and not already matched to a duplicate, is within tolerance samples of it. So
+    repeated identical packets (e.g. RTTY sentences) are all kept, however close together they are.
+
+    Parameters
+    ----------
+    segments : list of list of Frame
+        Frames found by each segment
+    tolerance : int
+        Largest difference (samples) between the offsets two segments report for the same packet
+    """
+    _tagged = sorted(
+        ((frame, _segment) for (_segment, frames) in enumerate(segments) for frame in frames),
+        key=lambda x: x[0].sample_offset
+    )
+
+    merged = []
+    _matched = []
+    for (frame, _segment) in _tagged:
+        _duplicate = False
+        for i in range(len(merged) - 1, -1, -1):
+            (_kept, _kept_segment) = merged[i]
+            if _kept.sample_offset < frame.sample_offset - tolerance:
+                break
+            if _kept_segment != _segment and not _matched[i] and _kept.data == frame.data:
+                _matched[i] = True
+                _duplicate = True
+                break
+        if not _duplicate:
+            merged.append((frame, _segment))
+            _matched.append(False)
+
+    return [x[0] for x in merged]
+
+
+def demodulate_file_parallel(filename: str, workers=None, offset=0, length=None, segment_seconds=None, overlap_seconds=None, estimator_limits=None, **kwargs) -> list:
+    """
+    Demodulate a recording on a process pool, splitting it into overlapping segments.
+
+    Each segment is demodulated from scratch, so it starts ACQUISITION_SECONDS before the part of the file
+    it is responsible for, to give the modem time to acquire the signal, and carries on for overlap_seconds
+    after it, so packets starting near its end can be received in full. Frames found by more than one
+    segment are merged.
+
+    Parameters
+    ----------
+    filename : str
+        Signed 16-bit recording
+    workers : int
+        Number of processes, defaults to the number of CPUs
+    offset : int
+        Byte offset of the first sample (e.g. after a WAV header)
+    length : int
+        Bytes of samples to process, to the end of the file if None
+    segment_seconds : float
+        Length of audio each segment is responsible for. Defaults to splitting the file into about two
+        segments per worker, but never less than three times the overlap.
+    overlap_seconds : float
+        Extra audio each segment demodulates after its own part of the file. Defaults to the longest packet
+        the mode can send.
+    estimator_limits : (float, float)
+        Frequency estimator limits (Hz)
+    **kwargs
+        Passed on to HorusLib (mode, rate, stereo_iq, sample_rate, etc.)
+
+    Returns
+    -------
+    list of Frame
+        Frames with data, in order, with sample_offset counted from the first sample of the file.
+    """
+    if kwargs.get("callback"):
+        raise ValueError("demodulate_file_parallel doesn't support callbacks")
+
+    workers = workers or os.cpu_count() or 1
+
+    # Work out the modem's timing, from a modem we don't otherwise use.
+    with HorusLib(**kwargs) as horus:
+        _rate = horus.audio_sample_rate
+        _frame_bytes = 2 * (2 if horus.stereo_iq else 1)
+        _max_packet_seconds = horus.max_packet_seconds
+
+    _size = os.path.getsize(filename) - offset
+    if length is not None:
+        _size = min(_size, length)
+    _nsamples = max(_size, 0) // _frame_bytes
+
+    if overlap_seconds is None:
+        overlap_seconds = _max_packet_seconds
+    _margin = int(MERGE_MARGIN_SECONDS * _rate)
+    _lead = int(ACQUISITION_SECONDS * _rate) + _margin
+    _overlap = int(overlap_seconds * _rate) + _margin
+    if segment_seconds is None:
+        _segment = max(math.ceil(_nsamples / (2 * workers)), 3 * (_lead + _overlap))
+    else:
+        _segment = int(segment_seconds * _rate)
+
+    # Frames are reported at the start of their packet, so each segment keeps the packets starting in its
+    # part of the file (give or take the margin), and reads on far enough to receive the last of them.
+    _jobs = []
+    for _start in range(0, _nsamples, _segment):
+        _end = min(_start + _segment, _nsamples)
+        _first = max(_start - _lead, 0)
+        _last = min(_end + _overlap, _nsamples)
+        _jobs.append((
+            filename, offset, _first, _last - _first,
+            (_start - _margin) if _start > 0 else 0,
+            (_end + _margin) if _end < _nsamples else _nsamples + 1,
+            estimator_limits, kwargs
+        ))
+    logging.debug(f"Demodulating {filename} as {len(_jobs)} segments of {_segment / _rate:.1f} s, with {_lead / _rate:.1f} s lead-in and {_overlap / _rate:.1f} s overlap, on {workers} processes.")
+
+    if len(_jobs) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(_jobs))) as executor:
+            segments = list(executor.map(_demodulate_segment, *zip(*_jobs)))
+    else:
+        segments = [_demodulate_segment(*_job) for _job in _jobs]
+
+    return merge_frames(segments, tolerance=_margin)
+
+
+class ParallelDemodTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def test_merge(self):
+        _frame = lambda data, offset: Frame(data, True, True, 0.0, sample_offset=offset)
+        _segments = [
+            [_frame(b"a", 90), _frame(b"a", 100), _frame(b"b", 120)],
+            [_frame(b"a", 95), _frame(b"a", 105), _frame(b"b", 300)],
+        ]
+        # The two close together "a" packets are both real, and each was seen by both segments.
+        self.assertEqual(
+            [(x.data, x.sample_offset) for x in merge_frames(_segments, tolerance=50)],
+            [(b"a", 90), (b"a", 100), (b"b", 120), (b"b", 300)]
+        )
+
+    def test_matches_serial(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw"), "rb") as f:
+            data = f.read()
+
+        with tempfile.NamedTemporaryFile(suffix=".raw") as f:
+            f.write(data * 3)
+            f.flush()
+
+            with HorusLib(mode=Mode.BINARY, sample_rate=8000) as horus:
+                _expected = [x for _window in demodulate_file(horus, f.name) for x in _window if x.crc_pass]
+            self.assertGreaterEqual(len(_expected), 27)
+
+            # Short segments, so several boundaries fall in the file.
+            _frames = demodulate_file_parallel(f.name, workers=2, segment_seconds=45, mode=Mode.BINARY, sample_rate=8000)
+
+        _frames = [x for x in _frames if x.crc_pass]
+        self.assertEqual([x.data for x in _frames], [x.data for x in _expected])
+        for (x, y) in zip(_frames, _expected):
+            self.assertLess(abs(x.sample_offset - y.sample_offset), 8000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Polyphase Resampler
+#
+#   Streaming rational (L/M) resampler, used to bring input audio to a sample rate
+#   the modem can run at. The filtering itself is done in C (src/resampler.c),
+#   a whole buffer of samples at a time.
+#
+import _horus_api_cffi
+import argparse
+import functools
+import logging
+import math
+import sys
+import time
+import unittest
+from array import array
+from unittest.mock import patch
+
+horus_api = _horus_api_cffi.lib
+ffi = _horus_api_cffi.ffi
+
+# Half-length of the prototype filter, in zero crossings of the (narrowest) sinc.
+DEFAULT_ZERO_CROSSINGS = 8
+
+# Kaiser window beta. 8.0 gives roughly 80 dB of stopband attenuation.
+DEFAULT_BETA = 8.0
+
+# Cutoff, as a fraction of the lower of the input and output Nyquist frequencies.
+DEFAULT_ROLLOFF = 0.9
+
+# Most input frames passed to the C resampler in one call, so its (32 bit) output count and scratch
+# buffer stay bounded however much audio is passed to process() at once.
+MAX_BLOCK_FRAMES = 1 << 20
+
+
+def _bessel_i0(x: float) -> float:
+    """ Zeroth order modified Bessel function of the first kind, for the Kaiser window """
+    _sum = 1.0
+    _term = 1.0
+    k = 1
+    while _term > 1e-12 * _sum:
+        _term *= (x / (2 * k)) ** 2
+        _sum += _term
+        k += 1
+    return _sum
+
+
+@functools.lru_cache(maxsize=None)
+def design_filter(up: int, down: int, zero_crossings=DEFAULT_ZERO_CROSSINGS, beta=DEFAULT_BETA, rolloff=DEFAULT_ROLLOFF) -> tuple:
+    """
+    Design a Kaiser windowed sinc low pass prototype filter for resampling by up/down.
+
+    The filter runs at up times the input rate, and its length is rounded up to a multiple of up
+    so it splits evenly into up polyphase branches. Results are cached per rate pair.
+    """
+    _factor = max(up, down)
+    _cutoff = rolloff * 0.5 / _factor
+    _ntaps = 2 * zero_crossings * _factor
+    _ntaps = int(math.ceil(_ntaps / up)) * up
+    _centre = (_ntaps - 1) / 2.0
+    _i0_beta = _bessel_i0(beta)
+
+    _taps = []
+    for n in range(_ntaps):
+        _t = n - _centre
+        _x = 2.0 * _cutoff * _t
+        _sinc = 1.0 if _x == 0 else math.sin(math.pi * _x) / (math.pi * _x)
+        _ratio = (2.0 * n / (_ntaps - 1)) - 1.0 if _ntaps > 1 else 0.0
+        _window = _bessel_i0(beta * math.sqrt(max(0.0, 1.0 - _ratio * _ratio))) / _i0_beta
+        _taps.append(2.0 * _cutoff * _sinc * _window)
+
+    return tuple(_taps)
+
+
+class Resampler():
+    """
+    Stateful streaming polyphase resampler.
+
+    Accepts interleaved signed 16-bit (process) or float32 (process_float) samples, with any
+    number of channels (use channels=2 for IQ input). Each call returns a view of the resampled
+    data, which is only valid until the next call.
+
+    Example usage:
+
+    resampler = Resampler(44100, 48000, channels=2)
+    while True:
+        data = f.read(8192)
+        if not data:
+            break
+        horus.demodulate_many(resampler.process(data))
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, channels=1, zero_crossings=DEFAULT_ZERO_CROSSINGS):
+        """
+        Parameters
+        ----------
+        input_rate : int
+            Input sample rate (Hz)
+        output_rate : int
+            Output sample rate (Hz)
+        channels : int
+            Number of interleaved channels, 2 for IQ.
+        zero_crossings : int
+            Prototype filter half-length. Larger values give a sharper filter at the cost of CPU.
+        """
+        if input_rate <= 0 or output_rate <= 0:
+            raise ValueError("Sample rates must be positive")
+
+        _gcd = math.gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.up = output_rate // _gcd
+        self.down = input_rate // _gcd
+        self.channels = channels
+
+        _taps = design_filter(self.up, self.down, zero_crossings)
+        self._state = ffi.gc(
+            horus_api.resampler_create(self.up, self.down, ffi.new("float[]", _taps), len(_taps), channels),
+            horus_api.resampler_destroy
+        )
+
+        self._out_s16 = ffi.new("short[]", 0)
+        self._out_float = ffi.new("float[]", 0)
+
+    def reset(self) -> None:
+        """ Clear the filter history, e.g. before starting on a new stream """
+        horus_api.resampler_reset(self._state)
+
+    def process(self, data) -> memoryview:
+        """
+        Resample a buffer of interleaved signed 16-bit samples (any bytes-like object).
+
+        Returns a view of the resampled signed 16-bit samples.
+        """
+        data_in = ffi.from_buffer("short[]", data)
+        self._out_s16 = self._reserve(self._out_s16, "short[]", len(data_in) // self.channels)
+        _nout = self._run(horus_api.resampler_process_s16, self._out_s16, data_in)
+        return memoryview(ffi.buffer(self._out_s16, _nout * self.channels * 2))
+
+    def process_float(self, data) -> memoryview:
+        """
+        Resample a buffer of interleaved float32 samples (any bytes-like object).
+
+        Returns a view of the resampled float32 samples.
+        """
+        data_in = ffi.from_buffer("float[]", data)
+        self._out_float = self._reserve(self._out_float, "float[]", len(data_in) // self.channels)
+        _nout = self._run(horus_api.resampler_process_float, self._out_float, data_in)
+        return memoryview(ffi.buffer(self._out_float, _nout * self.channels * 4)).cast("f")
+
+    def _reserve(self, out, ctype: str, nin: int):
+        """ Grow an output buffer to hold the output for nin input frames, passed to the C resampler in blocks """
+        _max_out = 0
+        for _start in range(0, nin, MAX_BLOCK_FRAMES):
+            _max_out += horus_api.resampler_max_out(self._state, min(nin - _start, MAX_BLOCK_FRAMES))
+        _max_out *= self.channels
+        if len(out) < _max_out:
+            out = ffi.new(ctype, _max_out)
+        return out
+
+    def _run(self, process, out, data_in) -> int:
+        """ Resample data_in into out, MAX_BLOCK_FRAMES at a time, returning the number of output frames """
+        _nin = len(data_in) // self.channels
+        _nout = 0
+        for _start in range(0, _nin, MAX_BLOCK_FRAMES):
+            _nout += process(
+                self._state, out + _nout * self.channels, data_in + _start * self.channels, min(_nin - _start, MAX_BLOCK_FRAMES)
+            )
+        return _nout
+
+
+def benchmark(filename: str, rate: int, block_frames=4096, fsk_lower=1000, fsk_upper=20000) -> None:
+    """
+    Compare this resampler against audioop.ratecv, using a 48 kHz IQ recording.
+
+    The recording is taken down to rate with a long (high quality) filter, and then brought back up to
+    48 kHz by each resampler in block_frames sized blocks, timing the resampling and counting how many
+    packets the modem decodes from the result.
+    """
+    from .demod import HorusLib, Mode
+
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+    with open(filename, "rb") as f:
+        _reference = f.read()
+
+    _input = bytes(Resampler(48000, rate, channels=2, zero_crossings=32).process(_reference))
+    _duration = len(_input) / 4 / rate
+    _block_bytes = block_frames * 4
+
+    # Filter design is cached, so set up outside of the timed section.
+    _resampler = Resampler(rate, 48000, channels=2)
+    _ratecv_state = None
+
+    def _polyphase(block):
+        return bytes(_resampler.process(block))
+
+    def _audioop(block):
+        nonlocal _ratecv_state
+        (_data, _ratecv_state) = audioop.ratecv(block, 2, 2, rate, 48000, _ratecv_state)
+        return _data
+
+    _methods = [("polyphase", _polyphase)]
+    if audioop:
+        _methods.append(("audioop.ratecv", _audioop))
+    else:
+        print("audioop not available, skipping audioop.ratecv comparison.")
+
+    print(f"Input: {filename} resampled to {rate} Hz IQ, {_duration:.1f} seconds, {block_frames} frame blocks")
+    for (_name, _method) in _methods:
+        _start = time.perf_counter()
+        _blocks = [_method(_input[i:i + _block_bytes]) for i in range(0, len(_input), _block_bytes)]
+        _elapsed = time.perf_counter() - _start
+
+        _frames = []
+        with HorusLib(mode=Mode.BINARY, stereo_iq=True, sample_rate=48000) as horus:
+            horus.set_estimator_limits(fsk_lower, fsk_upper)
+            for _block in _blocks:
+                _frames.extend(horus.demodulate_many(_block))
+        _good = [x for x in _frames if x.crc_pass]
+        _snr = (sum(x.snr for x in _good) / len(_good)) if _good else float("nan")
+
+        print(
+            f"{_name:>16}: {_duration * rate / _elapsed / 1e6:7.2f} Msamples/s, {_duration / _elapsed:8.1f}x realtime, "
+            f"{len(_good)} packets decoded ({len(_frames) - len(_good)} CRC failures), mean SNR {_snr:.1f} dB"
+        )
+
+
+class ResamplerTests(unittest.TestCase):
+    def test_tone(self):
+        # A 1 kHz tone at 8 kHz should come out as a clean 1 kHz tone at 48 kHz.
+        _input = array("h", [int(10000 * math.sin(2 * math.pi * 1000 * n / 8000)) for n in range(8000)])
+        _resampler = Resampler(8000, 48000)
+        _output = array("h")
+        for i in range(0, len(_input), 1000):
+            _output.extend(array("h", bytes(_resampler.process(_input[i:i + 1000]))))
+
+        self.assertLessEqual(abs(len(_output) - 48000), 1)
+
+        # Skip the start up transient, then compare against an ideal tone delayed by the filter.
+        _delay = (len(design_filter(6, 1)) - 1) / 2
+        _error = max(
+            abs(_output[n] - 10000 * math.sin(2 * math.pi * 1000 * (n - _delay) / 48000))
+            for n in range(1000, 47000)
+        )
+        self.assertLess(_error, 100)
+
+    def test_float_iq(self):
+        # Stereo float input, decimating. Each channel should keep its own constant level.
+        _input = array("f", [0.5, -0.25] * 4800)
+        _resampler = Resampler(48000, 8000, channels=2)
+        _output = _resampler.process_float(_input)
+        self.assertEqual(len(_output), 1600)
+        self.assertAlmostEqual(_output[-2], 0.5, places=3)
+        self.assertAlmostEqual(_output[-1], -0.25, places=3)
+
+    def test_large_buffer(self):
+        # A buffer bigger than MAX_BLOCK_FRAMES is passed to the C resampler in blocks, with the same result.
+        _input = array("h", [int(10000 * math.sin(2 * math.pi * 1000 * n / 44100)) for n in range(10000)] * 2)
+        _whole = bytes(Resampler(44100, 48000, channels=2).process(_input))
+        with patch("horusdemodlib.resampler.MAX_BLOCK_FRAMES", 1234):
+            _resampler = Resampler(44100, 48000, channels=2)
+            self.assertEqual(bytes(_resampler.process(_input)), _whole)
+            self.assertEqual(len(_resampler._out_s16), 2 * sum(horus_api.resampler_max_out(_resampler._state, min(10000 - x, 1234)) for x in range(0, 10000, 1234)))
+
+        _floats = array("f", (x / 32768 for x in _input))
+        _whole = bytes(Resampler(44100, 48000, channels=2).process_float(_floats))
+        with patch("horusdemodlib.resampler.MAX_BLOCK_FRAMES", 1234):
+            self.assertEqual(bytes(Resampler(44100, 48000, channels=2).process_float(_floats)), _whole)
+
+    def test_filter_cache(self):
+        self.assertIs(design_filter(160, 147), design_filter(160, 147))
+        self.assertEqual(len(design_filter(160, 147)) % 160, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Polyphase resampler tests and benchmark")
+    parser.add_argument("--benchmark", type=str, default=None, help="Benchmark against audioop.ratecv using this 48 kHz s16 IQ recording, e.g. samples/horusb_iq_s16.raw")
+    parser.add_argument("--rate", type=int, default=44100, help="Sample rate to resample from in the benchmark.")
+    parser.add_argument("--test", action="store_true", default=False, help="Run unit tests")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=logging.INFO)
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.rate)
+
+    if args.test:
+        sys.argv.remove("--test") # remove --test otherwise unittest.main tries to parse that as its own argument
+        unittest.main()
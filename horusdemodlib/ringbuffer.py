@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Sample Ring Buffer
+#
+#   Fixed-capacity circular buffer used to queue up audio samples before they are
+#   handed to the modem in nin-sized blocks.
+#
+import logging
+import unittest
+
+
+class SampleRingBuffer():
+    """
+    Fixed-capacity circular byte buffer which can hand out contiguous views of its contents.
+
+    The first max_read bytes of the ring are mirrored just past the end of the storage, so any
+    read of up to max_read bytes can be returned as a single memoryview without copying,
+    even if it wraps around the end of the ring.
+
+    If more data is written than there is free space for, the oldest data is dropped and the
+    overrun is recorded in the overruns / dropped_bytes counters.
+
+    Example usage:
+
+    buffer = SampleRingBuffer(capacity=96000, max_read=4000)
+    buffer.write(samples)
+    while len(buffer) >= 4000:
+        horus.demodulate(buffer.peek(4000))
+        buffer.consume(4000)
+    """
+
+    def __init__(self, capacity: int, max_read: int):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of bytes the buffer can hold.
+        max_read : int
+            Largest number of bytes that will be requested through peek().
+        """
+        if max_read <= 0 or capacity < max_read:
+            raise ValueError("capacity must be at least max_read, and max_read must be positive")
+
+        self.capacity = capacity
+        self.max_read = max_read
+
+        self._buf = bytearray(capacity + max_read)
+        self._view = memoryview(self._buf)
+        self._read = 0
+        self._count = 0
+
+        # Overrun statistics
+        self.overruns = 0
+        self.dropped_bytes = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def free(self) -> int:
+        """ Number of bytes that can be written without dropping data """
+        return self.capacity - self._count
+
+    def clear(self) -> None:
+        """ Discard all buffered data """
+        self._read = 0
+        self._count = 0
+
+    def _store(self, pos: int, data) -> None:
+        """ Copy data into the ring at pos (which must not wrap), keeping the mirror region up to date """
+        _end = pos + len(data)
+        self._view[pos:_end] = data
+        if pos < self.max_read:
+            _mirror_end = min(_end, self.max_read)
+            self._view[self.capacity + pos:self.capacity + _mirror_end] = data[:_mirror_end - pos]
+
+    def write(self, data) -> int:
+        """
+        Append data (any bytes-like object) to the buffer.
+
+        Returns the number of bytes of old data that had to be dropped to make room.
+        """
+        data = memoryview(data).cast("B")
+        _len = len(data)
+        if _len == 0:
+            return 0
+
+        _dropped = 0
+        if _len > self.capacity:
+            # Only the most recent capacity bytes can be kept.
+            _dropped += _len - self.capacity
+            data = data[-self.capacity:]
+            _len = self.capacity
+
+        if _len > self.free:
+            # Producer is ahead of the demodulator, drop the oldest data.
+            _overflow = _len - self.free
+            self._read = (self._read + _overflow) % self.capacity
+            self._count -= _overflow
+            _dropped += _overflow
+
+        if _dropped:
+            self.overruns += 1
+            self.dropped_bytes += _dropped
+            logging.warning(f"Sample buffer overrun - dropped {_dropped} bytes.")
+
+        _write = (self._read + self._count) % self.capacity
+        _first = min(_len, self.capacity - _write)
+        self._store(_write, data[:_first])
+        if _first < _len:
+            self._store(0, data[_first:])
+        self._count += _len
+
+        return _dropped
+
+    def peek(self, length: int) -> memoryview:
+        """
+        Return a contiguous view of the next length bytes, without removing them from the buffer.
+
+        The view is only valid until the next call to write().
+        """
+        if length > self.max_read:
+            raise ValueError(f"Cannot read {length} bytes, max_read is {self.max_read}")
+        if length > self._count:
+            raise ValueError(f"Cannot read {length} bytes, only {self._count} available")
+
+        return self._view[self._read:self._read + length]
+
+    def consume(self, length: int) -> None:
+        """ Remove length bytes from the front of the buffer """
+        if length > self._count:
+            raise ValueError(f"Cannot consume {length} bytes, only {self._count} available")
+
+        self._read = (self._read + length) % self.capacity
+        self._count -= length
+
+
+class SampleRingBufferTests(unittest.TestCase):
+    def test_wrapping_reads(self):
+        _buffer = SampleRingBuffer(capacity=10, max_read=4)
+        _expected = bytearray()
+        _value = 0
+        for _ in range(20):
+            _chunk = bytes((_value + i) % 256 for i in range(3))
+            _value += 3
+            _buffer.write(_chunk)
+            _expected.extend(_chunk)
+            while len(_buffer) >= 4:
+                self.assertEqual(bytes(_buffer.peek(4)), bytes(_expected[:4]))
+                _buffer.consume(4)
+                del _expected[:4]
+        self.assertEqual(_buffer.overruns, 0)
+
+    def test_overrun(self):
+        _buffer = SampleRingBuffer(capacity=8, max_read=4)
+        self.assertEqual(_buffer.write(b"\x00\x01\x02\x03\x04\x05"), 0)
+        self.assertEqual(_buffer.write(b"\x06\x07\x08\x09"), 2)
+        self.assertEqual(_buffer.overruns, 1)
+        self.assertEqual(_buffer.dropped_bytes, 2)
+        self.assertEqual(bytes(_buffer.peek(4)), b"\x02\x03\x04\x05")
+
+        # Writes larger than the whole buffer keep only the newest data
+        self.assertEqual(_buffer.write(bytes(range(20))), 20)
+        self.assertEqual(len(_buffer), 8)
+        self.assertEqual(bytes(_buffer.peek(4)), bytes(range(12, 16)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - rtl_tcp Input
+#
+#   Client for the rtl_tcp protocol, so horus_demod can take IQ straight from a
+#   shared RTLSDR rather than needing rtl_fm to convert it to signed 16-bit first.
+#
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import unittest
+from array import array
+
+# rtl_tcp commands, see rtl_tcp.c
+RTLTCP_SET_FREQUENCY = 0x01
+RTLTCP_SET_SAMPLE_RATE = 0x02
+RTLTCP_SET_GAIN_MODE = 0x03
+RTLTCP_SET_GAIN = 0x04
+RTLTCP_SET_FREQ_CORRECTION = 0x05
+RTLTCP_SET_AGC_MODE = 0x08
+
+RTLTCP_MAGIC = b"RTL0"
+
+# Sample rates (Hz) librtlsdr accepts. rtl_tcp ignores a request for any other rate, and keeps streaming
+# at the rate it already has.
+RTLSDR_SAMPLE_RATE_RANGES = [(225001, 300000), (900001, 3200000)]
+
+_RTLTCP_HEADER = struct.Struct(">4sII")
+_RTLTCP_COMMAND = struct.Struct(">BI")
+
+# Each unsigned 8-bit sample u becomes the signed 16-bit sample (u - 128) * 256, whose bytes are
+# a zero and u ^ 0x80. So the whole conversion is one table lookup over the input, written into
+# the high byte of every output sample.
+_U8_TO_S16_HIGH = bytes(x ^ 0x80 for x in range(256))
+_S16_HIGH_BYTE = 1 if sys.byteorder == "little" else 0
+
+
+def rtlsdr_sample_rate_supported(sample_rate: int) -> bool:
+    """ Check if an RTLSDR can be set to sample_rate """
+    return any(_lower <= sample_rate <= _upper for (_lower, _upper) in RTLSDR_SAMPLE_RATE_RANGES)
+
+
+def u8_to_s16(data, out=None) -> bytearray:
+    """
+    Convert unsigned 8-bit samples (as sent by rtl_tcp) to native order signed 16-bit samples.
+
+    If out is given, the samples are written to the start of it, and it is returned. It must be at least
+    twice the length of data, and the low byte of each sample must be zero, which holds for a buffer only
+    ever used for this.
+    """
+    if out is None:
+        out = bytearray(2 * len(data))
+    out[_S16_HIGH_BYTE:2 * len(data):2] = bytes(data).translate(_U8_TO_S16_HIGH)
+    return out
+
+
+class RTLTCPSource():
+    """
+    Receives IQ samples from an rtl_tcp server, converted to interleaved signed 16-bit samples.
+
+    Example usage:
+
+    with RTLTCPSource("127.0.0.1", 1234, sample_rate=1024000, frequency=434200000) as source, \\
+         HorusLib(mode=Mode.BINARY, stereo_iq=True, sample_rate=1024000) as horus:
+        while True:
+            horus.add_samples(source.read(204800))
+    """
+
+    def __init__(self, host: str, port: int, sample_rate=None, frequency=None, gain=None, ppm=None, agc=None, timeout=10.0):
+        """
+        Parameters
+        ----------
+        host : str
+            rtl_tcp server address
+        port : int
+            rtl_tcp server port
+        sample_rate : int
+            Sample rate to set (Hz), see RTLSDR_SAMPLE_RATE_RANGES. Left as the server has it if None.
+        frequency : int
+            Centre frequency to set (Hz). Left as the server has it if None.
+        gain : float
+            Tuner gain (dB). None leaves the gain mode alone, 0 selects automatic gain.
+        ppm : int
+            Frequency correction (ppm) to set
+        agc : bool
+            Turn the RTL2832 digital AGC on or off
+        timeout : float
+            Seconds to wait for data before giving up, None to wait forever
+        """
+        if sample_rate is not None and not rtlsdr_sample_rate_supported(sample_rate):
+            raise ValueError(f"An RTLSDR can't run at {sample_rate} Hz, it supports " + " and ".join(f"{x[0]}-{x[1]}" for x in RTLSDR_SAMPLE_RATE_RANGES) + " Hz")
+
+        self.timeout = timeout
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        _header = self._recv_exactly(_RTLTCP_HEADER.size)
+        (_magic, self.tuner_type, self.gain_count) = _RTLTCP_HEADER.unpack(_header)
+        if _magic != RTLTCP_MAGIC:
+            self.socket.close()
+            raise ValueError(f"{host}:{port} is not an rtl_tcp server")
+
+        if sample_rate is not None:
+            self.command(RTLTCP_SET_SAMPLE_RATE, sample_rate)
+        if frequency is not None:
+            self.command(RTLTCP_SET_FREQUENCY, frequency)
+        if ppm is not None:
+            self.command(RTLTCP_SET_FREQ_CORRECTION, ppm & 0xFFFFFFFF)
+        if agc is not None:
+            self.command(RTLTCP_SET_AGC_MODE, int(agc))
+        if gain is not None:
+            if gain == 0:
+                self.command(RTLTCP_SET_GAIN_MODE, 0)
+            else:
+                self.command(RTLTCP_SET_GAIN_MODE, 1)
+                self.command(RTLTCP_SET_GAIN, int(gain * 10))
+
+        # Receive buffer, and the s16 output it is converted into, grown as needed.
+        self._buf = bytearray()
+        self._out = bytearray()
+        self._pending = b""
+
+        # Statistics
+        self.bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        _data = b""
+        while len(_data) < size:
+            _chunk = self.socket.recv(size - len(_data))
+            if not _chunk:
+                raise ConnectionError("rtl_tcp server closed the connection")
+            _data += _chunk
+        return _data
+
+    def command(self, cmd: int, value: int) -> None:
+        """ Send a raw rtl_tcp command """
+        logging.debug(f"rtl_tcp command {cmd:#04x} {value}")
+        self.socket.sendall(_RTLTCP_COMMAND.pack(cmd, value))
+
+    def read(self, size: int) -> memoryview:
+        """
+        Return up to size bytes of signed 16-bit IQ samples, blocking until there are at least some.
+
+        Only whole IQ pairs are returned. The returned view is only valid until the next call.
+        Returns b'' when the server closes the connection, or the timeout expires.
+        """
+        _nbytes = max(size // 4, 1) * 2  # u8 bytes, whole IQ pairs
+        if len(self._buf) < _nbytes:
+            self._buf = bytearray(_nbytes)
+            self._out = bytearray(2 * _nbytes)
+        _view = memoryview(self._buf)
+
+        # Left over odd byte from the last read
+        _len = len(self._pending)
+        _view[:_len] = self._pending
+
+        try:
+            while _len < 2:
+                if not select.select([self.socket], [], [], self.timeout)[0]:
+                    return b''
+                _got = self.socket.recv_into(_view[_len:_nbytes])
+                if _got == 0:
+                    return b''
+                _len += _got
+
+            # Take whatever else has already arrived, without waiting.
+            self.socket.setblocking(False)
+            try:
+                while _len < _nbytes:
+                    _got = self.socket.recv_into(_view[_len:_nbytes])
+                    if _got == 0:
+                        break
+                    _len += _got
+            except BlockingIOError:
+                pass
+            finally:
+                self.socket.settimeout(self.timeout)
+        except ConnectionError as e:
+            logging.warning(f"rtl_tcp connection lost: {e}")
+            if _len < 2:
+                return b''
+
+        self.bytes += _len - len(self._pending)
+        _even = _len & ~1
+        self._pending = bytes(_view[_even:_len])
+
+        u8_to_s16(_view[:_even], self._out)
+        return memoryview(self._out)[:2 * _even]
+
+
+class RTLTCPTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def test_u8_to_s16(self):
+        self.assertEqual(list(array("h", u8_to_s16(bytes([0, 127, 128, 255])))), [-32768, -256, 0, 32512])
+
+    def test_sample_rate(self):
+        self.assertEqual([rtlsdr_sample_rate_supported(x) for x in (48000, 250000, 300001, 1024000, 2048000, 3200001)], [False, True, False, True, True, False])
+        # Rejected before connecting
+        with self.assertRaises(ValueError):
+            RTLTCPSource("127.0.0.1", 1, sample_rate=48000)
+
+    def test_server(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            _s16 = array("h", f.read())
+        # What an RTLSDR would have sent for the same signal. The stand-in server sends this 48 kHz recording
+        # whatever rate it is asked for.
+        _u8 = bytes((x >> 8) + 128 for x in _s16)
+
+        # Stand-in rtl_tcp server, which records the commands it gets and then sends the file.
+        _server = socket.create_server(("127.0.0.1", 0))
+        _commands = []
+
+        def _serve():
+            _conn, _ = _server.accept()
+            with _conn:
+                _conn.sendall(_RTLTCP_HEADER.pack(RTLTCP_MAGIC, 5, 29))
+                while len(_commands) < 4:
+                    _commands.append(_RTLTCP_COMMAND.unpack(_conn.recv(_RTLTCP_COMMAND.size, socket.MSG_WAITALL)))
+                for i in range(0, len(_u8), 9999):
+                    _conn.sendall(_u8[i:i + 9999])
+
+        _thread = threading.Thread(target=_serve)
+        _thread.start()
+
+        from .demod import HorusLib, Mode
+        _packets = []
+        _received = bytearray()
+        with RTLTCPSource("127.0.0.1", _server.getsockname()[1], sample_rate=1024000, frequency=434200000, gain=40.2) as source, \
+             HorusLib(mode=Mode.BINARY, stereo_iq=True, callback=lambda x: _packets.append(x)) as horus:
+            self.assertEqual(source.tuner_type, 5)
+            horus.set_estimator_limits(1000, 20000)
+            while True:
+                data = source.read(19200)
+                if not data:
+                    break
+                _received.extend(data)
+                horus.add_samples(data)
+
+        _thread.join()
+        _server.close()
+
+        self.assertEqual(_commands, [(RTLTCP_SET_SAMPLE_RATE, 1024000), (RTLTCP_SET_FREQUENCY, 434200000), (RTLTCP_SET_GAIN_MODE, 1), (RTLTCP_SET_GAIN, 402)])
+        self.assertEqual(len(_received), 2 * len(_u8))
+        self.assertIn(bytes.fromhex("000900071E2A000000000000000000000000259A6B14"), [x.data for x in _packets if x.crc_pass])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - ka9q-radio RTP Input
+#
+#   Receives the PCM RTP multicast stream from ka9q-radio, and runs one modem per
+#   SSRC (channel) in a single process, instead of a pcmrecord | horus_demod | horus_uploader
+#   chain per channel.
+#
+import argparse
+import horusdemodlib
+import json
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import unittest
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from .demod import HorusLib, format_frame, format_stats, pack_stats, add_modem_arguments, parse_mode, STATS_FORMATS
+
+RTP_VERSION = 2
+
+# ka9q-radio's default PCM stream port
+DEFAULT_RTP_PORT = 5004
+
+_RTP_HEADER = struct.Struct("!BBHII")
+
+
+class RTPPacket():
+    """
+    A parsed RTP packet.
+
+    Attributes
+    ----------
+
+    ssrc : int
+        Synchronisation source, ka9q-radio uses one per channel
+    seq : int
+        16 bit sequence number
+    timestamp : int
+        32 bit timestamp, in samples
+    payload_type : int
+        RTP payload type
+    payload : memoryview
+        Packet payload, with any padding removed
+    """
+
+    __slots__ = ("ssrc", "seq", "timestamp", "payload_type", "payload")
+
+    def __init__(self, ssrc: int, seq: int, timestamp: int, payload_type: int, payload):
+        self.ssrc = ssrc
+        self.seq = seq
+        self.timestamp = timestamp
+        self.payload_type = payload_type
+        self.payload = payload
+
+
+def parse_rtp(data):
+    """ Parse an RTP packet (any bytes-like object), returning an RTPPacket, or None if it isn't valid RTP """
+    data = memoryview(data)
+    if len(data) < _RTP_HEADER.size:
+        return None
+
+    (_flags, _pt, _seq, _timestamp, _ssrc) = _RTP_HEADER.unpack_from(data)
+    if (_flags >> 6) != RTP_VERSION:
+        return None
+
+    _start = _RTP_HEADER.size + 4 * (_flags & 0x0F)  # CSRC list
+    _end = len(data)
+
+    if _flags & 0x10:
+        # Header extension, 16 bit profile then 16 bit length in words
+        if _end < _start + 4:
+            return None
+        _start += 4 + 4 * struct.unpack_from("!H", data, _start + 2)[0]
+
+    if _flags & 0x20:
+        # Padding, the last byte says how much
+        if _end == 0:
+            return None
+        _end -= data[_end - 1]
+
+    if _start > _end:
+        return None
+
+    return RTPPacket(_ssrc, _seq, _timestamp, _pt & 0x7F, data[_start:_end])
+
+
+class RTPStream():
+    """
+    Turns the packets of one SSRC back into a continuous run of signed 16-bit samples.
+
+    Lost packets are detected from the sequence numbers, and the missing samples (from the RTP
+    timestamps) are filled with silence, up to max_fill samples, so the modem's symbol timing
+    isn't thrown out. Packets which arrive after a later one has already been used are dropped,
+    and counted as both lost and late.
+
+    ka9q-radio sends big-endian (network order) samples unless told otherwise, these are swapped
+    to native order.
+    """
+
+    def __init__(self, ssrc: int, channels=2, big_endian=True, max_fill=48000):
+        self.ssrc = ssrc
+        self.frame_bytes = 2 * channels
+        self.big_endian = big_endian
+        self.max_fill = max_fill
+
+        self._next_seq = None
+        self._next_timestamp = None
+
+        # Statistics
+        self.packets = 0
+        self.lost_packets = 0
+        self.late_packets = 0
+        self.filled_samples = 0
+
+    def add(self, packet: RTPPacket, out: bytearray) -> None:
+        """ Append the samples from packet (and any silence before it) to out, which is in network order """
+        self.packets += 1
+        _frames = len(packet.payload) // self.frame_bytes
+
+        if self._next_seq is not None:
+            _seq_diff = (packet.seq - self._next_seq) & 0xFFFF
+            if _seq_diff >= 0x8000:
+                # Older than something we have already used.
+                self.late_packets += 1
+                return
+            if _seq_diff:
+                self.lost_packets += _seq_diff
+                _missing = (packet.timestamp - self._next_timestamp) & 0xFFFFFFFF
+                if _missing < self.max_fill:
+                    out.extend(bytes(_missing * self.frame_bytes))
+                    self.filled_samples += _missing
+                logging.warning(f"SSRC {self.ssrc}: {_seq_diff} RTP packets lost.")
+
+        out.extend(packet.payload[:_frames * self.frame_bytes])
+        self._next_seq = (packet.seq + 1) & 0xFFFF
+        self._next_timestamp = (packet.timestamp + _frames) & 0xFFFFFFFF
+
+    def to_native(self, data: bytearray):
+        """ Convert a buffer built up by add() to native order samples """
+        if self.big_endian == (sys.byteorder == "big"):
+            return data
+        _samples = array("h", data)
+        _samples.byteswap()
+        return _samples
+
+
+class RTPReceiver():
+    """
+    Receives RTP packets from a multicast group (or a unicast address), in batches.
+
+    Example usage:
+
+    with RTPReceiver("239.1.2.3", 5004) as receiver:
+        while True:
+            for packet in receiver.read():
+                print(packet.ssrc, len(packet.payload))
+    """
+
+    # Socket receive buffer to ask for. The OS may give us less (see net.core.rmem_max on Linux).
+    DEFAULT_RCVBUF = 8 * 1024 * 1024
+
+    # Largest datagram we expect
+    MAX_DATAGRAM = 9000
+
+    def __init__(self, address: str, port=DEFAULT_RTP_PORT, interface="0.0.0.0", rcvbuf=DEFAULT_RCVBUF, batch_size=256):
+        """
+        Parameters
+        ----------
+        address : str
+            Multicast group (or unicast address) of the stream, e.g. the address ka9q-radio's
+            hf-pcm.local (or similar) name resolves to
+        port : int
+            UDP port, 0 to pick a free port for unicast (see .port)
+        interface : str
+            Address of the local interface to join the multicast group on
+        rcvbuf : int
+            Socket receive buffer size to request (bytes)
+        batch_size : int
+            Most packets to return from one read()
+        """
+        self.address = socket.gethostbyname(address)
+        self.batch_size = batch_size
+        self.multicast = socket.inet_aton(self.address)[0] in range(224, 240)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        # Binding to the group (rather than any address) means we only see this stream, even if other groups use the same port.
+        self.socket.bind((self.address, port))
+        if self.multicast:
+            _mreq = struct.pack("4s4s", socket.inet_aton(self.address), socket.inet_aton(interface))
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+
+        self.rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if self.rcvbuf < rcvbuf:
+            logging.warning(f"RTP receive buffer limited to {self.rcvbuf} bytes (asked for {rcvbuf}), packets may be dropped under load.")
+
+        # Statistics
+        self.datagrams = 0
+        self.invalid = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def read(self, timeout=None) -> list:
+        """
+        Wait for at least one packet, then return it along with every other packet already waiting, in arrival order.
+
+        Returns an empty list if the timeout (seconds) expires.
+        """
+        if not select.select([self.socket], [], [], timeout)[0]:
+            return []
+
+        packets = []
+        while len(packets) < self.batch_size:
+            try:
+                _data = self.socket.recv(self.MAX_DATAGRAM)
+            except BlockingIOError:
+                break
+            self.datagrams += 1
+            _packet = parse_rtp(_data)
+            if _packet is None:
+                self.invalid += 1
+                continue
+            packets.append(_packet)
+
+        return packets
+
+
+class RTPHorusReceiver():
+    """
+    Runs one HorusLib modem per SSRC over packets from an RTPReceiver.
+
+    Each batch of packets is split up by SSRC, and the modems run on a thread pool using the
+    horus_rx_batch C API, which doesn't hold the GIL.
+
+    Example usage:
+
+    def frame_callback(frame, ssrc):
+        print(f"{ssrc}: {frame.data.hex()}")
+
+    with RTPReceiver("239.1.2.3") as receiver, RTPHorusReceiver([43462201, 43465001], callback=frame_callback, stereo_iq=True) as horus:
+        while True:
+            horus.process(receiver.read())
+    """
+
+    def __init__(self, ssrcs, callback=None, estimator_limits=None, big_endian=True, max_workers=None, **kwargs):
+        """
+        Parameters
+        ----------
+        ssrcs : list of int
+            SSRCs to run modems for. Packets from any other SSRC are counted and ignored.
+        callback : function
+            Called as callback(frame, ssrc) for every frame with data.
+        estimator_limits : (float, float)
+            Frequency estimator limits (Hz) for every modem
+        big_endian : bool
+            Samples are in network order, as sent by ka9q-radio by default
+        max_workers : int
+            Number of threads to run the modems on. Defaults to one per SSRC.
+        **kwargs
+            Passed on to HorusLib (mode, rate, stereo_iq, sample_rate, etc.)
+        """
+        if len(ssrcs) == 0:
+            raise ValueError("At least one SSRC is required")
+
+        self.callback = callback
+        _channels = 2 if kwargs.get("stereo_iq") else 1
+
+        self.modems = {}
+        self.streams = {}
+        for _ssrc in ssrcs:
+            horus = HorusLib(**kwargs)
+            if estimator_limits:
+                horus.set_estimator_limits(*estimator_limits)
+            self.modems[_ssrc] = horus
+            self.streams[_ssrc] = RTPStream(_ssrc, channels=_channels, big_endian=big_endian, max_fill=horus.audio_sample_rate)
+
+        self.mfsk = next(iter(self.modems.values())).mfsk
+        self.unknown_packets = 0
+
+        if len(self.modems) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=(max_workers or len(self.modems)), thread_name_prefix="horus_rtp")
+        else:
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes all the modems.
+        """
+        if self._executor:
+            self._executor.shutdown()
+        for horus in self.modems.values():
+            horus.close()
+
+    def process(self, packets) -> dict:
+        """
+        Demodulate a batch of packets. Returns a dict of SSRC to the list of Frames found, for every
+        SSRC which had packets in the batch.
+        """
+        _samples = {}
+        for _packet in packets:
+            _stream = self.streams.get(_packet.ssrc)
+            if _stream is None:
+                self.unknown_packets += 1
+                continue
+            _stream.add(_packet, _samples.setdefault(_packet.ssrc, bytearray()))
+
+        _ssrcs = list(_samples.keys())
+        _demod = lambda ssrc: self.modems[ssrc].demodulate_many(self.streams[ssrc].to_native(_samples[ssrc]))
+        if self._executor and len(_ssrcs) > 1:
+            results = dict(zip(_ssrcs, self._executor.map(_demod, _ssrcs)))
+        else:
+            results = {ssrc: _demod(ssrc) for ssrc in _ssrcs}
+
+        if self.callback:
+            for (ssrc, frames) in results.items():
+                for frame in frames:
+                    if len(frame.data) > 0:
+                        self.callback(frame, ssrc)
+
+        return results
+
+    def summary(self) -> str:
+        """ One line summary of the per-SSRC packet statistics """
+        return ", ".join(
+            f"{x.ssrc}: {x.packets} packets, {x.lost_packets} lost, {x.late_packets} late"
+            for x in self.streams.values()
+        ) + f", {self.unknown_packets} packets from other SSRCs"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='horus_demod_rtp',
+                    description='Demodulate many ka9q-radio channels (SSRCs) from one RTP PCM stream')
+
+    parser.add_argument("stream", type=str, help="RTP stream multicast group, or address, as ADDRESS[:PORT] (default port %d)" % DEFAULT_RTP_PORT)
+    parser.add_argument("--ssrc", action="append", required=True, metavar="SSRC[:OUTPUT]", help="Run a modem for this SSRC. Can be given multiple times. Packets (and stats, with -g) go to OUTPUT if given, otherwise stdout.")
+    parser.add_argument("--interface", type=str, default="0.0.0.0", help="Local interface address to join the multicast group on")
+    parser.add_argument("--little-endian", action="store_true", default=False, help="Samples are little-endian (ka9q-radio s16le encoding) rather than network order")
+    add_modem_arguments(parser)
+    parser.add_argument('-t','--stats', default=None,  nargs='?', const=8, type=int, metavar="N", help="Print out modem statistics in JSON, every N modem blocks of each SSRC (default 8)")
+    parser.add_argument('-g', action="store_true", default=False,help="Emit Stats on each SSRC's output instead of stderr")
+    parser.add_argument("--stats-format", choices=STATS_FORMATS, default="json", help="Stats format: full JSON lines (with the eye diagram), compact JSON lines (without it), or fixed size binary records, see STATS_RECORD. Binary needs --stats-output, and records the SSRC's position in the --ssrc list as the channel. Default: json")
+    parser.add_argument("--stats-output", type=str, default=None, metavar="FILE", help="Write stats (for all SSRCs) to this file or FIFO, instead of stderr or each SSRC's output")
+    parser.add_argument('-v', action="store_true",default=False,help="verbose debug info")
+    parser.add_argument('-c', action="store_true",default=False,help="display CRC results for each packet")
+    args = parser.parse_args()
+
+    if args.stats is not None and args.stats < 1:
+        parser.error("--stats rate must be at least 1")
+
+    if args.stats_format == "binary" and not args.stats_output:
+        parser.error("--stats-format binary needs --stats-output")
+
+    mode = parse_mode(args.mode)
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=(logging.DEBUG if args.v else logging.INFO))
+
+    (_address, _, _port) = args.stream.partition(":")
+    outputs = {}
+    for _spec in args.ssrc:
+        (_ssrc, _, _output) = _spec.partition(":")
+        try:
+            outputs[int(_ssrc)] = open(_output, "w") if _output else sys.stdout
+        except ValueError:
+            parser.error(f"Invalid --ssrc {_spec}, expected SSRC[:OUTPUT]")
+
+    _limits = None
+    if args.fsk_lower > -99999 and args.fsk_upper > args.fsk_lower:
+        _limits = (args.fsk_lower, args.fsk_upper)
+
+    if args.stats_output:
+        stats_outfile = open(args.stats_output, "wb" if args.stats_format == "binary" else "w")
+    else:
+        stats_outfile = None
+
+    # Only the full JSON format includes the eye diagram, so only fetch it from the modem for that.
+    stats_eye = (args.stats_format == "json")
+    next_stats_block = dict((x, 0) for x in outputs)
+
+    def write_stats(modem, ssrc):
+        """ Write an SSRC's stats if at least --stats blocks have been demodulated since they were last written """
+        if modem.blocks < next_stats_block[ssrc]:
+            return
+        next_stats_block[ssrc] = modem.blocks + args.stats
+
+        _stats = modem.get_stats(eye_diagram=stats_eye)
+        _outfile = stats_outfile or (outputs[ssrc] if args.g else sys.stderr)
+        if args.stats_format == "binary":
+            _outfile.write(pack_stats(_stats, modem.mfsk, list(outputs).index(ssrc), modem.blocks))
+        else:
+            _outfile.write(format_stats(_stats, modem.mfsk, ssrc, compact=(args.stats_format == "compact")) + "\n")
+        _outfile.flush()
+
+    def frame_callback(frame, ssrc):
+        # Print out only CRC-passing frames, unless we are in verbose mode
+        if frame.crc_pass or args.v:
+            outputs[ssrc].write(format_frame(frame, args.c) + "\n")
+            outputs[ssrc].flush()
+
+    logging.info(f"horusdemodlib v{horusdemodlib.__version__} - horus_demod_rtp")
+
+    with RTPReceiver(_address, int(_port or DEFAULT_RTP_PORT), interface=args.interface) as receiver, RTPHorusReceiver(
+        list(outputs.keys()), callback=frame_callback, estimator_limits=_limits, big_endian=(not args.little_endian),
+        mode=mode, rate=args.rate, tone_spacing=args.tonespacing, stereo_iq=args.q, verbose=args.v, sample_rate=args.sample_rate,
+        native_rate=args.native_rate
+    ) as horus:
+        logging.info(f"Listening for RTP on {receiver.address}:{receiver.port}, SSRCs {', '.join(str(x) for x in outputs)}")
+        try:
+            while True:
+                _results = horus.process(receiver.read())
+                if args.stats != None:
+                    for _ssrc in _results:
+                        write_stats(horus.modems[_ssrc], _ssrc)
+        finally:
+            logging.info(f"RTP input: {horus.summary()}")
+            if stats_outfile:
+                stats_outfile.close()
+
+
+class RTPTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    @staticmethod
+    def rtp_packets(ssrc, data, frame_bytes, samples_per_packet=240, seq=65500, timestamp=0):
+        """ Split native order s16 samples into big-endian RTP packets, like ka9q-radio sends """
+        _swapped = array("h", data)
+        _swapped.byteswap()
+        _swapped = _swapped.tobytes()
+        _packets = []
+        _step = samples_per_packet * frame_bytes
+        for i in range(0, len(_swapped) - _step + 1, _step):
+            _header = _RTP_HEADER.pack(0x80, 122, seq & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc)
+            _packets.append(_header + _swapped[i:i + _step])
+            seq += 1
+            timestamp += samples_per_packet
+        return _packets
+
+    def test_parse(self):
+        _packet = parse_rtp(_RTP_HEADER.pack(0xB1, 0x80 | 97, 7, 1234, 42) + b"\x00" * 4 + b"\x00\x01\x00\x01" + b"\xAA" * 4 + b"\x01\x02\x03\x04" + b"\x00\x02")
+        self.assertEqual((_packet.ssrc, _packet.seq, _packet.timestamp, _packet.payload_type), (42, 7, 1234, 97))
+        # One CSRC, one word of header extension, two bytes of padding
+        self.assertEqual(bytes(_packet.payload), b"\x01\x02\x03\x04")
+        self.assertIsNone(parse_rtp(b"\x00" * 12))
+        self.assertIsNone(parse_rtp(b"\x80\x00"))
+
+    def test_demux(self):
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            data = f.read()
+
+        # The Horus signal on one SSRC, and silence on another, interleaved, with a lost packet
+        # and a late packet on the first. Another SSRC we aren't listening to is ignored.
+        _signal = self.rtp_packets(1001, data, 4)
+        _silence = self.rtp_packets(2002, bytes(len(data)), 4)
+        _other = self.rtp_packets(3003, bytes(4 * 240 * 10), 4)
+        del _signal[10]
+        _signal[20], _signal[21] = _signal[21], _signal[20]
+        _packets = [x for pair in zip(_signal, _silence) for x in pair] + _other
+
+        _frames = []
+        with RTPReceiver("127.0.0.1", 0) as receiver, RTPHorusReceiver(
+            [1001, 2002], callback=lambda frame, ssrc: _frames.append((ssrc, frame)),
+            estimator_limits=(1000, 20000), stereo_iq=True
+        ) as horus:
+            _sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for i in range(0, len(_packets), 100):
+                for _packet in _packets[i:i + 100]:
+                    _sender.sendto(_packet, ("127.0.0.1", receiver.port))
+                horus.process(receiver.read(timeout=1))
+            _sender.close()
+
+            # The late packet was already filled with silence when the packet after it arrived
+            self.assertEqual(horus.streams[1001].lost_packets, 2)
+            self.assertEqual(horus.streams[1001].late_packets, 1)
+            self.assertEqual(horus.streams[1001].filled_samples, 480)
+            self.assertEqual(horus.streams[2002].lost_packets, 0)
+            self.assertEqual(horus.unknown_packets, 10)
+
+        self.assertIn((1001, bytes.fromhex("000900071E2A000000000000000000000000259A6B14")), [(x[0], x[1].data) for x in _frames if x[1].crc_pass])
+        self.assertNotIn(2002, [x[0] for x in _frames])
+
+    def test_main_stats(self):
+        from .demod import STATS_RECORD, unpack_stats
+
+        with open(os.path.join(self.SAMPLES_DIR, "horusb_iq_s16.raw"), "rb") as f:
+            data = f.read()
+        _packets = [parse_rtp(x) for x in self.rtp_packets(1001, data, 4)]
+        _batches = [_packets[i:i + 100] for i in range(0, len(_packets), 100)]
+
+        def _run(*options):
+            with tempfile.TemporaryDirectory() as _dir:
+                _output = os.path.join(_dir, "packets")
+                _stats = os.path.join(_dir, "stats")
+                _argv = ["horus_demod_rtp", "127.0.0.1:0", "--ssrc", f"1001:{_output}", "-q", "-b", "1000", "-u", "20000", *options, "--stats-output", _stats]
+                with patch.object(sys, "argv", _argv), patch.object(RTPReceiver, "read", side_effect=_batches + [KeyboardInterrupt()]):
+                    with self.assertRaises(KeyboardInterrupt):
+                        main()
+                with open(_output) as f:
+                    _lines = f.read().splitlines()
+                with open(_stats, "rb") as f:
+                    return (_lines, f.read())
+
+        (_lines, _compact) = _run("--stats", "1", "--stats-format", "compact")
+        self.assertIn("000900071E2A000000000000000000000000259A6B14", _lines)
+        _compact = _compact.splitlines()
+        self.assertEqual(json.loads(_compact[0])["channel"], 1001)
+        self.assertNotIn("eye_diagram", json.loads(_compact[0]))
+
+        _blocks = lambda x: [unpack_stats(x[i:i + STATS_RECORD.size])["block"] for i in range(0, len(x), STATS_RECORD.size)]
+        (_, _every) = _run("--stats", "1", "--stats-format", "binary")
+        (_, _decimated) = _run("--stats", "4", "--stats-format", "binary")
+        self.assertEqual(len(_every), len(_compact) * STATS_RECORD.size)
+        self.assertEqual(unpack_stats(_every[:STATS_RECORD.size])["channel"], 0)
+
+        # Stats are only written once every 4 modem blocks.
+        _every = _blocks(_every)
+        _decimated = _blocks(_decimated)
+        self.assertLess(len(_decimated), len(_every))
+        self.assertTrue(all(_b - _a >= 4 for (_a, _b) in zip(_decimated, _decimated[1:])))
+        self.assertIn(_every[-1] - _decimated[-1], range(4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - Receiver
+#
+#   Demodulates, decodes and uploads telemetry in one process, so a station doesn't
+#   need to pipe horus_demod's text output into horus_uploader.
+#
+
+# Python 3 check
+import sys
+
+if sys.version_info < (3, 9):
+    print("ERROR - This script requires Python 3.9 or newer!")
+    sys.exit(1)
+
+import argparse
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from .demod import HorusLib, Mode, add_modem_arguments, add_input_arguments, parse_mode, open_input, stats_dict
+from .demodstats import FSKDemodStats
+from .uploader import read_config, load_payload_lists, create_sondehub_uploader, TelemetryHandler
+
+
+def main():
+
+    # Read command-line arguments
+    parser = argparse.ArgumentParser(description="Project Horus Binary/RTTY Receiver - demodulate, decode and upload telemetry", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('input', type=str, nargs='?', default="-", help="Input file (signed 16-bit samples, or see --input-format). Default: stdin")
+    add_modem_arguments(parser)
+    add_input_arguments(parser)
+    parser.add_argument("--stats", type=int, default=5, metavar="N", help="Update the modem statistics (SNR and frequency estimates) added to packets every N modem blocks.")
+    parser.add_argument('-c', '--config', type=str, default='user.cfg', help="Configuration file to use. Default: user.cfg")
+    parser.add_argument("--noupload", action="store_true", default=False, help="Disable SondeHub upload.")
+    parser.add_argument("--log", type=str, default="telemetry.log", help="Write decoded telemetry to this log file, or none.")
+    parser.add_argument("--payload-list", type=str, default="payload_id_list.txt", help="List of known payload IDs.")
+    parser.add_argument("--custom-fields", type=str, default="custom_field_list.json", help="List of payload Custom Fields")
+    parser.add_argument("--nodownload", action="store_true", default=False, help="Do not download new lists.")
+    parser.add_argument("--freq_hz", type=float, default=None, help="Receiver IQ centre frequency in Hz, used in determine the absolute frequency of a telemetry burst.")
+    parser.add_argument("--freq_target_hz", type=float, default=None, help="Receiver 'target' frequency in Hz, used to add metadata to station position info.")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Verbose output (set logging level to DEBUG)")
+    args = parser.parse_args()
+
+    if args.stats < 1:
+        parser.error("--stats must be at least 1")
+
+    if args.verbose:
+        logging_level = logging.DEBUG
+    else:
+        logging_level = logging.INFO
+
+    # Set up logging
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=logging_level)
+
+    # Read in the configuration file.
+    user_config = read_config(args.config)
+
+    # If we could not read the configuration file, exit.
+    if user_config == None:
+        logging.critical(f"Could not load {args.config}, exiting...")
+        sys.exit(1)
+
+    mode = parse_mode(args.mode)
+
+    if args.log != "none":
+        _logfile = open(args.log, 'a')
+        logging.info(f"Opened log file {args.log}.")
+    else:
+        _logfile = None
+
+    if mode == Mode.BINARY:
+        load_payload_lists(args.payload_list, args.custom_fields, download=not args.nodownload)
+
+    (read_input, close_input) = open_input(args, parser)
+
+    # Start the SondeHub uploader thread.
+    sondehub_uploader = create_sondehub_uploader(user_config, freq_target_hz=args.freq_target_hz, inhibit=args.noupload)
+
+    logging.info("Using User Callsign: %s" % user_config['user_call'])
+
+    demod_stats = FSKDemodStats(peak_hold=True)
+
+    handler = TelemetryHandler(
+        user_config, sondehub_uploader, demod_stats, logfile=_logfile, freq_hz=args.freq_hz, baud_rate=args.rate,
+        download=not args.nodownload, payload_list=args.payload_list, custom_fields=args.custom_fields
+    )
+
+    def frame_callback(frame):
+        if not frame.crc_pass:
+            logging.debug(f"Packet failed CRC: {frame.data}")
+            return
+        if type(frame.data) == bytes:
+            handler.handle_binary(frame.data)
+        else:
+            handler.handle_rtty(frame.data.strip())
+
+    logging.info(f"Started Horus Receiver ({args.mode}, {args.rate} baud, {args.sample_rate} Hz sample rate{' IQ' if args.q else ''}). Hit CTRL-C to exit.")
+    try:
+        with HorusLib(mode=mode, tone_spacing=args.tonespacing, stereo_iq=args.q, callback=frame_callback, sample_rate=args.sample_rate, rate=int(args.rate), native_rate=args.native_rate) as horus:
+            if args.fsk_lower > -99999 and args.fsk_upper > args.fsk_lower:
+                horus.set_estimator_limits(args.fsk_lower, args.fsk_upper)
+                logging.info(f"Frequency Estimator Limits set to {args.fsk_lower}-{args.fsk_upper} Hz.")
+
+            next_stats_block = 0
+            while True:
+                data = read_input(horus.audio_nin * 2 * (2 if horus.stereo_iq else 1))
+                if not data: # EOF
+                    logging.info("End of input, exiting.")
+                    break
+                horus.add_samples(data)
+
+                # Packets are handed to the callback before this, so they are tagged with the statistics
+                # from up to --stats blocks earlier, as horus_uploader tags them with the last stats line.
+                if horus.blocks >= next_stats_block:
+                    next_stats_block = horus.blocks + args.stats
+                    demod_stats.update(stats_dict(horus.get_stats(), horus.mfsk))
+
+    except KeyboardInterrupt:
+        logging.info("Caught CTRL-C, exiting.")
+
+    finally:
+        close_input()
+        sondehub_uploader.close()
+        if not args.noupload:
+            sondehub_uploader.input_process_thread.join()
+        if _logfile:
+            _logfile.close()
+
+
+class HorusRxTests(unittest.TestCase):
+    SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+    def run_rx(self, argv):
+        _summaries = []
+        with tempfile.TemporaryDirectory() as _dir:
+            _log = os.path.join(_dir, "telemetry.log")
+            with patch.object(sys, "argv", ["horus_rx", "--noupload", "--nodownload", "--config", os.path.join(_dir, "none.cfg"), "--log", _log] + argv), \
+                 patch("horusdemodlib.rx.read_config", return_value={"user_call": "N0CALL", "station_lat": 0.0, "station_lon": 0.0, "radio_comment": "", "antenna_comment": "", "summary_port": 55672}), \
+                 patch("horusdemodlib.uploader.send_payload_summary", side_effect=lambda x, port: _summaries.append(x)):
+                main()
+            with open(_log) as f:
+                _lines = f.read().splitlines()
+        return (_lines, _summaries)
+
+    def test_binary(self):
+        (_lines, _summaries) = self.run_rx(["-m", "binary", "--sample-rate", "8000", os.path.join(self.SAMPLES_DIR, "horus_v3_100bd_8000_s16.raw")])
+        self.assertEqual(len(_lines), 9)
+        self.assertEqual(len(_summaries), 9)
+        # Modem statistics were added to the packets.
+        self.assertTrue(all(x['baud_rate'] == 100 and x['snr'] != 0.0 for x in _summaries[1:]))
+
+    def test_rtty(self):
+        (_lines, _summaries) = self.run_rx(["-m", "rtty8n2", "--rate", "300", "--input-format", "wav", os.path.join(self.SAMPLES_DIR, "rtty_8n2.wav")])
+        self.assertEqual(len(_lines), 4)
+        self.assertTrue(all(x.startswith("$$") for x in _lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+#
+#   HorusDemodLib - UDP Sample Input
+#
+#   Receives raw signed 16-bit audio sent as UDP datagrams, as produced by the
+#   UDP audio output of GQRX and SDR++, so horus_demod doesn't need an nc process
+#   in front of it.
+#
+import logging
+import select
+import socket
+import threading
+import time
+import unittest
+
+
+class UDPSampleSource():
+    """
+    Receives signed 16-bit samples from UDP datagrams.
+
+    read() blocks until at least one datagram has arrived, then collects everything else already
+    waiting in the socket buffer without blocking, and returns it all as one buffer.
+
+    The GQRX / SDR++ streams have no sequence numbers, so dropped datagrams are detected by timing:
+    each time the socket buffer is drained, the audio received since it was last drained is compared
+    against the time that has passed. A shortfall of more than gap_threshold (plus one datagram's
+    worth of slack) is counted as a gap. Gaps of up to max_fill seconds are filled with silence, so
+    the modem's symbol timing isn't thrown out. Reordered datagrams can't be detected in these streams.
+
+    Example usage:
+
+    with UDPSampleSource("127.0.0.1", 7355, sample_rate=48000) as source:
+        while True:
+            horus.add_samples(source.read())
+    """
+
+    # Socket receive buffer to ask for. The OS may give us less (see net.core.rmem_max on Linux).
+    DEFAULT_RCVBUF = 4 * 1024 * 1024
+
+    # Largest datagram we expect
+    MAX_DATAGRAM = 65536
+
+    def __init__(self, host: str, port: int, sample_rate: int, channels=1, rcvbuf=DEFAULT_RCVBUF, batch_size=262144, gap_threshold=0.05, max_fill=1.0, timeout=None):
+        """
+        Parameters
+        ----------
+        host : str
+            Address to listen on
+        port : int
+            UDP port to listen on, 0 to pick a free port (see .port)
+        sample_rate : int
+            Sample rate of the incoming audio, used for gap detection
+        channels : int
+            Number of interleaved channels, 2 for IQ
+        rcvbuf : int
+            Socket receive buffer size to request (bytes)
+        batch_size : int
+            Most bytes to return from one read()
+        gap_threshold : float
+            Extra delay (seconds) before a late datagram is counted as a gap
+        max_fill : float
+            Largest gap (seconds) to fill with silence. Longer gaps are counted, but not filled.
+        timeout : float
+            Seconds read() waits for data before returning b''. None to wait forever.
+        """
+        self.sample_rate = sample_rate
+        self.frame_bytes = 2 * channels
+        self.batch_size = batch_size
+        self.gap_threshold = gap_threshold
+        self.timeout = timeout
+
+        _family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.socket = socket.socket(_family, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        self.rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if self.rcvbuf < rcvbuf:
+            logging.warning(f"UDP receive buffer limited to {self.rcvbuf} bytes (asked for {rcvbuf}), datagrams may be dropped under load.")
+
+        # Silence for gap filling is written in front of the received data, so both go out as one buffer.
+        self._fill_bytes = int(max_fill * sample_rate) * self.frame_bytes
+        self._buf = bytearray(self._fill_bytes + batch_size + self.MAX_DATAGRAM)
+        self._view = memoryview(self._buf)
+
+        # Time the socket buffer was last drained, and how much audio (seconds) has arrived since then.
+        self._drained_time = None
+        self._drained_audio = 0.0
+
+        # Statistics
+        self.datagrams = 0
+        self.bytes = 0
+        self.batches = 0
+        self.gaps = 0
+        self.lost_samples = 0
+        self.misaligned_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def _recv(self, pos: int) -> int:
+        """ Receive one datagram into the buffer at pos, returning its length, or -1 if none is waiting """
+        try:
+            _len = self.socket.recv_into(self._view[pos:pos + self.MAX_DATAGRAM], self.MAX_DATAGRAM)
+        except BlockingIOError:
+            return -1
+        self.datagrams += 1
+        self.bytes += _len
+        return _len
+
+    def read(self) -> memoryview:
+        """
+        Return all of the samples received since the last call, blocking until there is at least one datagram.
+
+        The returned view is only valid until the next call. Returns b'' only if a timeout was set and it expires,
+        never on a spurious wakeup or an empty datagram, so callers can treat b'' as the end of the input.
+        """
+        _deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            _samples = self._read_batch(_deadline)
+            if _samples is None:
+                return b''
+            if len(_samples) > 0:
+                return _samples
+
+    def _wait(self, deadline) -> int:
+        """ Wait for a datagram with something in it, and receive it into the buffer, returning its length, or -1 on timeout """
+        while True:
+            _len = self._recv(self._fill_bytes)
+            if _len > 0:
+                return _len
+            if _len == 0:
+                # Empty datagram, there's nothing to use in it.
+                continue
+            _timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            if not select.select([self.socket], [], [], _timeout)[0] and deadline is not None and time.monotonic() >= deadline:
+                return -1
+
+    def _read_batch(self, deadline):
+        """ Receive one batch for read(), which may be empty if only part of a sample frame arrived. None on timeout. """
+        _start = self._fill_bytes
+
+        _len = self._wait(deadline)
+        if _len < 0:
+            return None
+        _end = _start + _len
+        _last = _len
+
+        # Collect everything else that is already waiting.
+        _drained = False
+        while _end - self._fill_bytes < self.batch_size:
+            _len = self._recv(_end)
+            if _len < 0:
+                _drained = True
+                break
+            _end += _len
+            _last = _len or _last
+
+        self._drained_audio += ((_end - _start) // self.frame_bytes) / self.sample_rate
+
+        if _drained:
+            _now = time.monotonic()
+            if self._drained_time is not None:
+                # Allow for the sender being up to one datagram ahead of what we have.
+                _shortfall = (_now - self._drained_time) - self._drained_audio
+                if _shortfall > self.gap_threshold + (_last // self.frame_bytes) / self.sample_rate:
+                    _lost = int(_shortfall * self.sample_rate)
+                    self.gaps += 1
+                    self.lost_samples += _lost
+                    logging.warning(f"UDP input gap of {_shortfall:.3f} s, about {_lost} samples lost.")
+
+                    # Fill with silence in front of this batch, which is where the audio went missing.
+                    _fill = min(_lost * self.frame_bytes, self._fill_bytes)
+                    _start -= _fill
+                    self._view[_start:self._fill_bytes] = bytes(_fill)
+
+            self._drained_time = _now
+            self._drained_audio = 0.0
+
+        # Only hand out whole sample frames.
+        _extra = (_end - _start) % self.frame_bytes
+        if _extra:
+            self.misaligned_bytes += _extra
+            _end -= _extra
+
+        if _end > _start:
+            self.batches += 1
+        return self._view[_start:_end]
+
+    def summary(self) -> str:
+        """ One line summary of the receive statistics """
+        return (
+            f"{self.datagrams} datagrams, {self.bytes} bytes in {self.batches} batches, "
+            f"{self.gaps} gaps ({self.lost_samples} samples lost), {self.misaligned_bytes} misaligned bytes"
+        )
+
+
+class UDPSampleSourceTests(unittest.TestCase):
+    def setUp(self):
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.sender.close()
+
+    def test_batched_receive(self):
+        with UDPSampleSource("127.0.0.1", 0, sample_rate=48000, timeout=1) as source:
+            _data = bytes(range(256)) * 16
+            for i in range(0, len(_data), 1024):
+                self.sender.sendto(_data[i:i + 1024], ("127.0.0.1", source.port))
+            # Odd sized datagram, the trailing byte can't be used
+            self.sender.sendto(b"\x01\x02\x03", ("127.0.0.1", source.port))
+            time.sleep(0.05)
+
+            self.assertEqual(bytes(source.read()), _data + b"\x01\x02")
+            self.assertEqual(source.datagrams, 5)
+            self.assertEqual(source.batches, 1)
+            self.assertEqual(source.misaligned_bytes, 1)
+            self.assertEqual(source.gaps, 0)
+
+            self.assertEqual(source.read(), b'')
+
+    def test_gap(self):
+        with UDPSampleSource("127.0.0.1", 0, sample_rate=8000, gap_threshold=0.1, timeout=2) as source:
+            _datagram = b"\x10\x00" * 80  # 10 ms of audio
+            self.sender.sendto(_datagram, ("127.0.0.1", source.port))
+            self.assertEqual(bytes(source.read()), _datagram)
+
+            time.sleep(0.3)
+            self.sender.sendto(_datagram, ("127.0.0.1", source.port))
+            _data = bytes(source.read())
+
+            self.assertEqual(source.gaps, 1)
+            self.assertGreater(source.lost_samples, 1500)
+            self.assertLess(source.lost_samples, 4000)
+            self.assertEqual(len(_data), len(_datagram) + source.lost_samples * 2)
+            self.assertEqual(_data[-len(_datagram):], _datagram)
+            self.assertEqual(_data[:2], b"\x00\x00")
+
+    def test_no_false_eof(self):
+        # An empty datagram, or a lone byte that isn't a whole sample, must not look like the end of the input.
+        with UDPSampleSource("127.0.0.1", 0, sample_rate=8000, gap_threshold=1.0, timeout=1) as source:
+            def _send_later():
+                time.sleep(0.05)
+                self.sender.sendto(b"", ("127.0.0.1", source.port))
+                time.sleep(0.05)
+                self.sender.sendto(b"\x01", ("127.0.0.1", source.port))
+                time.sleep(0.05)
+                self.sender.sendto(b"\x02\x00", ("127.0.0.1", source.port))
+
+            _sender = threading.Thread(target=_send_later)
+            _sender.start()
+            _data = bytes(source.read())
+            _sender.join()
+            self.assertEqual(_data, b"\x02\x00")
+            self.assertEqual(source.batches, 1)
+
+            _start = time.monotonic()
+            self.assertEqual(source.read(), b'')
+            self.assertGreater(time.monotonic() - _start, 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -57,6 +57,189 @@ def read_config(filename):
         return None
 
 
+def load_payload_lists(payload_list="payload_id_list.txt", custom_fields="custom_field_list.json", download=True):
+    ''' Load the payload ID and custom field lists into horusdemodlib.payloads, downloading new copies first if download is set. '''
+    if not download:
+        logging.info("Using local lists.")
+        horusdemodlib.payloads.HORUS_PAYLOAD_LIST = read_payload_list(filename=payload_list)
+        horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = read_custom_field_list(filename=custom_fields)
+    else:
+        # Download
+        horusdemodlib.payloads.HORUS_PAYLOAD_LIST = init_payload_id_list(filename=payload_list)
+        horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = init_custom_field_list(filename=custom_fields)
+        
+    logging.info(f"Payload list contains {len(list(horusdemodlib.payloads.HORUS_PAYLOAD_LIST.keys()))} entries.")
+
+    logging.info(f"Custom Field list contains {len(list(horusdemodlib.payloads.HORUS_CUSTOM_FIELDS.keys()))} entries.")
+
+
+def create_sondehub_uploader(user_config, freq_target_hz=None, inhibit=False):
+    ''' Start a SondeHub Amateur uploader for the station described in user_config (from read_config) '''
+    if freq_target_hz:
+        _listener_freq_str = f" ({freq_target_hz/1e6:.3f} MHz)"
+    else:
+        _listener_freq_str = ""
+
+    if user_config['station_lat'] == 0.0 and user_config['station_lon'] == 0.0:
+        _sondehub_user_pos = None
+    else:
+        _sondehub_user_pos = [user_config['station_lat'], user_config['station_lon'], 0.0]
+
+    return SondehubAmateurUploader(
+        upload_rate = 2,
+        user_callsign = user_config['user_call'],
+        user_position = _sondehub_user_pos,
+        user_radio = user_config['radio_comment'] + _listener_freq_str,
+        user_antenna = user_config['antenna_comment'],
+        software_name = "horusdemodlib",
+        software_version = horusdemodlib.__version__,
+        inhibit=inhibit
+    )
+
+
+class TelemetryHandler():
+    '''
+    Decodes received packets, adds in the latest modem statistics, and passes them on to the UDP summary
+    output, SondeHub Amateur and the telemetry log file.
+
+    Used by horus_uploader, on packets read from horus_demod's output, and by horus_rx on packets straight
+    from the modem.
+    '''
+
+    # Only try and download new payload ID / custom field lists every 30 min.
+    MIN_DOWNLOAD_TIME = 30*60
+
+    def __init__(self, user_config, sondehub_uploader, demod_stats, logfile=None, freq_hz=None, baud_rate=None,
+                 download=True, payload_list="payload_id_list.txt", custom_fields="custom_field_list.json"):
+        '''
+        Required Fields:
+            user_config (dict): Configuration, from read_config.
+            sondehub_uploader (SondehubAmateurUploader): Uploader to pass decoded packets to.
+            demod_stats (FSKDemodStats): Modem statistics, for the SNR and frequency estimates added to each packet.
+
+        Optional Fields:
+            logfile (file): Write decoded telemetry to this file.
+            freq_hz (float): Receiver IQ centre frequency, to work out the absolute frequency of each packet.
+            baud_rate (int): Modulation baud rate, added to each packet.
+            download (bool): Re-download the payload lists when an unknown payload ID is seen.
+            payload_list, custom_fields (str): Where to save re-downloaded lists.
+        '''
+        self.user_config = user_config
+        self.sondehub_uploader = sondehub_uploader
+        self.demod_stats = demod_stats
+        self.logfile = logfile
+        self.freq_hz = freq_hz
+        self.baud_rate = baud_rate
+        self.download = download
+        self.payload_list = payload_list
+        self.custom_fields = custom_fields
+
+        # Handle re-downloading of payload ID lists.
+        self.next_download_time = time.time()
+
+    def add_modem_info(self, decoded):
+        ''' Add the SNR and frequency estimates, and baud rate, to a decoded packet '''
+        demod_stats = self.demod_stats
+
+        # Add in SNR data.
+        _snr = demod_stats.snr
+        decoded['snr'] = _snr
+
+        # Add in frequency estimate, if we have been supplied a receiver frequency.
+        if self.freq_hz:
+            decoded['f_centre'] = int(demod_stats.fest_mean) + int(self.freq_hz)
+
+        # Add in tone spacing estimate.
+        if demod_stats.fest_spacing > 0.0:
+            decoded['tone_spacing'] = int(demod_stats.fest_spacing)
+
+        # Add in baud rate, if provided.
+        if self.baud_rate:
+            decoded['baud_rate'] = int(self.baud_rate)
+
+    def handle_rtty(self, data: str):
+        ''' Handle a UKHAS-standard ASCII telemetry sentence '''
+        # RTTY packet handling.
+        # Attempt to extract fields from it:
+        logging.info(f"Received raw RTTY packet: {data}")
+        try:
+            _decoded = parse_ukhas_string(data)
+            # If we get here, the string is valid!
+
+            self.add_modem_info(_decoded)
+
+            # Send via UDP
+            send_payload_summary(_decoded, port=self.user_config['summary_port'])
+
+            # Logfile string
+            _decoded_str = "$$" + data.split('$')[-1] + '\n'
+
+            # Upload the string to Sondehub Amateur
+            self.sondehub_uploader.add(_decoded)
+
+            if self.logfile:
+                self.logfile.write(_decoded_str)
+                self.logfile.flush()
+
+            logging.info(f"Decoded String (SNR {self.demod_stats.snr:.1f} dB): {_decoded_str[:-1]}")
+
+        except Exception as e:
+            logging.error(f"Decode Failed: {traceback.format_exc()}")
+
+    def handle_binary(self, data: bytes):
+        ''' Handle a binary telemetry packet '''
+        logging.info(f"Received raw binary packet: {data.hex().upper()}")
+        try:
+            _decoded = decode_packet(data)
+            # If we get here, we have a valid packet!
+
+            if (_decoded['callsign'] == "UNKNOWN_PAYLOAD_ID") and self.download:
+                # We haven't seen this payload ID. Our payload ID list might be out of date.
+                if time.time() > self.next_download_time:
+                    logging.info("Observed unknown Payload ID, attempting to re-download lists.")
+                    
+                    # Download lists.
+                    horusdemodlib.payloads.HORUS_PAYLOAD_LIST = init_payload_id_list(filename=self.payload_list)
+                    horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = init_custom_field_list(filename=self.custom_fields)
+                    
+                    # Update next_download_time so we don't re-attempt to download with every new packet.
+                    self.next_download_time = time.time() + self.MIN_DOWNLOAD_TIME
+
+                    # Re-attempt to decode the packet.
+                    _decoded = decode_packet(data)
+                    if _decoded['callsign'] != "UNKNOWN_PAYLOAD_ID":
+                        logging.info(f"Payload found in new payload ID list - {_decoded['callsign']}")
+            
+            self.add_modem_info(_decoded)
+
+            # Send via UDP
+            send_payload_summary(_decoded, port=self.user_config['summary_port'])
+
+            # Upload the string to Sondehub Amateur
+            self.sondehub_uploader.add(_decoded)
+
+            if self.logfile:
+                self.logfile.write(_decoded['ukhas_str']+'\n')
+                self.logfile.flush()
+
+            logging.info(
+                f"Decoded Binary Packet (" +
+                f"SNR: {self.demod_stats.snr:.1f} dB" +
+                (f", f_centre: {_decoded['f_centre']/1e6:.6f} MHz" if 'f_centre' in _decoded else '' ) +
+                (f", tone_spacing: {_decoded['tone_spacing']:.0f} Hz spacing" if 'tone_spacing' in _decoded else '') +
+                f"): {_decoded['ukhas_str']}"
+            )
+            # Remove a few fields from the packet before printing.
+            _temp_packet = _decoded.copy()
+            _temp_packet.pop('packet_format')
+            _temp_packet.pop('ukhas_str')
+            logging.debug(f"Binary Packet Contents: {_temp_packet}")
+        
+        except Exception as e:
+            logging.error(f"Decode Failed: {e}")
+            logging.debug(f"Traceback: {traceback.format_exc()}")
+
+
 def main():
 
     # Read command-line arguments
@@ -99,52 +282,21 @@ def main():
     else:
         _logfile = None
 
-    # Some variables to handle re-downloading of payload ID lists.
-    min_download_time = 30*60 # Only try and download new payload ID / custom field lists every 30 min.
-    next_download_time = time.time()
-
     if args.rtty == False:
-
-        if args.nodownload:
-            logging.info("Using local lists.")
-            horusdemodlib.payloads.HORUS_PAYLOAD_LIST = read_payload_list(filename=args.payload_list)
-            horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = read_custom_field_list(filename=args.custom_fields)
-        else:
-            # Download
-            horusdemodlib.payloads.HORUS_PAYLOAD_LIST = init_payload_id_list(filename=args.payload_list)
-            horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = init_custom_field_list(filename=args.custom_fields)
-            
-        logging.info(f"Payload list contains {len(list(horusdemodlib.payloads.HORUS_PAYLOAD_LIST.keys()))} entries.")
-
-        logging.info(f"Custom Field list contains {len(list(horusdemodlib.payloads.HORUS_CUSTOM_FIELDS.keys()))} entries.")
+        load_payload_lists(args.payload_list, args.custom_fields, download=not args.nodownload)
 
     # Start the SondeHub uploader thread.
-
-    if args.freq_target_hz:
-        _listener_freq_str = f" ({args.freq_target_hz/1e6:.3f} MHz)"
-    else:
-        _listener_freq_str = ""
-
-    if user_config['station_lat'] == 0.0 and user_config['station_lon'] == 0.0:
-        _sondehub_user_pos = None
-    else:
-        _sondehub_user_pos = [user_config['station_lat'], user_config['station_lon'], 0.0]
-
-    sondehub_uploader = SondehubAmateurUploader(
-        upload_rate = 2,
-        user_callsign = user_config['user_call'],
-        user_position = _sondehub_user_pos,
-        user_radio = user_config['radio_comment'] + _listener_freq_str,
-        user_antenna = user_config['antenna_comment'],
-        software_name = "horusdemodlib",
-        software_version = horusdemodlib.__version__,
-        inhibit=args.noupload
-    )
+    sondehub_uploader = create_sondehub_uploader(user_config, freq_target_hz=args.freq_target_hz, inhibit=args.noupload)
 
     logging.info("Using User Callsign: %s" % user_config['user_call'])
 
     demod_stats = FSKDemodStats(peak_hold=True)
 
+    handler = TelemetryHandler(
+        user_config, sondehub_uploader, demod_stats, logfile=_logfile, freq_hz=args.freq_hz, baud_rate=args.baud_rate,
+        download=not args.nodownload, payload_list=args.payload_list, custom_fields=args.custom_fields
+    )
+
     logging.info("Started Horus Demod Uploader. Hit CTRL-C to exit.")
     # Main loop
     try:
@@ -164,46 +316,7 @@ def main():
             # Otherwise, we assume it is a string of hexadecimal bytes, and attempt to parse it as a binary telemetry packet.
 
             if data.startswith('$$'):
-                # RTTY packet handling.
-                # Attempt to extract fields from it:
-                logging.info(f"Received raw RTTY packet: {data}")
-                try:
-                    _decoded = parse_ukhas_string(data)
-                    # If we get here, the string is valid!
-
-                    # Add in SNR data.
-                    _snr = demod_stats.snr
-                    _decoded['snr'] = _snr
-
-                    # Add in frequency estimate, if we have been supplied a receiver frequency.
-                    if args.freq_hz:
-                        _decoded['f_centre'] = int(demod_stats.fest_mean) + int(args.freq_hz)
-
-                    # Add in tone spacing estimate.
-                    if demod_stats.fest_spacing > 0.0:
-                        _decoded['tone_spacing'] = int(demod_stats.fest_spacing)
-
-                    # Add in baud rate, if provided.
-                    if args.baud_rate:
-                        _decoded['baud_rate'] = int(args.baud_rate)
-
-                    # Send via UDP
-                    send_payload_summary(_decoded, port=user_config['summary_port'])
-
-                    # Logfile string
-                    _decoded_str = "$$" + data.split('$')[-1] + '\n'
-
-                    # Upload the string to Sondehub Amateur
-                    sondehub_uploader.add(_decoded)
-
-                    if _logfile:
-                        _logfile.write(_decoded_str)
-                        _logfile.flush()
-
-                    logging.info(f"Decoded String (SNR {demod_stats.snr:.1f} dB): {_decoded_str[:-1]}")
-
-                except Exception as e:
-                    logging.error(f"Decode Failed: {traceback.format_exc()}")
+                handler.handle_rtty(data)
             
             elif data.startswith('{'):
                 # Possibly a line of modem statistics, attempt to decode it.
@@ -211,76 +324,13 @@ def main():
 
             else:
                 # Handle binary packets
-                logging.info(f"Received raw binary packet: {data}")
                 try:
                     _binary_string = codecs.decode(data, 'hex')
                 except TypeError as e:
                     logging.error("Error parsing line as hexadecimal (%s): %s" % (str(e), data))
                     continue
 
-                try:
-                    _decoded = decode_packet(_binary_string)
-                    # If we get here, we have a valid packet!
-
-                    if (_decoded['callsign'] == "UNKNOWN_PAYLOAD_ID") and not args.nodownload:
-                        # We haven't seen this payload ID. Our payload ID list might be out of date.
-                        if time.time() > next_download_time:
-                            logging.info("Observed unknown Payload ID, attempting to re-download lists.")
-                            
-                            # Download lists.
-                            horusdemodlib.payloads.HORUS_PAYLOAD_LIST = init_payload_id_list(filename=args.payload_list)
-                            horusdemodlib.payloads.HORUS_CUSTOM_FIELDS = init_custom_field_list(filename=args.custom_fields)
-                            
-                            # Update next_download_time so we don't re-attempt to download with every new packet.
-                            next_download_time = time.time() + min_download_time
-
-                            # Re-attempt to decode the packet.
-                            _decoded = decode_packet(_binary_string)
-                            if _decoded['callsign'] != "UNKNOWN_PAYLOAD_ID":
-                                logging.info(f"Payload found in new payload ID list - {_decoded['callsign']}")
-                    
-                    # Add in SNR data.
-                    _snr = demod_stats.snr
-                    _decoded['snr'] = _snr
-
-                    # Add in frequency estimate, if we have been supplied a receiver frequency.
-                    if args.freq_hz:
-                        _decoded['f_centre'] = int(demod_stats.fest_mean) + int(args.freq_hz)
-
-                    # Add in tone spacing estimate.
-                    if demod_stats.fest_spacing > 0.0:
-                        _decoded['tone_spacing'] = int(demod_stats.fest_spacing)
-
-                    # Add in baud rate, if provided.
-                    if args.baud_rate:
-                        _decoded['baud_rate'] = int(args.baud_rate)
-
-                    # Send via UDP
-                    send_payload_summary(_decoded, port=user_config['summary_port'])
-
-                    # Upload the string to Sondehub Amateur
-                    sondehub_uploader.add(_decoded)
-
-                    if _logfile:
-                        _logfile.write(_decoded['ukhas_str']+'\n')
-                        _logfile.flush()
-
-                    logging.info(
-                        f"Decoded Binary Packet (" +
-                        f"SNR: {demod_stats.snr:.1f} dB" +
-                        (f", f_centre: {_decoded['f_centre']/1e6:.6f} MHz" if 'f_centre' in _decoded else '' ) +
-                        (f", tone_spacing: {_decoded['tone_spacing']:.0f} Hz spacing" if 'tone_spacing' in _decoded else '') +
-                        f"): {_decoded['ukhas_str']}"
-                    )
-                    # Remove a few fields from the packet before printing.
-                    _temp_packet = _decoded.copy()
-                    _temp_packet.pop('packet_format')
-                    _temp_packet.pop('ukhas_str')
-                    logging.debug(f"Binary Packet Contents: {_temp_packet}")
-                
-                except Exception as e:
-                    logging.error(f"Decode Failed: {e}")
-                    logging.debug(f"Traceback: {traceback.format_exc()}")
+                handler.handle_binary(_binary_string)
 
     except KeyboardInterrupt:
         logging.info("Caught CTRL-C, exiting.")
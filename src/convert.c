@@ -0,0 +1,43 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: convert.c
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Bulk sample format conversion, so recordings in other formats can be fed
+  to the modem without running them through sox or csdr first.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "convert.h"
+
+void convert_f32_to_s16(short out[], float in[], int n) {
+    int   i;
+    float v;
+
+    /* simple enough for the compiler to vectorise */
+
+    for(i=0; i<n; i++) {
+        v = in[i]*32767.0f;
+        v = v > 32767.0f ? 32767.0f : v;
+        v = v < -32768.0f ? -32768.0f : v;
+        out[i] = (short)(v >= 0.0f ? v + 0.5f : v - 0.5f);
+    }
+}
@@ -0,0 +1,47 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: convert.h
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Bulk sample format conversion, so recordings in other formats can be fed
+  to the modem without running them through sox or csdr first.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef __CONVERT__
+#define __CONVERT__
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * Convert n float samples in the range [-1.0, 1.0] to shorts, scaling by
+ * 32767 (as csdr convert_f_s16 does), rounding, and clipping anything out
+ * of range.
+ */
+void convert_f32_to_s16(short out[], float in[], int n);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
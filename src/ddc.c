@@ -0,0 +1,161 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: ddc.c
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Digital down converter. The input is mixed down by the channel centre
+  frequency, then low pass filtered and decimated by D. The filter is only
+  evaluated at the outputs we keep, so the cost per channel is the mixer
+  at the input rate plus one K tap filter per output sample.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <assert.h>
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "ddc.h"
+#include "comp_prim.h"
+
+struct DDC *ddc_create(int Fs, int D, float fc, float taps[], int ntaps) {
+    struct DDC *d;
+    int k;
+
+    assert(Fs > 0);
+    assert(D > 0);
+    assert(ntaps > 0);
+
+    d = (struct DDC*)malloc(sizeof(struct DDC)); assert(d != NULL);
+
+    d->D = D; d->K = ntaps;
+
+    /* stored time reversed so it lines up with the oldest-first history buffer */
+
+    d->taps = (float*)malloc(sizeof(float)*ntaps); assert(d->taps != NULL);
+    for(k=0; k<ntaps; k++) {
+        d->taps[ntaps-1-k] = taps[k];
+    }
+
+    d->phase_step = comp_exp_j(-2.0*M_PI*fc/Fs);
+
+    d->buf = NULL;
+    d->buf_frames = 0;
+    ddc_reset(d);
+
+    return d;
+}
+
+void ddc_destroy(struct DDC *d) {
+    assert(d != NULL);
+    free(d->taps);
+    free(d->buf);
+    free(d);
+}
+
+void ddc_reset(struct DDC *d) {
+    assert(d != NULL);
+    d->phase.real = 1.0; d->phase.imag = 0.0;
+    d->next = 0;
+    if (d->buf != NULL) {
+        memset(d->buf, 0, sizeof(COMP)*(d->K-1));
+    }
+}
+
+int ddc_max_out(struct DDC *d, int nin) {
+    assert(d != NULL);
+    return nin/d->D + 1;
+}
+
+/* make sure buf can hold the history plus nin new frames, only allocates when the block size grows */
+
+static COMP *ddc_reserve(struct DDC *d, int nin) {
+    int frames = d->K - 1 + nin;
+
+    if (frames > d->buf_frames) {
+        int first = (d->buf == NULL);
+        d->buf = (COMP*)realloc(d->buf, sizeof(COMP)*frames); assert(d->buf != NULL);
+        if (first) {
+            memset(d->buf, 0, sizeof(COMP)*(d->K-1));
+        }
+        d->buf_frames = frames;
+    }
+
+    return &d->buf[d->K-1];
+}
+
+static short ddc_to_short(float v) {
+    if (v > 32767.0) v = 32767.0;
+    if (v < -32768.0) v = -32768.0;
+    return (short)(v >= 0 ? v + 0.5 : v - 0.5);
+}
+
+int ddc_process_s16(struct DDC *d, short out[], short in[], int nin) {
+    COMP  *x, s;
+    float  mag;
+    int    i, k, n, nout;
+
+    assert(d != NULL);
+    if (nin <= 0) {
+        return 0;
+    }
+
+    /* mix the whole block down to baseband */
+
+    x = ddc_reserve(d, nin);
+    for(i=0; i<nin; i++) {
+        s.real = in[2*i];
+        s.imag = in[2*i + 1];
+        x[i] = cmult(s, d->phase);
+        d->phase = cmult(d->phase, d->phase_step);
+    }
+
+    /* keep the phasor on the unit circle */
+
+    mag = cabsolute(d->phase);
+    d->phase.real /= mag;
+    d->phase.imag /= mag;
+
+    /* filter, only at the outputs we keep. Output n uses buf[n..n+K-1], the newest being input n */
+
+    nout = 0;
+    for(n=d->next; n<nin; n+=d->D) {
+        const COMP  *b = &d->buf[n];
+        const float *h = d->taps;
+        float acc_r = 0.0, acc_i = 0.0;
+
+        for(k=0; k<d->K; k++) {
+            acc_r += h[k]*b[k].real;
+            acc_i += h[k]*b[k].imag;
+        }
+
+        out[2*nout] = ddc_to_short(acc_r);
+        out[2*nout + 1] = ddc_to_short(acc_i);
+        nout++;
+    }
+
+    /* keep the last K-1 frames as history for the next block */
+
+    d->next = n - nin;
+    memmove(d->buf, &d->buf[nin], sizeof(COMP)*(d->K-1));
+
+    return nout;
+}
@@ -0,0 +1,78 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: ddc.h
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Digital down converter, used to pull narrow channels out of a wideband
+  IQ stream so each modem can run at a much lower sample rate.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef __DDC__
+#define __DDC__
+
+#include "comp.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+struct DDC {
+    int    D;               /* decimation factor                                  */
+    int    K;               /* number of filter taps                              */
+    float *taps;            /* low pass filter, time reversed                     */
+    COMP   phase;           /* mixer phasor                                       */
+    COMP   phase_step;      /* mixer phasor rotation per input sample             */
+    int    next;            /* input frame of the next output, relative to block  */
+    COMP  *buf;             /* K-1 frames of mixed history, then the mixed block  */
+    int    buf_frames;      /* allocated size of buf in frames                    */
+};
+
+/*
+ * Create a down converter for one channel.
+ *
+ * int Fs - Input sample rate (Hz)
+ * int D - Decimation factor, the output sample rate is Fs/D
+ * float fc - Channel centre frequency (Hz), which is shifted down to 0 Hz
+ * float taps[] - Low pass filter at the input rate, with a cutoff below Fs/(2*D)
+ * int ntaps - Number of taps in taps[]
+ */
+struct DDC *ddc_create(int Fs, int D, float fc, float taps[], int ntaps);
+
+void ddc_destroy(struct DDC *d);
+
+/* Clear history and mixer phase so the next block is treated as the start of a new stream */
+void ddc_reset(struct DDC *d);
+
+/* Largest number of output frames the next call may produce for nin input frames */
+int  ddc_max_out(struct DDC *d, int nin);
+
+/*
+ * Down convert nin frames of interleaved IQ input. Returns the number of IQ
+ * frames written to out[], which must have room for ddc_max_out(d, nin) frames.
+ */
+int  ddc_process_s16(struct DDC *d, short out[], short in[], int nin);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
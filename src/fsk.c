@@ -35,10 +35,6 @@
 /* This needs square roots, may take more cpu time than it's worth */
 #define EST_EBNO
 
-/* This is a flag to make the mod/demod allocate their memory on the stack instead of the heap */
-/* At large sample rates, there's not enough stack space to run the demod */
-#define DEMOD_ALLOC_STACK
-
 /* This is a flag for the freq. estimator to use a precomputed/rt computed hann window table
    On platforms with slow cosf, this will produce a substantial speedup at the cost of a small
     amount of memory 
@@ -170,6 +166,8 @@ struct FSK * fsk_create_core(int Fs, int Rs, int M, int P, int Nsym, int tx_f1,
         fsk->f_dc[i] = comp0();
         
     fsk->fft_cfg = kiss_fft_alloc(Ndft,0,NULL,NULL); assert(fsk->fft_cfg != NULL);    
+    fsk->fftin  = (kiss_fft_cpx*)malloc(sizeof(kiss_fft_cpx)*fsk->Ndft); assert(fsk->fftin != NULL);
+    fsk->fftout = (kiss_fft_cpx*)malloc(sizeof(kiss_fft_cpx)*fsk->Ndft); assert(fsk->fftout != NULL);
     fsk->Sf = (float*)malloc(sizeof(float)*fsk->Ndft); assert(fsk->Sf != NULL);
     
     #ifdef USE_HANN_TABLE
@@ -252,6 +250,8 @@ struct FSK * fsk_create_hbr(int Fs, int Rs, int M, int P, int Nsym, int tx_f1, i
 void fsk_destroy(struct FSK *fsk){
     free(fsk->f_dc);
     free(fsk->fft_cfg);
+    free(fsk->fftin);
+    free(fsk->fftout);
     free(fsk->stats);
     free(fsk->hann_table);
     free(fsk);
@@ -450,14 +450,9 @@ void fsk_demod_freq_est(struct FSK *fsk, COMP fsk_in[], float *freqs, int M) {
     int freqi[M];
     int st,en,f_zero;
     
-    /* Array to do complex FFT from using kiss_fft */
-    #ifdef DEMOD_ALLOC_STACK
-    kiss_fft_cpx *fftin  = (kiss_fft_cpx*)alloca(sizeof(kiss_fft_cpx)*Ndft);
-    kiss_fft_cpx *fftout = (kiss_fft_cpx*)alloca(sizeof(kiss_fft_cpx)*Ndft);
-    #else
-    kiss_fft_cpx *fftin  = (kiss_fft_cpx*)malloc(sizeof(kiss_fft_cpx)*Ndft);
-    kiss_fft_cpx *fftout = (kiss_fft_cpx*)malloc(sizeof(kiss_fft_cpx)*Ndft);
-    #endif
+    /* Arrays to do complex FFT from using kiss_fft, allocated by fsk_create_core() */
+    kiss_fft_cpx *fftin  = fsk->fftin;
+    kiss_fft_cpx *fftout = fsk->fftout;
     
     st = (fsk->est_min*Ndft)/Fs + Ndft/2; if (st < 0) st = 0;
     en = (fsk->est_max*Ndft)/Fs + Ndft/2; if (en > Ndft) en = Ndft;
@@ -585,15 +580,21 @@ void fsk_demod_freq_est(struct FSK *fsk, COMP fsk_in[], float *freqs, int M) {
     #ifdef MODEMPROBE_ENABLE
     modem_probe_samp_f("t_f2_est",fsk->f2_est,M);
     #endif
-
-    #ifndef DEMOD_ALLOC_STACK
-    free(fftin);
-    free(fftout);
-    #endif
 }
 
 /* core demodulator function */
 void fsk_demod_core(struct FSK *fsk, uint8_t rx_bits[], float rx_sd[], COMP fsk_in[]){
+    /* Estimate tone frequencies */
+    fsk_demod_freq_est(fsk,fsk_in,fsk->f_est,fsk->mode);
+    #ifdef MODEMPROBE_ENABLE
+    modem_probe_samp_f("t_f_est",fsk->f_est,fsk->mode);
+    #endif
+
+    fsk_demod_bits(fsk,rx_bits,rx_sd,fsk_in);
+}
+
+/* fsk_demod_core(), using tone frequencies already estimated by fsk_demod_freq_est() */
+void fsk_demod_bits(struct FSK *fsk, uint8_t rx_bits[], float rx_sd[], COMP fsk_in[]){
     int N = fsk->N;
     int Ts = fsk->Ts;
     int Rs = fsk->Rs;
@@ -625,11 +626,6 @@ void fsk_demod_core(struct FSK *fsk, uint8_t rx_bits[], float rx_sd[], COMP fsk_
     char mp_name_tmp[NMP_NAME+1]; /* Temporary string for modem probe trace names */
     #endif
 
-    /* Estimate tone frequencies */
-    fsk_demod_freq_est(fsk,fsk_in,fsk->f_est,M);
-    #ifdef MODEMPROBE_ENABLE
-    modem_probe_samp_f("t_f_est",fsk->f_est,M);
-    #endif
     float *f_est;
 
     if (fsk->freq_est_type){
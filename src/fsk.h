@@ -71,6 +71,8 @@ struct FSK {
     COMP *f_dc;             /* down converted samples               */
     
     kiss_fft_cfg fft_cfg;   /* Config for KISS FFT, used in freq est */
+    kiss_fft_cpx *fftin;    /* Ndft freq est FFT input, allocated once so the demod doesn't */
+    kiss_fft_cpx *fftout;   /* Ndft freq est FFT output                                     */
     float norm_rx_timing;   /* Normalized RX timing */
         
     
@@ -205,6 +207,14 @@ void fsk_demod_sd(struct FSK *fsk, float rx_sd[], COMP fsk_in[]);
  */
 void fsk_demod_core(struct FSK *fsk, uint8_t rx_bits[], float rx_sd[], COMP fsk_in[]);
 
+/*
+ * The two halves of fsk_demod_core(), so they can be run (and timed) separately.
+ * fsk_demod_freq_est() estimates the M tone frequencies from nin samples of fsk_in[],
+ * and fsk_demod_bits() then demodulates the same samples using fsk->f_est.
+ */
+void fsk_demod_freq_est(struct FSK *fsk, COMP fsk_in[], float *freqs, int M);
+void fsk_demod_bits(struct FSK *fsk, uint8_t rx_bits[], float rx_sd[], COMP fsk_in[]);
+
 /* enables/disables normalisation of eye diagram samples */
   
 void fsk_stats_normalise_eye(struct FSK *fsk, int normalise_enable);
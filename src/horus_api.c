@@ -30,6 +30,12 @@
 #include <assert.h>
 #include <stdlib.h>
 #include <stdio.h>
+#include <string.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
 
 #include "horus_api.h"
 #include "fsk.h"
@@ -107,7 +113,10 @@ struct horus *horus_open_advanced_sample_rate (int mode, int Rs, int tx_tone_spa
     assert(hstates != NULL);
 
     hstates->Fs = Fs; hstates->Rs = Rs; hstates->verbose = 0; hstates->mode = mode;
-    hstates->uw_count = 0;
+    hstates->uw_count = 0; hstates->uw_len = 0; hstates->uw_thresh = 0;
+    hstates->timing_enabled = 0;
+    hstates->sample_count = 0;
+    memset(&hstates->timing, 0, sizeof(hstates->timing));
 
     if (mode == HORUS_MODE_RTTY_7N1) {
         // Parameter setup for RTTY 7N2 Reception
@@ -225,6 +234,18 @@ struct horus *horus_open_advanced_sample_rate (int mode, int Rs, int tx_tone_spa
         hstates->rx_bits_len = hstates->max_packet_len;
     }
 
+    /* Pack the UW into bits for horus_find_uw(), first bit most significant. corr >= uw_thresh
+       in terms of the +/-1 correlation is the same as at most (uw_len - uw_thresh)/2 bit errors. */
+
+    assert(hstates->uw_len <= 64);
+    hstates->uw_bits = 0;
+    for (int i=0; i<hstates->uw_len; i++) {
+        hstates->uw_bits = (hstates->uw_bits << 1) | (hstates->uw[i] > 0);
+    }
+    hstates->uw_mask = (hstates->uw_len == 64) ? ~(uint64_t)0 : (((uint64_t)1 << hstates->uw_len) - 1);
+    hstates->uw_max_errors = (hstates->uw_len - hstates->uw_thresh) / 2;
+    hstates->uw_shift = 0;
+
     // Create the FSK modedm struct. Note that the low-tone-frequency parameter is unused.
     #define UNUSED 1000
     hstates->fsk = fsk_create_hbr(hstates->Fs, hstates->Rs, hstates->mFSK, P, FSK_DEFAULT_NSYM, UNUSED, tx_tone_spacing);
@@ -249,6 +270,14 @@ struct horus *horus_open_advanced_sample_rate (int mode, int Rs, int tx_tone_spa
         hstates->soft_bits[i] = 0.0;
     }
 
+    /* Input samples for the demod, sized for the largest nin so horus_rx() doesn't need to
+       allocate anything. This used to be an automatic variable, which caused OSX to
+       "Bus Error 10" (segfault), so it's on the heap. */
+
+    hstates->max_nin = hstates->fsk->N + hstates->fsk->Ts*2;
+    hstates->demod_in_comp = (COMP*)malloc(sizeof(COMP) * hstates->max_nin);
+    assert(hstates->demod_in_comp != NULL);
+
     hstates->crc_ok = 0;
     hstates->total_payload_bits = 0;
     
@@ -259,6 +288,8 @@ void horus_close (struct horus *hstates) {
     assert(hstates != NULL);
     fsk_destroy(hstates->fsk);
     free(hstates->rx_bits);
+    free(hstates->soft_bits);
+    free(hstates->demod_in_comp);
     free(hstates);
 }
 
@@ -269,41 +300,59 @@ uint32_t horus_nin(struct horus *hstates) {
     return nin;
 }
 
+/* monotonic clock for horus_get_timing(), in ns */
+
+static uint64_t horus_timing_now(void) {
+#ifdef _WIN32
+    LARGE_INTEGER count, freq;
+    QueryPerformanceCounter(&count);
+    QueryPerformanceFrequency(&freq);
+    return (uint64_t)((double)count.QuadPart * 1E9 / (double)freq.QuadPart);
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ULL + (uint64_t)ts.tv_nsec;
+#endif
+}
+
+/* add the time since *start to a stage, and move *start on to now, ready for the next stage */
+
+static void horus_timing_add(struct horus *hstates, int stage, uint64_t *start) {
+    uint64_t now = horus_timing_now();
+    hstates->timing.ns[stage] += now - *start;
+    hstates->timing.calls[stage]++;
+    *start = now;
+}
+
+static inline int horus_popcount64(uint64_t x) {
+#if defined(__GNUC__) || defined(__clang__)
+    return __builtin_popcountll(x);
+#else
+    x = x - ((x >> 1) & 0x5555555555555555ULL);
+    x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL);
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    return (int)((x * 0x0101010101010101ULL) >> 56);
+#endif
+}
+
+/* Slide the newly demodulated bits through the UW shift register, and track a UW wherever
+   the last uw_len bits are within uw_max_errors bits of it. Each position is only checked
+   once, as the bit that completes it arrives. */
+
 void horus_find_uw(struct horus *hstates) {
-    int i, j, corr;
-    int n = hstates->fsk->Nbits+(hstates->uw_len);
-    int rx_bits_mapped[n+hstates->uw_len];
-    
-    /* map rx_bits to +/-1 for UW search */
+    int i, errors = 0;
+    int Nbits = hstates->fsk->Nbits;
+    int first = hstates->rx_bits_len - Nbits;
+    uint64_t shift = hstates->uw_shift;
 
-    for(i=0; i<n; i++) {
-        rx_bits_mapped[i] = 2*hstates->rx_bits[hstates->rx_bits_len-n+i] - 1;
-    }
-    
-    /* look for UW  */
+    for(i=first; i<hstates->rx_bits_len; i++) {
+        shift = ((shift << 1) | hstates->rx_bits[i]) & hstates->uw_mask;
 
-    for(i=0; i<n-hstates->uw_len; i++) {
+        /* Hamming distance between the last uw_len bits and the UW */
 
-        /* calculate correlation between bit stream and UW */
-        
-        corr = 0;
-        for(j=0; j<hstates->uw_len; j++) {
-            corr += rx_bits_mapped[i+j]*hstates->uw[j];
-        }
-        
-        /* peak pick maximum */
-        
-        if (corr >= hstates->uw_thresh && hstates->uw_count < MAX_UW_TO_TRACK) {
-            int pos = hstates->rx_bits_len-n+i;
-            for (int h=0; h< hstates->uw_count;h++){
-                if (hstates->uw_loc[h] == pos){
-                    if (hstates->verbose) {
-                        fprintf(stderr, "uw: already in %d\n",  hstates->uw_loc[h]);
-                    }
-                    continue;
-                }
-            }
-            hstates->uw_loc[hstates->uw_count] = pos;
+        errors = horus_popcount64(shift ^ hstates->uw_bits);
+        if (errors <= hstates->uw_max_errors && hstates->uw_count < MAX_UW_TO_TRACK) {
+            hstates->uw_loc[hstates->uw_count] = i - hstates->uw_len + 1;
             
             if (hstates->verbose) {
                 fprintf(stderr, "uw: %d:%d\n", hstates->uw_count, hstates->uw_loc[hstates->uw_count]);
@@ -311,12 +360,11 @@ void horus_find_uw(struct horus *hstates) {
             hstates->uw_count++;
         }
     }
+    hstates->uw_shift = shift;
 
     if (hstates->verbose) {
-        fprintf(stderr, "  horus_find_uw: uw_count: %d corr: %d uw_thresh: %d n: %d\n",  hstates->uw_count, corr, hstates->uw_thresh, n);
+        fprintf(stderr, "  horus_find_uw: uw_count: %d errors: %d uw_max_errors: %d n: %d\n",  hstates->uw_count, errors, hstates->uw_max_errors, Nbits);
     }
-    
-
 }
 
 int hex2int(char ch) {
@@ -330,7 +378,7 @@ int hex2int(char ch) {
 }
 
 
-int extract_horus_rtty(struct horus *hstates, char ascii_out[], int uw_loc, int ascii_bits, int stop_bits) {
+int extract_horus_rtty(struct horus *hstates, char ascii_out[], int *nout_chars, int uw_loc, int ascii_bits, int stop_bits) {
     const int nfield = ascii_bits;                      /* 7 or 8 bit ASCII                    */
     const int npad   = stop_bits + 1;                   /* N stop bits + start bit between characters */
     int st = uw_loc;                                    /* first bit of first char        */
@@ -424,6 +472,7 @@ int extract_horus_rtty(struct horus *hstates, char ascii_out[], int uw_loc, int
     else {
         *ascii_out = 0;
     }
+    *nout_chars = strlen(ascii_out);
 
     if (hstates->verbose) {
         fprintf(stderr, "\n  endpacket: %d nout: %d tx_crc: 0x%04x rx_crc: 0x%04x\n",
@@ -442,7 +491,7 @@ int extract_horus_rtty(struct horus *hstates, char ascii_out[], int uw_loc, int
 }
 
 
-int extract_horus_binary_v1(struct horus *hstates, char hex_out[], int uw_loc) {
+int extract_horus_binary_v1(struct horus *hstates, uint8_t payload_out[], int *payload_len, int uw_loc) {
     const int nfield = 8;                      /* 8 bit binary                   */
     int st = uw_loc;                           /* first bit of first char        */
     int en = uw_loc + HORUS_BINARY_V1_NUM_CODED_BITS; /* last bit of max length packet  */
@@ -488,8 +537,9 @@ int extract_horus_binary_v1(struct horus *hstates, char hex_out[], int uw_loc) {
         fprintf(stderr, "\n");
     }
     
-    uint8_t payload_bytes[HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES];
+    uint8_t *payload_bytes = payload_out;
     horus_l2_decode_rx_packet(payload_bytes, rxpacket, HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES);
+    *payload_len = HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES;
 
     uint16_t crc_tx, crc_rx;
     crc_rx = horus_l2_gen_crc16(payload_bytes, HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES-2);
@@ -500,17 +550,12 @@ int extract_horus_binary_v1(struct horus *hstates, char hex_out[], int uw_loc) {
         fprintf(stderr, "  extract_horus_binary crc_tx: %04X crc_rx: %04X\n", crc_tx, crc_rx);
     }
     
-    /* convert to ASCII string of hex characters */
-
-    hex_out[0] = 0;
-    char hex[3];
-    for (b=0; b<HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES; b++) {
-        sprintf(hex, "%02X", payload_bytes[b]);
-        strcat(hex_out, hex);
-    }
-   
     if (hstates->verbose) {
-        fprintf(stderr, "  nout: %d Decoded Payload bytes:\n  %s \n", nout, hex_out);
+        fprintf(stderr, "  nout: %d Decoded Payload bytes:\n  ", nout);
+        for (b=0; b<HORUS_BINARY_V1_NUM_UNCODED_PAYLOAD_BYTES; b++) {
+            fprintf(stderr, "%02X", payload_bytes[b]);
+        }
+        fprintf(stderr, " \n");
     }
 
     /* With noise input to FSK demod we can get occasinal UW matches,
@@ -524,7 +569,7 @@ int extract_horus_binary_v1(struct horus *hstates, char hex_out[], int uw_loc) {
     return hstates->crc_ok;
 }
 
-int extract_horus_binary_v2_256(struct horus *hstates, char hex_out[], int uw_loc, int size) {
+int extract_horus_binary_v2_256(struct horus *hstates, uint8_t payload_out[], int *payload_len, int uw_loc, int size) {
     const int nfield = 8;                      /* 8 bit binary                   */
     int st = uw_loc;                           /* first bit of first char        */
     int en = uw_loc + (horus_l2_get_num_tx_data_bytes(size)*8); /* last bit of max length packet  */
@@ -570,8 +615,9 @@ int extract_horus_binary_v2_256(struct horus *hstates, char hex_out[], int uw_lo
         fprintf(stderr, "\n");
     }
     
-    uint8_t payload_bytes[size];
+    uint8_t *payload_bytes = payload_out;
     horus_l2_decode_rx_packet(payload_bytes, rxpacket, size);
+    *payload_len = size;
 
     uint16_t crc_tx, crc_rx;
 
@@ -607,17 +653,12 @@ int extract_horus_binary_v2_256(struct horus *hstates, char hex_out[], int uw_lo
         fprintf(stderr, "  extract_horus_binary_v2_256 crc_tx: %04X crc_rx: %04X\n", crc_tx, crc_rx);
     }
     
-    /* convert to ASCII string of hex characters */
-
-    hex_out[0] = 0;
-    char hex[3];
-    for (b=0; b<size; b++) {
-        sprintf(hex, "%02X", payload_bytes[b]);
-        strcat(hex_out, hex);
-    }
-   
     if (hstates->verbose) {
-        fprintf(stderr, "  nout: %d Decoded Payload bytes:\n  %s\n", nout, hex_out);
+        fprintf(stderr, "  nout: %d Decoded Payload bytes:\n  ", nout);
+        for (b=0; b<size; b++) {
+            fprintf(stderr, "%02X", payload_bytes[b]);
+        }
+        fprintf(stderr, "\n");
     }
 
     /* With noise input to FSK demod we can get occasinal UW matches,
@@ -630,14 +671,14 @@ int extract_horus_binary_v2_256(struct horus *hstates, char hex_out[], int uw_lo
     return hstates->crc_ok;
 }
 
-int horus_rx(struct horus *hstates, char ascii_out[], short demod_in[], int quadrature) {
-    int i, j, packet_detected;
-    
-    assert(hstates != NULL);
-    packet_detected = 0;
+/* Demodulate one block of samples into rx_bits[], and update the list of tracked unique words.
+   Returns the index of the first sample of the block, counted from horus_open(). */
 
+static uint64_t horus_demod_block(struct horus *hstates, short demod_in[], int quadrature, uint64_t *stage_start) {
+    int i, j;
     int Nbits = hstates->fsk->Nbits;
     int rx_bits_len = hstates->rx_bits_len;
+    uint64_t block_start = hstates->sample_count;
     
     if (hstates->verbose) {
         fprintf(stderr, "  horus_rx max_packet_len: %d rx_bits_len: %d Nbits: %d nin: %d\n",
@@ -658,10 +699,8 @@ int horus_rx(struct horus *hstates, char ascii_out[], short demod_in[], int quad
             
     /* demodulate latest bits */
 
-    /* Note: allocating this array as an automatic variable caused OSX to
-    "Bus Error 10" (segfault), so lets malloc() it. */
-    
-    COMP *demod_in_comp = (COMP*)malloc(sizeof(COMP)*hstates->fsk->nin);
+    COMP *demod_in_comp = hstates->demod_in_comp;
+    assert(hstates->fsk->nin <= hstates->max_nin);
     
     for (i=0; i<hstates->fsk->nin; i++) {
         if (quadrature) {
@@ -672,12 +711,18 @@ int horus_rx(struct horus *hstates, char ascii_out[], short demod_in[], int quad
             demod_in_comp[i].imag = 0;
         }
     }
+    hstates->sample_count += hstates->fsk->nin;
+
 
 
 
+    /* fsk_demod_core(), in two halves so they can be timed separately */
 
-    fsk_demod_core(hstates->fsk, &hstates->rx_bits[rx_bits_len-Nbits], &hstates->soft_bits[rx_bits_len-Nbits], demod_in_comp);
-    free(demod_in_comp);
+    fsk_demod_freq_est(hstates->fsk, demod_in_comp, hstates->fsk->f_est, hstates->fsk->mode);
+    if (hstates->timing_enabled) {
+        horus_timing_add(hstates, HORUS_TIMING_FREQ_EST, stage_start);
+    }
+    fsk_demod_bits(hstates->fsk, &hstates->rx_bits[rx_bits_len-Nbits], &hstates->soft_bits[rx_bits_len-Nbits], demod_in_comp);
     if (hstates->uw_count ) {
         int old_uw_count = hstates->uw_count;
         hstates->uw_count = 0;
@@ -696,108 +741,272 @@ int horus_rx(struct horus *hstates, char ascii_out[], short demod_in[], int quad
         }
     }    
 
+    if (hstates->timing_enabled) {
+        horus_timing_add(hstates, HORUS_TIMING_DEMOD, stage_start);
+    }
+
     horus_find_uw(hstates);
 
-        /* UW search to see if we can find the start of a packet in the buffer */
-    for (int uw_idx=0; uw_idx < hstates->uw_count; uw_idx++){       
-        if (hstates->verbose) {
-            fprintf(stderr, "[%d]  horus_rx uw_loc: %d mode: %d\n", uw_idx, hstates->uw_loc[uw_idx], hstates->mode);
-        }
-        
-        /* OK we have found a unique word, and therefore the start of
-        a packet, so lets try to extract valid packets */
+    if (hstates->timing_enabled) {
+        horus_timing_add(hstates, HORUS_TIMING_FIND_UW, stage_start);
+    }
+
+    return block_start;
+}
+
+/* Sample index (from horus_open()) of bit uw_loc of rx_bits[], just after demodulating the
+   block starting at block_start. Only as accurate as the modem's symbol timing. */
+
+static uint64_t horus_bit_to_sample(struct horus *hstates, int uw_loc, uint64_t block_start) {
+    int     bits_per_symbol = (hstates->mFSK == 4) ? 2 : 1;
+    int64_t bits_back = (int64_t)(hstates->rx_bits_len - hstates->fsk->Nbits) - uw_loc;
+    int64_t samples_back = bits_back * hstates->fsk->Ts / bits_per_symbol;
+
+    if (samples_back > (int64_t)block_start) {
+        return 0;
+    }
+    return block_start - samples_back;
+}
+
+/* Try to extract a packet starting at tracked unique word uw_idx. Returns 1 if one passed its
+   checksum, in which case the unique word (and, for RTTY, any others it overlaps) stops being
+   tracked. *payload_len is only written if a packet could be decoded at all. */
+
+static int horus_extract_uw(struct horus *hstates, int uw_idx, uint8_t payload_out[], int *payload_len) {
+    int packet_detected = 0;
+
+    if (hstates->verbose) {
+        fprintf(stderr, "[%d]  horus_rx uw_loc: %d mode: %d\n", uw_idx, hstates->uw_loc[uw_idx], hstates->mode);
+    }
+    
+    /* OK we have found a unique word, and therefore the start of
+    a packet, so lets try to extract valid packets */
+    if (hstates->mode == HORUS_MODE_RTTY_7N1 || hstates->mode == HORUS_MODE_RTTY_7N2 || hstates->mode == HORUS_MODE_RTTY_8N2) {
         if (hstates->mode == HORUS_MODE_RTTY_7N1) {
-            packet_detected = extract_horus_rtty(hstates, ascii_out, hstates->uw_loc[uw_idx], 7, 1 );
-
-            if (packet_detected){
-                // If we have found a packet clear any possible UW detections nearby
-                for (int uw_idx_clear=0; uw_idx_clear < hstates->uw_count; uw_idx_clear++){ 
-                    if (hstates->uw_loc[uw_idx_clear]  - hstates->uw_loc[uw_idx] < 100) {
-                        hstates->uw_loc[uw_idx_clear] = -1;
-                    }
-                }
-                if (hstates->verbose) {
-                    fprintf(stderr, "RTTY Detected \n");
-                }
-                break;
-            }
+            packet_detected = extract_horus_rtty(hstates, (char *)payload_out, payload_len, hstates->uw_loc[uw_idx], 7, 1 );
         }
-
         if (hstates->mode == HORUS_MODE_RTTY_7N2) {
-            packet_detected = extract_horus_rtty(hstates, ascii_out, hstates->uw_loc[uw_idx], 7, 2);
-
-            if (packet_detected){
-                // If we have found a packet clear any possible UW detections nearby
-                for (int uw_idx_clear=0; uw_idx_clear < hstates->uw_count; uw_idx_clear++){ 
-                    if (hstates->uw_loc[uw_idx_clear]  - hstates->uw_loc[uw_idx] < 100) {
-                        hstates->uw_loc[uw_idx_clear] = -1;
-                    }
-                }
-                if (hstates->verbose) {
-                    fprintf(stderr, "RTTY Detected \n");
-                }
-                 break;
-            }
+            packet_detected = extract_horus_rtty(hstates, (char *)payload_out, payload_len, hstates->uw_loc[uw_idx], 7, 2);
         }
         if (hstates->mode == HORUS_MODE_RTTY_8N2) {
-            packet_detected = extract_horus_rtty(hstates, ascii_out,hstates->uw_loc[uw_idx], 8, 2);
-
-            if (packet_detected){
-                // If we have found a packet clear any possible UW detections nearby
-                for (int uw_idx_clear=0; uw_idx_clear < hstates->uw_count; uw_idx_clear++){ 
-                    if (hstates->uw_loc[uw_idx_clear]  - hstates->uw_loc[uw_idx] < 100) {
-                        hstates->uw_loc[uw_idx_clear] = -1;
-                    }
-                }
-                if (hstates->verbose) {
-                    fprintf(stderr, "RTTY Detected \n");
+            packet_detected = extract_horus_rtty(hstates, (char *)payload_out, payload_len, hstates->uw_loc[uw_idx], 8, 2);
+        }
+
+        if (packet_detected){
+            // If we have found a packet clear any possible UW detections nearby
+            int uw_loc = hstates->uw_loc[uw_idx];
+            for (int uw_idx_clear=0; uw_idx_clear < hstates->uw_count; uw_idx_clear++){ 
+                if (hstates->uw_loc[uw_idx_clear] - uw_loc < 100) {
+                    hstates->uw_loc[uw_idx_clear] = -1;
                 }
-                 break;
+            }
+            if (hstates->verbose) {
+                fprintf(stderr, "RTTY Detected \n");
             }
         }
-        if (hstates->mode == HORUS_MODE_BINARY_V1) {
-            // TODO - we can optimise only checking packet sizes that are would come valid. eg, a 16byte packet isn't going to magically become valid after 64 bytes
-            packet_detected = extract_horus_binary_v1(hstates, ascii_out, hstates->uw_loc[uw_idx]);
-            if (!packet_detected){
-                // Try v2 256 bit decoder instead
+    }
+    if (hstates->mode == HORUS_MODE_BINARY_V1) {
+        // TODO - we can optimise only checking packet sizes that are would come valid. eg, a 16byte packet isn't going to magically become valid after 64 bytes
+        packet_detected = extract_horus_binary_v1(hstates, payload_out, payload_len, hstates->uw_loc[uw_idx]);
+        if (!packet_detected){
+            // Try v2 256 bit decoder instead
+            if (hstates->verbose) {
+                fprintf(stderr, "Trying all horus sizes \n");
+            }
+            for (int size_idx=0; size_idx<(int)(sizeof(horus_v3_check_sizes)/sizeof(horus_v3_check_sizes[0])); size_idx++){
                 if (hstates->verbose) {
-                    fprintf(stderr, "Trying all horus sizes \n");
+                    fprintf(stderr, "Size: %d \n", horus_v3_check_sizes[size_idx]);
                 }
-                for (int size_idx=0; size_idx<(int)(sizeof(horus_v3_check_sizes)/sizeof(horus_v3_check_sizes[0])); size_idx++){
-                    if (hstates->verbose) {
-                        fprintf(stderr, "Size: %d \n", horus_v3_check_sizes[size_idx]);
-                    }
-                    packet_detected = extract_horus_binary_v2_256(hstates, ascii_out, hstates->uw_loc[uw_idx], horus_v3_check_sizes[size_idx]);
-                    if (packet_detected){
-                        break;
-                    }
+                packet_detected = extract_horus_binary_v2_256(hstates, payload_out, payload_len, hstates->uw_loc[uw_idx], horus_v3_check_sizes[size_idx]);
+                if (packet_detected){
+                    break;
                 }
             }
-            //#define DUMP_BINARY_PACKET
-            #ifdef DUMP_BINARY_PACKET
-            FILE *f = fopen("packetbits.txt", "wt"); assert(f != NULL);
-            for(i=0; i<hstates->max_packet_len; i++) {
-                fprintf(f,"%d ", hstates->rx_bits[hstates->uw_loc+i]);
-            }
-            fclose(f);
-            exit(0);
-            #endif
         }
+        //#define DUMP_BINARY_PACKET
+        #ifdef DUMP_BINARY_PACKET
+        FILE *f = fopen("packetbits.txt", "wt"); assert(f != NULL);
+        for(int i=0; i<hstates->max_packet_len; i++) {
+            fprintf(f,"%d ", hstates->rx_bits[hstates->uw_loc[uw_idx]+i]);
+        }
+        fclose(f);
+        exit(0);
+        #endif
 
         if (packet_detected){
             if (hstates->verbose) {
                 fprintf(stderr, "Removed uw index %d@%d - late\n", uw_idx, hstates->uw_loc[uw_idx]);
             }
             hstates->uw_loc[uw_idx] = -1; // remove this UW from further searches.
-
-            return packet_detected;
         }
+    }
+
+    return packet_detected;
+}
 
+int horus_rx_bytes(struct horus *hstates, uint8_t payload_out[], int *payload_len, short demod_in[], int quadrature) {
+    int packet_detected;
+    uint64_t rx_start = 0, stage_start = 0;
     
+    assert(hstates != NULL);
+    packet_detected = 0;
+    *payload_len = 0;
+
+    if (hstates->timing_enabled) {
+        rx_start = stage_start = horus_timing_now();
+    }
+
+    horus_demod_block(hstates, demod_in, quadrature, &stage_start);
+
+    int extract = hstates->uw_count > 0;
+
+    /* UW search to see if we can find the start of a packet in the buffer, stopping at the first one */
+    for (int uw_idx=0; uw_idx < hstates->uw_count && !packet_detected; uw_idx++){       
+        if (hstates->uw_loc[uw_idx] >= 0) {
+            packet_detected = horus_extract_uw(hstates, uw_idx, payload_out, payload_len);
+        }
+    }
+
+    if (hstates->timing_enabled) {
+        if (extract) {
+            horus_timing_add(hstates, HORUS_TIMING_EXTRACT, &stage_start);
+        }
+        horus_timing_add(hstates, HORUS_TIMING_RX, &rx_start);
     }
     return packet_detected;
 }
 
+int horus_rx(struct horus *hstates, char ascii_out[], short demod_in[], int quadrature) {
+    static const char hex_digits[] = "0123456789ABCDEF";
+    uint8_t payload[HORUS_MAX_PAYLOAD_LEN];
+    int     payload_len, packet_detected, b;
+
+    packet_detected = horus_rx_bytes(hstates, payload, &payload_len, demod_in, quadrature);
+
+    if (hstates->mode == HORUS_MODE_RTTY_7N1 || hstates->mode == HORUS_MODE_RTTY_7N2 || hstates->mode == HORUS_MODE_RTTY_8N2) {
+        memcpy(ascii_out, payload, payload_len);
+        ascii_out[payload_len] = 0;
+    } else {
+        /* convert to ASCII string of hex characters */
+        for (b=0; b<payload_len; b++) {
+            ascii_out[2*b]   = hex_digits[payload[b] >> 4];
+            ascii_out[2*b+1] = hex_digits[payload[b] & 0xF];
+        }
+        ascii_out[2*payload_len] = 0;
+    }
+
+    return packet_detected;
+}
+
+static void horus_get_packet_stats(struct horus *hstates, struct horus_packet *packet) {
+    int i;
+
+    /* SNR scaled from Eb/No est returned by FSK to SNR in 3000 Hz, as per horus_get_modem_extended_stats() */
+
+    packet->snr_est = hstates->fsk->stats->snr_est + 10*log10((float)hstates->Rs*log2(hstates->mFSK)/3000);
+    packet->clock_offset = hstates->fsk->stats->clock_offset;
+
+    for (i=0; i<MODEM_STATS_MAX_F_EST; i++) {
+        if (i >= hstates->mFSK) {
+            packet->f_est[i] = 0;
+        } else if (hstates->fsk->freq_est_type) {
+            packet->f_est[i] = hstates->fsk->f2_est[i];
+        } else {
+            packet->f_est[i] = hstates->fsk->f_est[i];
+        }
+    }
+}
+
+int horus_rx_packets(struct horus *hstates, struct horus_packet packets[], int max_packets, short demod_in[], int quadrature) {
+    int      npackets = 0;
+    int      failed_len = 0;
+    uint64_t failed_sample = 0;
+    uint64_t rx_start = 0, stage_start = 0;
+    uint64_t block_start;
+
+    assert(hstates != NULL);
+    assert(max_packets > 0);
+
+    if (hstates->timing_enabled) {
+        rx_start = stage_start = horus_timing_now();
+    }
+
+    block_start = horus_demod_block(hstates, demod_in, quadrature, &stage_start);
+
+    int extract = hstates->uw_count > 0;
+
+    /* Try every tracked UW. Failed attempts are decoded into the next free packet, and
+       overwritten by whatever is tried next. */
+    for (int uw_idx=0; uw_idx < hstates->uw_count && npackets < max_packets; uw_idx++){
+        struct horus_packet *packet = &packets[npackets];
+        int uw_loc = hstates->uw_loc[uw_idx];
+        int len = 0;
+
+        if (uw_loc < 0) {
+            continue;
+        }
+
+        if (horus_extract_uw(hstates, uw_idx, packet->payload, &len)) {
+            packet->payload_len = len;
+            packet->crc_ok = 1;
+            packet->uw_sample = horus_bit_to_sample(hstates, uw_loc, block_start);
+            horus_get_packet_stats(hstates, packet);
+            npackets++;
+        } else if (len) {
+            failed_len = len;
+            failed_sample = horus_bit_to_sample(hstates, uw_loc, block_start);
+        }
+    }
+
+    /* As horus_rx(), report the last failed attempt if nothing passed its checksum */
+    if (npackets == 0 && failed_len) {
+        packets[0].payload_len = failed_len;
+        packets[0].crc_ok = 0;
+        packets[0].uw_sample = failed_sample;
+        horus_get_packet_stats(hstates, &packets[0]);
+        npackets = 1;
+    }
+
+    if (hstates->timing_enabled) {
+        if (extract) {
+            horus_timing_add(hstates, HORUS_TIMING_EXTRACT, &stage_start);
+        }
+        horus_timing_add(hstates, HORUS_TIMING_RX, &rx_start);
+    }
+    return npackets;
+}
+
+int horus_rx_batch(struct horus *hstates, struct horus_packet packets[], int max_packets,
+                   short demod_in[], uint32_t nsamples, int quadrature, uint32_t *nconsumed,
+                   uint32_t *nblocks) {
+    int      npackets = 0;
+    uint32_t blocks = 0;
+    int      hsize = quadrature ? 2 : 1;
+    uint32_t offset = 0;
+    uint32_t nin;
+    int      i, n;
+
+    assert(hstates != NULL);
+
+    while ((npackets < max_packets) && (offset + (nin = horus_nin(hstates)) <= nsamples)) {
+        n = horus_rx_packets(hstates, &packets[npackets], max_packets - npackets, &demod_in[offset*hsize], quadrature);
+
+        for (i=0; i<n; i++) {
+            packets[npackets + i].sample_offset = offset;
+        }
+        npackets += n;
+
+        offset += nin;
+        blocks++;
+    }
+
+    *nconsumed = offset;
+    if (nblocks != NULL) {
+        *nblocks = blocks;
+    }
+    return npackets;
+}
+
 int horus_get_version(void) {
     return HORUS_API_VERSION;
 }
@@ -817,11 +1026,24 @@ int horus_get_mFSK(struct horus *hstates) {
     return hstates->mFSK;
 }
 
+int horus_get_max_packet_len(struct horus *hstates) {
+    assert(hstates != NULL);
+    return hstates->max_packet_len;
+}
+
 int horus_get_max_demod_in(struct horus *hstates) {
     /* copied from fsk_demod.c, a nicer fsk_max_nin function would be useful */
     return sizeof(short)*(hstates->fsk->N + hstates->fsk->Ts*2);
 }
 
+int horus_get_max_payload_len(struct horus *hstates) {
+    assert(hstates != NULL);
+    if (hstates->mode == HORUS_MODE_BINARY_V2_128BIT) {
+        return HORUS_BINARY_V2_128BIT_NUM_UNCODED_PAYLOAD_BYTES;
+    }
+    return HORUS_MAX_PAYLOAD_LEN;
+}
+
 int horus_get_max_ascii_out_len(struct horus *hstates) {
     assert(hstates != NULL);
     if (hstates->mode == HORUS_MODE_RTTY_7N1) {
@@ -884,6 +1106,67 @@ void horus_get_modem_extended_stats (struct horus *hstates, struct MODEM_STATS *
     }
 }
 
+void horus_get_stats(struct horus *hstates, struct horus_stats *stats) {
+    struct FSK *fsk;
+    int i;
+
+    assert(hstates != NULL);
+    fsk = hstates->fsk;
+
+    /* SNR scaled from Eb/No est returned by FSK to SNR in 3000 Hz, as per horus_get_modem_extended_stats() */
+
+    stats->snr_est = fsk->stats->snr_est + 10*log10((float)hstates->Rs*log2(hstates->mFSK)/3000);
+    stats->clock_offset = fsk->stats->clock_offset;
+    stats->foff = fsk->stats->foff;
+    stats->rx_timing = fsk->stats->rx_timing;
+
+    stats->mfsk = hstates->mFSK;
+    for (i=0; i<MODEM_STATS_MAX_F_EST; i++) {
+        if (i >= hstates->mFSK) {
+            stats->f_est[i] = 0;
+        } else if (fsk->freq_est_type) {
+            stats->f_est[i] = fsk->f2_est[i];
+        } else {
+            stats->f_est[i] = fsk->f_est[i];
+        }
+    }
+
+    stats->neyetr = fsk->stats->neyetr;
+    stats->neyesamp = fsk->stats->neyesamp;
+    stats->nfft = fsk->Ndft;
+}
+
+void horus_get_eye(struct horus *hstates, float eye[]) {
+    struct MODEM_STATS *fsk_stats;
+    int i;
+
+    assert(hstates != NULL);
+    fsk_stats = hstates->fsk->stats;
+
+    for (i=0; i<fsk_stats->neyetr; i++) {
+        memcpy(&eye[i*fsk_stats->neyesamp], fsk_stats->rx_eye[i], sizeof(float)*fsk_stats->neyesamp);
+    }
+}
+
+void horus_get_fft(struct horus *hstates, float fft[]) {
+    assert(hstates != NULL);
+    memcpy(fft, hstates->fsk->Sf, sizeof(float)*hstates->fsk->Ndft);
+}
+
+void horus_set_timing(struct horus *hstates, int enable) {
+    assert(hstates != NULL);
+    hstates->timing_enabled = enable;
+    memset(&hstates->timing, 0, sizeof(hstates->timing));
+}
+
+void horus_get_timing(struct horus *hstates, struct horus_timing *timing, int reset) {
+    assert(hstates != NULL);
+    memcpy(timing, &hstates->timing, sizeof(hstates->timing));
+    if (reset) {
+        memset(&hstates->timing, 0, sizeof(hstates->timing));
+    }
+}
+
 void horus_set_verbose(struct horus *hstates, int verbose) {
     assert(hstates != NULL);
     hstates->verbose = verbose;
@@ -93,10 +93,24 @@
 
 
 #define MAX_UW_LENGTH                  100
-#define HORUS_API_VERSION                3    /* unique number that is bumped if API changes */
+#define HORUS_API_VERSION                4    /* unique number that is bumped if API changes */
 
 #define MAX_UW_TO_TRACK 32
 
+/* Stages of horus_rx() timed by horus_set_timing() / horus_get_timing() */
+
+#define HORUS_TIMING_FREQ_EST           0  // fsk_demod_freq_est() - tone frequency estimation
+#define HORUS_TIMING_DEMOD              1  // rest of the FSK demod - filtering, timing recovery, bit decisions
+#define HORUS_TIMING_FIND_UW            2  // horus_find_uw() - unique word search
+#define HORUS_TIMING_EXTRACT            3  // packet extraction - Golay decode and v2/v3 size sweep, or RTTY decode
+#define HORUS_TIMING_RX                 4  // the whole of horus_rx()
+#define HORUS_TIMING_STAGES             5
+
+struct horus_timing {
+    uint64_t    ns[HORUS_TIMING_STAGES];              /* total time spent in each stage (ns) */
+    uint64_t    calls[HORUS_TIMING_STAGES];           /* number of times each stage ran      */
+};
+
 struct horus {
     int         mode;
     int         verbose;
@@ -107,18 +121,65 @@ struct horus {
     int         uw[MAX_UW_LENGTH];                    /* unique word bits mapped to +/-1     */
     int         uw_thresh;                            /* threshold for UW detection          */
     int         uw_len;                               /* length of unique word               */
+    uint64_t    uw_bits;                              /* unique word packed into bits, first bit most significant */
+    uint64_t    uw_mask;                              /* low uw_len bits set                 */
+    int         uw_max_errors;                        /* bit errors allowed in a UW, from uw_thresh */
+    uint64_t    uw_shift;                             /* last uw_len received bits, newest least significant */
     int         max_packet_len;                       /* max length of a telemetry packet    */
     uint8_t    *rx_bits;                              /* buffer of received bits             */
     float      *soft_bits;                            /* buffer of soft decision outputs     */
     int         rx_bits_len;                          /* length of rx_bits buffer            */
+    COMP       *demod_in_comp;                        /* demod input converted to complex, max nin samples */
+    int         max_nin;                              /* size of demod_in_comp[]             */
     int         crc_ok;                               /* most recent packet checksum results */
     int         total_payload_bits;                   /* num bits rx-ed in last RTTY packet  */
     int         uw_loc[MAX_UW_TO_TRACK];              /* current location of uw */
     int         uw_count;
     int         version;                              /* The version of the last decoded frame (if horus) */
+    uint64_t    sample_count;                         /* samples demodulated since horus_open() */
+    int         timing_enabled;                       /* accumulate per-stage timing         */
+    struct horus_timing timing;                       /* per-stage timing, see horus_get_timing() */
 };
 struct MODEM_STATS;
 
+/* largest ascii_out[] needed by any mode, see horus_get_max_ascii_out_len() */
+
+#define HORUS_MAX_ASCII_OUT_LEN        (HORUS_BINARY_V1V2_MAX_UNCODED_BYTES*2+1)
+
+/* largest payload_out[] needed by any mode, see horus_get_max_payload_len(). RTTY
+   sentences (at most HORUS_RTTY_MAX_CHARS, plus a terminator) also fit. */
+
+#define HORUS_MAX_PAYLOAD_LEN          HORUS_BINARY_V1V2_MAX_UNCODED_BYTES
+
+/* A packet found by horus_rx_packets() or horus_rx_batch() */
+
+struct horus_packet {
+    uint32_t    sample_offset;                        /* start of the nin block (in samples from start of demod_in[]) the packet was completed in */
+    uint64_t    uw_sample;                            /* start of the packet's unique word (in samples since horus_open()) */
+    int         crc_ok;                               /* packet checksum results             */
+    float       snr_est;                              /* SNR estimate when packet was found  */
+    float       clock_offset;                         /* tx/rx sample clock offset (ppm)     */
+    float       f_est[MODEM_STATS_MAX_F_EST];         /* tone frequency estimates (Hz)       */
+    int         payload_len;                          /* bytes in payload[]                  */
+    uint8_t     payload[HORUS_MAX_PAYLOAD_LEN];       /* packet / text, as for horus_rx_bytes() */
+};
+
+/* Scalar modem statistics, see horus_get_stats(). The eye diagram and spectrum
+   are fetched separately with horus_get_eye() and horus_get_fft(), so callers
+   only pay for copying them when they are actually used. */
+
+struct horus_stats {
+    float       snr_est;                              /* SNR estimate in 3000 Hz (dB)        */
+    float       clock_offset;                         /* tx/rx sample clock offset (ppm)     */
+    float       foff;                                 /* estimated freq offset (Hz)          */
+    float       rx_timing;                            /* estimated timing offset (samples)   */
+    int         mfsk;                                 /* number of valid f_est entries       */
+    float       f_est[MODEM_STATS_MAX_F_EST];         /* tone frequency estimates (Hz)       */
+    int         neyetr;                               /* eye diagram traces                  */
+    int         neyesamp;                             /* samples per eye diagram trace       */
+    int         nfft;                                 /* bins in the horus_get_fft() spectrum */
+};
+
 /*
  * Create an Horus Demod config/state struct using default mode parameters.
  * 
@@ -165,13 +226,61 @@ uint32_t      horus_nin   (struct horus *hstates);
  * Returns 1 if the data in ascii_out[] is valid.
  * 
  * struct horus *hstates - Horus API config/state struct, set up by horus_open / horus_open_advanced
- * char ascii_out[] - Buffer for returned packet / text.
+ * char ascii_out[] - Buffer for returned packet (as hex) / text. An empty string if nothing was found.
  * short fsk_in[] - nin samples of modulated FSK.
  * int quadrature - Set to 1 if input samples are complex samples.
  */
       
 int           horus_rx    (struct horus *hstates, char ascii_out[], short demod_in[], int quadrature);
 
+/*
+ * As horus_rx(), but returns binary packets as raw bytes rather than hex, and
+ * RTTY text without a terminator.
+ *
+ * Returns 1 if the data in payload_out[] is valid (passed its CRC).
+ *
+ * uint8_t payload_out[] - Buffer for returned packet / text, horus_get_max_payload_len() bytes.
+ * int *payload_len - Returns the number of bytes in payload_out[], 0 if nothing was found.
+ */
+
+int           horus_rx_bytes (struct horus *hstates, uint8_t payload_out[], int *payload_len, short demod_in[], int quadrature);
+
+/*
+ * As horus_rx_bytes(), but returns every packet completed in this block rather than
+ * just the first, along with where each one started (its uw_sample).
+ *
+ * Returns the number of packets written to packets[]: each one that passed its CRC,
+ * or if none did, the last failed attempt (as horus_rx() would return), if any. If
+ * there are more than max_packets, the rest are returned by the next call.
+ *
+ * struct horus_packet packets[] - Buffer for max_packets (at least 1) returned packets.
+ *                                 sample_offset is not set.
+ */
+
+int           horus_rx_packets (struct horus *hstates, struct horus_packet packets[], int max_packets, short demod_in[], int quadrature);
+
+/*
+ * Demodulate an arbitrary number of samples, calling horus_rx_packets() on as many
+ * horus_nin() sized blocks as are available.
+ *
+ * Returns the number of packets written to packets[]. Processing stops early if
+ * max_packets are found, so check *nconsumed and call again with the remaining
+ * samples. Samples after *nconsumed (less than horus_nin() of them, unless we
+ * stopped early) should be passed in again at the start of the next call.
+ *
+ * struct horus *hstates - Horus API config/state struct, set up by horus_open / horus_open_advanced
+ * struct horus_packet packets[] - Buffer for max_packets returned packets
+ * short demod_in[] - nsamples samples of modulated FSK (2*nsamples shorts if quadrature)
+ * uint32_t nsamples - Number of samples in demod_in[]
+ * int quadrature - Set to 1 if input samples are complex samples.
+ * uint32_t *nconsumed - Returns the number of samples that were demodulated
+ * uint32_t *nblocks - Returns the number of modem blocks (horus_nin() sized) demodulated, may be NULL
+ */
+
+int           horus_rx_batch (struct horus *hstates, struct horus_packet packets[], int max_packets,
+                              short demod_in[], uint32_t nsamples, int quadrature, uint32_t *nconsumed,
+                              uint32_t *nblocks);
+
 /* set verbose level */
       
 void horus_set_verbose(struct horus *hstates, int verbose);
@@ -182,17 +291,41 @@ int           horus_get_version              (void);
 int           horus_get_mode                 (struct horus *hstates);
 int           horus_get_Fs                   (struct horus *hstates);      
 int           horus_get_mFSK                 (struct horus *hstates);      
+int           horus_get_max_packet_len       (struct horus *hstates);      /* longest packet, in bits */
 void          horus_get_modem_stats          (struct horus *hstates, int *sync, float *snr_est);
 void          horus_get_modem_extended_stats (struct horus *hstates, struct MODEM_STATS *stats);
+void          horus_get_stats                (struct horus *hstates, struct horus_stats *stats);
+void          horus_get_eye                  (struct horus *hstates, float eye[]);
+void          horus_get_fft                  (struct horus *hstates, float fft[]);
 int           horus_crc_ok                   (struct horus *hstates);
 int           horus_get_total_payload_bits   (struct horus *hstates);
 void          horus_set_total_payload_bits   (struct horus *hstates, int val);
 void          horus_set_freq_est_limits      (struct horus *hstates, float fsk_lower, float fsk_upper);
 
-/* how much storage you need for demod_in[] and  ascii_out[] */
+/*
+ * horus_get_eye() copies the eye diagram into eye[], as neyetr traces of
+ * neyesamp samples each, and needs room for MODEM_STATS_ET_MAX*MODEM_STATS_EYE_IND_MAX
+ * floats. horus_get_fft() copies the modem's averaged magnitude spectrum into
+ * fft[], nfft bins from -Fs/2 to Fs/2. neyetr, neyesamp and nfft come from
+ * horus_get_stats().
+ */
+
+/* how much storage you need for demod_in[], ascii_out[] and payload_out[] */
       
 int           horus_get_max_demod_in         (struct horus *hstates);
 int           horus_get_max_ascii_out_len    (struct horus *hstates);
+int           horus_get_max_payload_len      (struct horus *hstates);
+
+/*
+ * Per-stage timing of horus_rx(), using a monotonic clock. Off by default, when
+ * the only cost is checking the flag. Enabling (or disabling) timing clears the
+ * counters. horus_get_timing() copies the counters accumulated so far into
+ * *timing, and clears them if reset is set. Stages are the HORUS_TIMING_* defines,
+ * and the extract stage only counts horus_rx() calls with a unique word to try.
+ */
+
+void          horus_set_timing               (struct horus *hstates, int enable);
+void          horus_get_timing               (struct horus *hstates, struct horus_timing *timing, int reset);
 
 #endif
 
@@ -0,0 +1,234 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: resampler.c
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Streaming rational (L/M) polyphase resampler.
+
+  Output sample n sits at input position n*M/L. Rather than zero stuffing
+  by L, filtering and then throwing away M-1 of every M samples, we pick the
+  branch (n*M)%L of the polyphase filter bank and run it over the K most
+  recent input samples, so only the outputs we keep are ever computed.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <assert.h>
+#include <limits.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "resampler.h"
+
+struct RESAMPLER *resampler_create(int L, int M, float taps[], int ntaps, int channels) {
+    struct RESAMPLER *r;
+    int p, k;
+
+    assert(L > 0);
+    assert(M > 0);
+    assert(channels > 0);
+    assert(ntaps > 0 && (ntaps % L) == 0);
+
+    r = (struct RESAMPLER*)malloc(sizeof(struct RESAMPLER)); assert(r != NULL);
+
+    r->L = L; r->M = M; r->K = ntaps/L; r->channels = channels;
+
+    /* Split the prototype filter into L branches. Each branch is stored
+       time reversed so it lines up with the oldest-first input buffer,
+       and scaled by L to make up for the energy lost to interpolation. */
+
+    r->bank = (float*)malloc(sizeof(float)*ntaps); assert(r->bank != NULL);
+    for(p=0; p<L; p++) {
+        for(k=0; k<r->K; k++) {
+            r->bank[p*r->K + (r->K-1-k)] = taps[p + k*L]*L;
+        }
+    }
+
+    r->buf = NULL;
+    r->buf_frames = 0;
+    r->scratch = NULL;
+    r->scratch_frames = 0;
+    resampler_reset(r);
+
+    return r;
+}
+
+void resampler_destroy(struct RESAMPLER *r) {
+    assert(r != NULL);
+    free(r->bank);
+    free(r->buf);
+    free(r->scratch);
+    free(r);
+}
+
+void resampler_reset(struct RESAMPLER *r) {
+    assert(r != NULL);
+    r->pos = 0;
+    if (r->buf != NULL) {
+        memset(r->buf, 0, sizeof(float)*(r->K-1)*r->channels);
+    }
+}
+
+int resampler_max_out(struct RESAMPLER *r, int nin) {
+    int64_t max_out;
+
+    assert(r != NULL);
+    /* 64 bit, as nin*L overflows a 32 bit long (e.g. on Windows) after a few minutes of audio */
+    max_out = ((int64_t)nin*r->L)/r->M + 1;
+    assert(max_out <= INT_MAX);
+    return (int)max_out;
+}
+
+/* make sure buf can hold the history plus nin new frames, only allocates when the block size grows */
+
+static float *resampler_reserve(struct RESAMPLER *r, int nin) {
+    int frames = r->K - 1 + nin;
+
+    if (frames > r->buf_frames) {
+        int first = (r->buf == NULL);
+        r->buf = (float*)realloc(r->buf, sizeof(float)*frames*r->channels); assert(r->buf != NULL);
+        if (first) {
+            memset(r->buf, 0, sizeof(float)*(r->K-1)*r->channels);
+        }
+        r->buf_frames = frames;
+    }
+
+    return &r->buf[(r->K-1)*r->channels];
+}
+
+/* float output buffer for resampler_process_s16(), only allocates when the block size grows */
+
+static float *resampler_scratch(struct RESAMPLER *r, int nin) {
+    int frames = resampler_max_out(r, nin);
+
+    if (frames > r->scratch_frames) {
+        r->scratch = (float*)realloc(r->scratch, sizeof(float)*frames*r->channels); assert(r->scratch != NULL);
+        r->scratch_frames = frames;
+    }
+
+    return r->scratch;
+}
+
+/* run the filter bank over the nin frames just loaded into buf, writing
+   float outputs to out[]. Real and IQ input get their own loops so the
+   compiler can keep the accumulators in registers. */
+
+static int resampler_run(struct RESAMPLER *r, int nin, float out[]) {
+    int   C = r->channels;
+    int   K = r->K;
+    int   L = r->L;
+    int   c, k, nout;
+    int64_t end = (int64_t)nin*L;
+    int64_t idx = r->pos / L;         /* newest input frame needed, relative to start of block */
+    int   phase = r->pos % L;         /* polyphase branch for the next output */
+    int   step_idx = r->M / L;
+    int   step_phase = r->M % L;
+
+    for(nout=0; idx*L + phase < end; nout++) {
+        const float *h = &r->bank[phase*K];
+        const float *x = &r->buf[idx*C];
+
+        if (C == 1) {
+            /* split the sum up so the multiplies aren't all waiting on one accumulator */
+            float acc[4] = {0.0, 0.0, 0.0, 0.0};
+            for(k=0; k+3<K; k+=4) {
+                acc[0] += h[k]*x[k];
+                acc[1] += h[k+1]*x[k+1];
+                acc[2] += h[k+2]*x[k+2];
+                acc[3] += h[k+3]*x[k+3];
+            }
+            for(; k<K; k++) {
+                acc[0] += h[k]*x[k];
+            }
+            out[nout] = (acc[0] + acc[1]) + (acc[2] + acc[3]);
+        } else if (C == 2) {
+            float acc_i = 0.0, acc_q = 0.0;
+            for(k=0; k<K; k++) {
+                acc_i += h[k]*x[2*k];
+                acc_q += h[k]*x[2*k + 1];
+            }
+            out[2*nout] = acc_i;
+            out[2*nout + 1] = acc_q;
+        } else {
+            for(c=0; c<C; c++) {
+                float acc = 0.0;
+                for(k=0; k<K; k++) {
+                    acc += h[k]*x[k*C + c];
+                }
+                out[nout*C + c] = acc;
+            }
+        }
+
+        /* step on by M/L input samples */
+
+        idx += step_idx;
+        phase += step_phase;
+        if (phase >= L) {
+            phase -= L;
+            idx++;
+        }
+    }
+
+    /* keep the last K-1 frames as history for the next block */
+
+    r->pos = idx*L + phase - end;
+    memmove(r->buf, &r->buf[nin*C], sizeof(float)*(K-1)*C);
+
+    return nout;
+}
+
+int resampler_process_s16(struct RESAMPLER *r, short out[], short in[], int nin) {
+    int i, nout;
+    float *x, v;
+
+    assert(r != NULL);
+    if (nin <= 0) {
+        return 0;
+    }
+    x = resampler_reserve(r, nin);
+    for(i=0; i<nin*r->channels; i++) {
+        x[i] = in[i];
+    }
+
+    /* filter into the scratch buffer, then round and clip to shorts */
+
+    nout = resampler_run(r, nin, resampler_scratch(r, nin));
+    for(i=0; i<nout*r->channels; i++) {
+        v = r->scratch[i];
+        if (v > 32767.0) v = 32767.0;
+        if (v < -32768.0) v = -32768.0;
+        out[i] = (short)(v >= 0 ? v + 0.5 : v - 0.5);
+    }
+
+    return nout;
+}
+
+int resampler_process_float(struct RESAMPLER *r, float out[], float in[], int nin) {
+    float *x;
+
+    assert(r != NULL);
+    if (nin <= 0) {
+        return 0;
+    }
+    x = resampler_reserve(r, nin);
+    memcpy(x, in, sizeof(float)*nin*r->channels);
+
+    return resampler_run(r, nin, out);
+}
@@ -0,0 +1,82 @@
+/*---------------------------------------------------------------------------*\
+
+  FILE........: resampler.h
+  AUTHOR......: Project Horus
+  DATE CREATED: October 2026
+
+  Streaming rational (L/M) polyphase resampler, used to bring input audio
+  to a sample rate the modem can run at.
+
+\*---------------------------------------------------------------------------*/
+
+/*
+  Copyright (C) 2026 Project Horus
+
+  All rights reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License version 2.1, as
+  published by the Free Software Foundation.  This program is
+  distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or
+  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+  License for more details.
+
+  You should have received a copy of the GNU Lesser General Public License
+  along with this program; if not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef __RESAMPLER__
+#define __RESAMPLER__
+
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+struct RESAMPLER {
+    int    L;               /* interpolation factor                               */
+    int    M;               /* decimation factor                                  */
+    int    K;               /* taps per polyphase branch                          */
+    int    channels;        /* interleaved channels, 2 for IQ                     */
+    float *bank;            /* L branches of K taps, time reversed and scaled by L */
+    int64_t pos;            /* next output position, in 1/L input samples         */
+    float *buf;             /* K-1 frames of history followed by the input block  */
+    int    buf_frames;      /* allocated size of buf in frames                    */
+    float *scratch;         /* float output for resampler_process_s16()           */
+    int    scratch_frames;  /* allocated size of scratch in frames                */
+};
+
+/*
+ * Create a resampler from a prototype low pass filter.
+ *
+ * int L - Interpolation factor
+ * int M - Decimation factor
+ * float taps[] - Prototype filter, designed at L times the input rate. ntaps must be a multiple of L.
+ * int ntaps - Number of taps in taps[]
+ * int channels - Number of interleaved channels (1 for real, 2 for IQ)
+ */
+struct RESAMPLER *resampler_create(int L, int M, float taps[], int ntaps, int channels);
+
+void resampler_destroy(struct RESAMPLER *r);
+
+/* Clear history so the next block is treated as the start of a new stream */
+void resampler_reset(struct RESAMPLER *r);
+
+/* Largest number of output frames the next call may produce for nin input frames. nin must be
+   small enough that this fits in an int, callers should pass long streams in blocks. */
+int  resampler_max_out(struct RESAMPLER *r, int nin);
+
+/*
+ * Resample nin frames of interleaved input. Returns the number of frames
+ * written to out[], which must have room for resampler_max_out(r, nin) frames.
+ */
+int  resampler_process_s16(struct RESAMPLER *r, short out[], short in[], int nin);
+int  resampler_process_float(struct RESAMPLER *r, float out[], float in[], int nin);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -8,7 +8,6 @@
 #   Released under GNU GPL v3 or later
 #
 #   Requirements:
-#       - csdr must be installed and available on the path. https://github.com/ha7ilm/csdr
 #       - The following utilities from codec2 need to be built:
 #           - fsk_get_test_bits, fsk_put_test_bits
 #           - fsk_mod, fsk_demod
@@ -234,8 +233,7 @@ def generate_packets(mode):
     # Generate the command we need to make:
 
     _cmd = f"{HORUS_UTILS}/horus_gen_test_bits {_mode_id} {TEST_LENGTH} | "\
-        f"{HORUS_UTILS}/fsk_mod {_order} {SAMPLE_RATE} {BAUD_RATE} {LOW_TONE} {TONE_SPACING} - - |"\
-        f"csdr convert_s16_f > {_filename}"
+        f"{HORUS_UTILS}/fsk_mod {_order} {SAMPLE_RATE} {BAUD_RATE} {LOW_TONE} {TONE_SPACING} - -"
 
     print(_cmd)
 
@@ -245,7 +243,8 @@ def generate_packets(mode):
     try:
         _start = time.time()
         _output = subprocess.check_output(_cmd, shell=True, stderr=None)
-        _output = _output.decode()
+        # Convert to float, as csdr convert_s16_f does
+        (np.frombuffer(_output, dtype=np.int16) / 32768.0).astype(np.float32).tofile(_filename)
     except:
         # traceback.print_exc()
         _output = "error"
@@ -282,8 +281,10 @@ def process_packets(
         _stats_file = None
 
 
-    _cmd = f"cat {filename} | csdr convert_f_s16 |"\
-        f"{HORUS_UTILS}/horus_demod {_mask}{_cpx}{_stats}--rate={BAUD_RATE} -c -m {mode} - - "\
+    # Convert to signed 16-bit, as csdr convert_f_s16 does
+    _samples = np.clip(np.fromfile(filename, dtype=np.float32) * 32767, -32768, 32767).astype(np.int16).tobytes()
+
+    _cmd = f"{HORUS_UTILS}/horus_demod {_mask}{_cpx}{_stats}--rate={BAUD_RATE} -c -m {mode} - - "\
   
 
     if stats:
@@ -298,7 +299,7 @@ def process_packets(
     # Run the command.
     try:
         _start = time.time()
-        _output = subprocess.check_output(_cmd, shell=True)
+        _output = subprocess.check_output(_cmd, shell=True, input=_samples)
         _output = _output.decode()
     except subprocess.CalledProcessError as e:
         _output = e.output.decode()
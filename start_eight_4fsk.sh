@@ -170,15 +170,18 @@ if [ "$STATS_OUTPUT" = "1" ]; then
 fi
 
 # Start the receive chain.
+# A single horus_demod process runs all eight modems over the one IQ stream, with each channel's
+# packets and stats going to its own uploader.
 # Note that we now pass in the SDR centre frequency ($RXFREQ) and 'target' signal frequency ($MFSK1_CENTRE)
 # to enable providing additional metadata to SondeHub
 rtl_fm -M raw -F9 -d $SDR_DEVICE -s 48000 -p $PPM $GAIN_SETTING$BIAS_SETTING -f $RXFREQ \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK1_LOWER --fsk_upper=$MFSK1_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK1_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK2_LOWER --fsk_upper=$MFSK2_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK2_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK3_LOWER --fsk_upper=$MFSK3_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK3_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK4_LOWER --fsk_upper=$MFSK4_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK4_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK5_LOWER --fsk_upper=$MFSK5_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK5_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK6_LOWER --fsk_upper=$MFSK6_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK6_CENTRE ) \
-  | tee >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK7_LOWER --fsk_upper=$MFSK7_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK7_CENTRE ) \
-  >($DECODER -q --stats -g -m binary --fsk_lower=$MFSK8_LOWER --fsk_upper=$MFSK8_UPPER - - | $UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK8_CENTRE ) > /dev/null
-
+  | $DECODER -q --stats -g -m binary \
+    --channel=$MFSK1_LOWER:$MFSK1_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK1_CENTRE ) \
+    --channel=$MFSK2_LOWER:$MFSK2_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK2_CENTRE ) \
+    --channel=$MFSK3_LOWER:$MFSK3_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK3_CENTRE ) \
+    --channel=$MFSK4_LOWER:$MFSK4_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK4_CENTRE ) \
+    --channel=$MFSK5_LOWER:$MFSK5_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK5_CENTRE ) \
+    --channel=$MFSK6_LOWER:$MFSK6_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK6_CENTRE ) \
+    --channel=$MFSK7_LOWER:$MFSK7_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK7_CENTRE ) \
+    --channel=$MFSK8_LOWER:$MFSK8_UPPER:>($UPLOADER --freq_hz $RXFREQ --freq_target_hz $MFSK8_CENTRE ) \
+    - /dev/null
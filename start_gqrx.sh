@@ -37,10 +37,5 @@ else
 fi
 
 
-if [[ $OSTYPE == darwin* ]]; then
-    # OSX's netcat utility uses a different, incompatible syntax. Sigh.
-    nc -l -u localhost 7355 | $DECODER -m $MODE --stats=5 -g --fsk_lower=100 --fsk_upper=20000 - - | python -m horusdemodlib.uploader $@
-else
-    # Start up!
-    nc -l -u -p 7355 localhost | $DECODER -m $MODE --stats=5 -g --fsk_lower=100 --fsk_upper=20000 - - | python -m horusdemodlib.uploader $@
-fi
+# Start up! horus_demod listens for GQRX's UDP audio directly.
+$DECODER -m $MODE --stats=5 -g --fsk_lower=100 --fsk_upper=20000 --udp-in localhost:7355 - | python -m horusdemodlib.uploader $@